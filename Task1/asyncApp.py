@@ -0,0 +1,179 @@
+"""
+ASGI application serving the same endpoints as the Flask blueprints in routes.py. The SQLite work of each request is
+offloaded to a bounded thread pool, so a single process keeps many requests in flight instead of blocking a worker for
+every database round trip.
+
+Run it with any ASGI server, e.g.
+    uvicorn asyncApp:app --workers 4
+"""
+import asyncio
+import functools
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from constants import Constants
+from controller import allByUser, allByUserBatch, allByUserPage, allByUserStream, netMerchant
+from payloads import parseAllByUserPayload, parseAllByUserBatchPayload, parseNetMerchantPayload
+
+# Threads running the blocking controller calls, each of them keeps its own pooled SQLite connection
+_executor = ThreadPoolExecutor(max_workers=Constants.asyncWorkerThreads.value, thread_name_prefix='asyncApp')
+
+_jsonHeaders = [(b'content-type', b'application/json')]
+_htmlHeaders = [(b'content-type', b'text/html; charset=utf-8')]
+
+
+async def runBlocking(func, *args):
+    """
+    Run a blocking call on the executor and wait for its result without blocking the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args))
+
+
+def _errorBody(message: str) -> bytes:
+    # Same body as flask.jsonify({"error": message})
+    return (json.dumps({"error": message}, separators=(',', ':')) + '\n').encode()
+
+
+async def _readJson(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body', False):
+            break
+    return json.loads(body)
+
+
+async def _sendResponse(send, status: int, body: bytes, headers: list):
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _sendStream(send, generator):
+    """
+    Send the pieces of a blocking generator as a chunked response. The generator runs in a single executor thread,
+    since its cursor belongs to that thread's pooled connection, and hands the pieces over through a bounded queue.
+
+    If the generator fails part way, the error is raised without ending the body, so the server aborts the response
+    and the client sees it cut off instead of a shorter but complete one.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=Constants.asyncStreamQueueChunks.value)
+    cancelled = threading.Event()
+    done = object()
+    drained = False
+
+    def produce():
+        try:
+            for piece in generator:
+                asyncio.run_coroutine_threadsafe(queue.put(piece), loop).result()
+                if cancelled.is_set():
+                    break
+        finally:
+            generator.close()
+            asyncio.run_coroutine_threadsafe(queue.put(done), loop).result()
+
+    producer = loop.run_in_executor(_executor, produce)
+
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': _jsonHeaders})
+        while (piece := await queue.get()) is not done:
+            await send({'type': 'http.response.body', 'body': piece.encode(), 'more_body': True})
+        drained = True
+        # raises what the generator raised, before the body is ended
+        await producer
+        await send({'type': 'http.response.body', 'body': b''})
+    except BaseException:
+        # Let the producer finish its current piece and stop, it always ends with the done marker
+        cancelled.set()
+        while not drained and await queue.get() is not done:
+            pass
+        raise
+    finally:
+        await producer
+
+
+async def _dispatch(path: str, data: dict):
+    """
+    Validate the payload and run the matching controller call.
+
+    Returns:
+        The JSON string to send, or a generator of JSON pieces for streamed responses.
+    """
+    if path == '/allByUser':
+        payload = parseAllByUserPayload(data)
+        user_id, start, end = payload['user_id'], payload['start'], payload['end']
+        if payload['mode'] == 'stream':
+            return allByUserStream(user_id, start, end)
+        if payload['mode'] == 'page':
+            return await runBlocking(allByUserPage, user_id, payload['limit'], payload['cursor'], start, end)
+        return await runBlocking(allByUser, user_id, start, end)
+
+    if path == '/allByUser/batch':
+        payload = parseAllByUserBatchPayload(data)
+        return await runBlocking(allByUserBatch, payload['user_ids'])
+
+    payload = parseNetMerchantPayload(data)
+    return await runBlocking(netMerchant, payload['merchant_type_code'], payload['start'], payload['end'])
+
+
+async def app(scope, receive, send):
+    """
+    ASGI entry point.
+    """
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                _executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    if scope['type'] != 'http':
+        return
+
+    path = scope['path']
+    if path not in ('/allByUser', '/allByUser/batch', '/netMerchant'):
+        await _sendResponse(send, 404, _errorBody("Not Found"), _jsonHeaders)
+        return
+    if scope['method'] != 'POST':
+        await _sendResponse(send, 405, _errorBody("Method Not Allowed"), _jsonHeaders)
+        return
+
+    headers = dict(scope['headers'])
+    if headers.get(b'content-type') != b'application/json':
+        await _sendResponse(send, 415, _errorBody("Unsupported Media Type: Content-Type must be 'application/json'."),
+                            _jsonHeaders)
+        return
+
+    try:
+        data = await _readJson(receive)
+        response = await _dispatch(path, data)
+    except json.JSONDecodeError as e:
+        await _sendResponse(send, 400, _errorBody(f"Invalid JSON payload: {e}"), _jsonHeaders)
+        return
+    except KeyError as e:
+        await _sendResponse(send, 400, _errorBody(str(e)), _jsonHeaders)
+        return
+    except ValueError as e:
+        await _sendResponse(send, 400, _errorBody(str(e)), _jsonHeaders)
+        return
+    except Exception as e:
+        await _sendResponse(send, 500, _errorBody(str(e)), _jsonHeaders)
+        return
+
+    if isinstance(response, str):
+        # Flask sends the plain string views return as text/html, keep the responses identical
+        await _sendResponse(send, 200, response.encode(), _htmlHeaders)
+    else:
+        await _sendStream(send, response)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(app)
@@ -0,0 +1,143 @@
+"""
+Compares request throughput of the blocking Flask path (routes.py) with the asyncio path (asyncApp.py) under
+concurrent clients. Both run in-process against the configured SQLite database, so the numbers reflect the serving
+code and the database rather than the network.
+
+    python benchmarks/asyncBenchmark.py --requests 2000 --sync-workers 1 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from constants import Constants  # noqa: E402
+
+
+def samplePayloads(database: str, count: int, seed: int) -> list:
+    """
+    Build a mix of /allByUser and /netMerchant requests for keys that exist in the database.
+
+    Returns:
+        list: (path, payload) tuples.
+    """
+    conn = sqlite3.connect(database)
+    users = [row[0] for row in conn.execute("SELECT DISTINCT user_id FROM purchases")]
+    merchants = [row[0] for row in conn.execute("SELECT DISTINCT merchant_type_code FROM purchases")]
+    conn.close()
+
+    rng = random.Random(seed)
+    payloads = []
+    for _ in range(count):
+        if rng.random() < 0.5:
+            payloads.append(('/allByUser', {'user_id': rng.choice(users)}))
+        else:
+            payloads.append(('/netMerchant', {'merchant_type_code': rng.choice(merchants)}))
+    return payloads
+
+
+def runBlocking(payloads: list, workers: int) -> float:
+    """
+    Serve the requests through the Flask app with a fixed number of synchronous workers.
+
+    Returns:
+        float: Elapsed seconds.
+    """
+    from main import app
+
+    pending = iter(payloads)
+    lock = threading.Lock()
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                item = next(pending, None)
+            if item is None:
+                return
+            path, payload = item
+            client.post(path, json=payload)
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+async def _callAsgi(app, path: str, payload: dict) -> int:
+    body = json.dumps(payload).encode()
+    scope = {'type': 'http', 'method': 'POST', 'path': path, 'headers': [(b'content-type', b'application/json')]}
+    status = None
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await app(scope, receive, send)
+    return status
+
+
+async def _runAsync(payloads: list, concurrency: int) -> float:
+    from asyncApp import app
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def client(path, payload):
+        async with semaphore:
+            await _callAsgi(app, path, payload)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(path, payload) for path, payload in payloads))
+    return time.perf_counter() - start
+
+
+def runAsync(payloads: list, concurrency: int) -> float:
+    """
+    Serve the requests through the ASGI app with up to `concurrency` requests in flight.
+
+    Returns:
+        float: Elapsed seconds.
+    """
+    return asyncio.run(_runAsync(payloads, concurrency))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=Constants.dbName.value)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--sync-workers', type=int, default=1, help="synchronous workers on the blocking path")
+    parser.add_argument('--concurrency', type=int, default=64, help="requests in flight on the async path")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    # the controller reads Constants.dbName relative to the working directory
+    os.chdir(os.path.dirname(os.path.abspath(args.database)))
+    payloads = samplePayloads(args.database, args.requests, args.seed)
+
+    # warm both paths so connection setup is not part of the measurement
+    runBlocking(payloads[:args.sync_workers], args.sync_workers)
+    runAsync(payloads[:args.concurrency], args.concurrency)
+
+    blocking = runBlocking(payloads, args.sync_workers)
+    asynchronous = runAsync(payloads, args.concurrency)
+
+    print(f"{'path':<10}{'in flight':>10}{'seconds':>10}{'req/s':>10}")
+    print(f"{'blocking':<10}{args.sync_workers:>10}{blocking:>10.2f}{len(payloads) / blocking:>10.0f}")
+    print(f"{'async':<10}{args.concurrency:>10}{asynchronous:>10.2f}{len(payloads) / asynchronous:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark of the user lookups on the two table layouts dbInit can build from the same generated transactions:
+"split" (purchases and returns tables, every lookup is a UNION ALL of two index searches) and "unified" (one
+transactions table with an is_return flag and one covering (user_id, datetime) index, see
+constants.unifiedLayout). Prints the mean microseconds per lookup, the database sizes and the query plans.
+
+    python benchmarks/layoutBenchmark.py --rows 1000000 --iterations 20000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dbManager  # noqa: E402
+from constants import Constants, getAllByUsersCall, getAllByUsersBatchCall, getAllByUsersPageCall  # noqa: E402
+from dataGenerator import generateTransactions  # noqa: E402
+
+
+def timeQueries(conn, statements: list) -> float:
+    """
+    Run (sql, params) pairs and return the mean microseconds per query.
+    """
+    start = time.perf_counter()
+    for sql, params in statements:
+        conn.execute(sql, params).fetchall()
+    return (time.perf_counter() - start) / len(statements) * 1e6
+
+
+def lookups(unified: bool, userKeys: list, batches: list) -> dict:
+    """
+    The (sql, params) pairs of every lookup, bound the way controller binds them.
+    """
+    batchSize = len(batches[0])
+    batchParams = [tuple(batch) if unified else tuple(batch) * 2 for batch in batches]
+    page = getAllByUsersPageCall(unified)
+    return {
+        'allByUser': [(getAllByUsersCall(unified), {'user_id': key}) for key in userKeys],
+        f'batch of {batchSize}': [(getAllByUsersBatchCall(batchSize, unified), params) for params in batchParams],
+        'page of 20': [(page, {'user_id': key, 'datetime': '', 'src': -1, 'rid': -1, 'limit': 21})
+                       for key in userKeys],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dir', default=None, help="where to build the databases, a temporary directory by default")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        connections = {}
+        for layout in ('split', 'unified'):
+            path = os.path.join(directory, f'{layout}.db')
+            start = time.perf_counter()
+            dbManager.dbInit(database=path, transactions=generateTransactions(args.rows, args.seed), layout=layout)
+            print(f"Built {layout} layout in {time.perf_counter() - start:.1f}s, "
+                  f"{os.path.getsize(path) / 2 ** 20:.1f} MiB")
+            connections[layout] = sqlite3.connect(path, cached_statements=Constants.poolCachedStatements.value)
+
+        users = [row[0] for row in connections['split'].execute("SELECT DISTINCT user_id FROM purchases")]
+        rng = random.Random(args.seed)
+        userKeys = [rng.choice(users) for _ in range(args.iterations)]
+        batches = [rng.sample(users, min(args.batch, len(users))) for _ in range(args.iterations // args.batch or 1)]
+
+        results = {layout: lookups(layout == 'unified', userKeys, batches) for layout in connections}
+        print(f"\n{'lookup':<14}{'split us':>12}{'unified us':>12}{'speedup':>10}")
+        for name in results['split']:
+            times = {}
+            for layout, conn in connections.items():
+                # warm the page cache and the statement cache first
+                timeQueries(conn, results[layout][name][:100])
+                times[layout] = timeQueries(conn, results[layout][name])
+            print(f"{name:<14}{times['split']:>12.1f}{times['unified']:>12.1f}"
+                  f"{times['split'] / times['unified']:>9.2f}x")
+
+        for layout, conn in connections.items():
+            print(f"\n{layout} plans:")
+            for name, statements in results[layout].items():
+                sql, params = statements[0]
+                plan = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+                print(f"  {name}: " + "; ".join(row[-1] for row in plan))
+            conn.close()
+
+
+if __name__ == '__main__':
+    main()
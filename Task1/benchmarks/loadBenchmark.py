@@ -0,0 +1,263 @@
+"""
+Load test of /allByUser and /netMerchant. Requests are driven either in-process through the Flask test client or
+against a running server (python main.py), by a pool of concurrent clients drawing keys from a uniform or a Zipfian
+distribution over the keys of the database.
+
+Every stage (one endpoint at one concurrency level) reports throughput and p50/p95/p99 latency, and the results can
+be saved as JSON. Given the JSON of a previous run, stages whose p95 latency or throughput got worse by more than the
+tolerance are reported and the exit status is 1, so the benchmark can gate a change.
+
+    python benchmarks/loadBenchmark.py --requests 5000 --concurrency 1,8,32 --distribution zipf
+    python benchmarks/loadBenchmark.py --target http://127.0.0.1:5000 --output after.json --baseline before.json
+"""
+import argparse
+import bisect
+import http.client
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from constants import Constants  # noqa: E402
+
+# Endpoint, payload field and the query returning its keys
+_endpoints = {
+    'allByUser': ('user_id', "SELECT DISTINCT user_id FROM purchases UNION SELECT DISTINCT user_id FROM returns"),
+    'netMerchant': ('merchant_type_code', "SELECT DISTINCT merchant_type_code FROM daily_merchant_net"),
+}
+
+
+def loadKeys(database: str, endpoint: str, limit: int = None, seed: int = 0) -> list:
+    """
+    Return the keys of an endpoint found in the database, in a random order (the order is the popularity rank under
+    the Zipfian distribution), optionally only the first `limit` of them.
+    """
+    conn = sqlite3.connect(database)
+    keys = sorted(row[0] for row in conn.execute(_endpoints[endpoint][1]))
+    conn.close()
+
+    random.Random(seed).shuffle(keys)
+    return keys[:limit] if limit else keys
+
+
+def sampleKeys(keys: list, count: int, distribution: str, zipfExponent: float, seed: int) -> list:
+    """
+    Draw `count` keys, uniformly or with the probability of the key of rank r proportional to 1 / r ** zipfExponent.
+    """
+    rng = random.Random(seed)
+    if distribution == 'uniform':
+        return [rng.choice(keys) for _ in range(count)]
+
+    cumulative = list(itertools.accumulate(1 / rank ** zipfExponent for rank in range(1, len(keys) + 1)))
+    return [keys[bisect.bisect(cumulative, rng.random() * cumulative[-1])] for _ in range(count)]
+
+
+def percentile(latencies: list, fraction: float) -> float:
+    """
+    Nearest-rank percentile of sorted latencies.
+    """
+    if not latencies:
+        return float('nan')
+    return latencies[min(len(latencies) - 1, max(0, int(round(fraction * len(latencies))) - 1))]
+
+
+def inProcessClient(database: str):
+    """
+    Return a function sending one request through the Flask test client, each thread getting its own client, with
+    the lookups answered from the given database. The function returns the status and the body of the response.
+    """
+    import controller
+    from main import app
+    controller.setDatabase(database)
+    local = threading.local()
+
+    def send(path: str, payload: dict) -> tuple:
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        response = local.client.post(path, json=payload)
+        return response.status_code, response.get_data()
+
+    return send
+
+
+def httpClient(target: str):
+    """
+    Return a function sending one request to a running server, over one keep-alive connection per thread. The
+    function returns the status and the body of the response, status 0 if the request failed.
+    """
+    url = urlsplit(target)
+    local = threading.local()
+
+    def send(path: str, payload: dict) -> tuple:
+        if not hasattr(local, 'conn'):
+            local.conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+        body = json.dumps(payload)
+        try:
+            local.conn.request('POST', path, body, {'Content-Type': 'application/json'})
+            response = local.conn.getresponse()
+            body = response.read()
+        except (http.client.HTTPException, OSError):
+            # the server closed the keep-alive connection, reconnect for the next request
+            local.conn.close()
+            del local.conn
+            return 0, b''
+        return response.status, body
+
+    return send
+
+
+def runStage(send, path: str, field: str, keys: list, concurrency: int) -> dict:
+    """
+    Send one request per key with `concurrency` clients and measure every request. Every key is drawn from the
+    database, so besides non-200 responses an empty result counts as an error: the server is not answering from
+    that database.
+
+    Returns:
+        dict: Requests, errors, elapsed seconds, throughput and latency percentiles in milliseconds.
+    """
+    pending = iter(keys)
+    lock = threading.Lock()
+    latencies = []
+    errors = 0
+
+    def worker():
+        nonlocal errors
+        measured = []
+        failed = 0
+        while True:
+            with lock:
+                key = next(pending, None)
+            if key is None:
+                break
+            start = time.perf_counter()
+            status, body = send(path, {field: key})
+            measured.append((time.perf_counter() - start) * 1000)
+            failed += status != 200 or body.strip() in (b'', b'[]')
+        with lock:
+            latencies.extend(measured)
+            errors += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': round(elapsed, 4),
+        'throughput': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+    }
+
+
+def compareResults(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    List the stages that regressed against a previous run: p95 latency higher or throughput lower by more than the
+    tolerance (a fraction).
+    """
+    previous = {(stage['endpoint'], stage['concurrency']): stage for stage in baseline['stages']}
+    regressions = []
+    for stage in results['stages']:
+        before = previous.get((stage['endpoint'], stage['concurrency']))
+        if before is None:
+            continue
+        if stage['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{stage['endpoint']} x{stage['concurrency']}: p95 {before['p95_ms']} -> "
+                               f"{stage['p95_ms']} ms")
+        if stage['throughput'] < before['throughput'] * (1 - tolerance):
+            regressions.append(f"{stage['endpoint']} x{stage['concurrency']}: throughput {before['throughput']} -> "
+                               f"{stage['throughput']} req/s")
+    return regressions
+
+
+def _gitRevision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=Constants.dbName.value, help="database the keys are drawn from")
+    parser.add_argument('--target', default='in-process', help="'in-process' or the URL of a running server")
+    parser.add_argument('--endpoints', default='allByUser,netMerchant')
+    parser.add_argument('--requests', type=int, default=2000, help="requests per stage")
+    parser.add_argument('--concurrency', default='1,8,32', help="comma separated concurrency levels, one stage each")
+    parser.add_argument('--distribution', default='uniform', choices=('uniform', 'zipf'))
+    parser.add_argument('--zipf-exponent', type=float, default=1.1)
+    parser.add_argument('--keys', type=int, default=None, help="only draw from this many distinct keys per endpoint")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--baseline', help="JSON results of a previous run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="allowed regression against the baseline")
+    args = parser.parse_args()
+
+    database = os.path.abspath(args.database)
+    output = args.output and os.path.abspath(args.output)
+    baseline = args.baseline and os.path.abspath(args.baseline)
+    if not os.path.isfile(database):
+        # sqlite3 would create an empty database in its place
+        parser.error(f"database not found: {database}")
+    if args.target == 'in-process':
+        send = inProcessClient(database)
+    else:
+        send = httpClient(args.target)
+
+    levels = [int(level) for level in args.concurrency.split(',')]
+    results = {
+        'revision': _gitRevision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'settings': vars(args),
+        'stages': [],
+    }
+
+    print(f"{'endpoint':<13}{'clients':>8}{'keys':>8}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for endpoint in args.endpoints.split(','):
+        field = _endpoints[endpoint][0]
+        keys = loadKeys(database, endpoint, args.keys, args.seed)
+        sample = sampleKeys(keys, args.requests, args.distribution, args.zipf_exponent, args.seed)
+
+        # warm up connections and caches so the first stage is not penalized
+        runStage(send, f"/{endpoint}", field, sample[:max(levels)], max(levels))
+
+        for concurrency in levels:
+            stage = dict(endpoint=endpoint, concurrency=concurrency, keys=len(keys),
+                         **runStage(send, f"/{endpoint}", field, sample, concurrency))
+            results['stages'].append(stage)
+            print(f"{endpoint:<13}{concurrency:>8}{len(keys):>8}{stage['throughput']:>10.0f}{stage['p50_ms']:>9.2f}"
+                  f"{stage['p95_ms']:>9.2f}{stage['p99_ms']:>9.2f}{stage['errors']:>8}")
+
+    if output:
+        with open(output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if baseline:
+        with open(baseline) as file:
+            regressions = compareResults(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print("regression:", regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Cold start benchmark of a worker: every run starts a fresh interpreter, imports main (the import graph a gunicorn
+worker loads), serves a first /allByUser and /netMerchant request through the test client, and reports
+
+    - the seconds spent importing main,
+    - the seconds of the first requests (lazy imports and connection setup land here),
+    - the resident memory (RSS) afterwards,
+    - which of Constants.startupLazyModules got imported.
+
+The medians are compared with the budgets in constants.py (also enforced by tests/startup_test.py).
+
+    python benchmarks/startupBenchmark.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from constants import Constants  # noqa: E402
+
+# Runs in the fresh interpreter, prints its measurements as JSON
+_probe = '''
+import json, sys, time
+
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+client = main.app.test_client()
+statuses = [client.get(url).status_code for url in sys.argv[1:]]
+served = time.perf_counter()
+
+rss = None
+try:
+    with open('/proc/self/status') as file:
+        rss = next(int(line.split()[1]) * 1024 for line in file if line.startswith('VmRSS'))
+except OSError:
+    import resource
+    # peak instead of current RSS, in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+print(json.dumps({'import_seconds': imported - start, 'first_request_seconds': served - imported,
+                  'rss_bytes': rss, 'statuses': statuses, 'modules': sorted(m for m in %r if m in sys.modules)}))
+''' % (Constants.startupLazyModules.value,)
+
+
+def measureStartup(urls: list) -> dict:
+    """
+    Start a fresh interpreter in the app directory, import main, request the urls and return the measurements.
+    """
+    directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', _probe, *urls], cwd=directory, capture_output=True, text=True,
+                            check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--user-id', type=int, default=38493)
+    parser.add_argument('--merchant-type-code', type=int, default=5732)
+    parser.add_argument('--output', help="write the runs as JSON")
+    args = parser.parse_args()
+
+    urls = [f'/allByUser?user_id={args.user_id}', f'/netMerchant?merchant_type_code={args.merchant_type_code}']
+    runs = [measureStartup(urls) for _ in range(args.runs)]
+
+    importSeconds = statistics.median(run['import_seconds'] for run in runs)
+    requestSeconds = statistics.median(run['first_request_seconds'] for run in runs)
+    rssMB = statistics.median(run['rss_bytes'] for run in runs) / 2 ** 20
+    loaded = sorted({module for run in runs for module in run['modules']})
+
+    print(f"{'':<24}{'median':>10}{'budget':>10}")
+    print(f"{'import main (s)':<24}{importSeconds:>10.3f}{Constants.startupImportBudgetSeconds.value:>10}")
+    print(f"{'first requests (s)':<24}{requestSeconds:>10.3f}{'':>10}")
+    print(f"{'RSS after (MB)':<24}{rssMB:>10.1f}{Constants.startupRssBudgetMB.value:>10}")
+    print(f"lazy modules imported: {', '.join(loaded) or 'none'}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(runs, file, indent=2)
+
+    overBudget = (importSeconds > Constants.startupImportBudgetSeconds.value or
+                  rssMB > Constants.startupRssBudgetMB.value or loaded)
+    sys.exit(1 if overBudget else 0)
+
+
+if __name__ == '__main__':
+    main()
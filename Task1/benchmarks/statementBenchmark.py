@@ -0,0 +1,78 @@
+"""
+Microbenchmark of the /allByUser and /netMerchant lookups on a single connection, comparing SQL text built per key
+(what f-string query builders produce: every key is a new statement to parse and plan) with the fixed parameterized
+statements from constants (prepared once, then served from the connection's statement cache).
+
+The bundled database only has a few hundred keys, which would all fit in the statement cache even as inlined text.
+The inlined variant therefore runs on a connection with the cache disabled, which models production key cardinality
+where nearly every inlined statement is a cache miss.
+
+    python benchmarks/statementBenchmark.py --iterations 20000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from constants import Constants, getAllByUsersCall, getNetMerchantCall  # noqa: E402
+
+
+def timeQueries(conn, statements: list) -> float:
+    """
+    Run (sql, params) pairs and return the mean microseconds per query.
+    """
+    start = time.perf_counter()
+    for sql, params in statements:
+        conn.execute(sql, params).fetchall()
+    return (time.perf_counter() - start) / len(statements) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=Constants.dbName.value)
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database, cached_statements=Constants.poolCachedStatements.value)
+    uncached = sqlite3.connect(args.database, cached_statements=0)
+    users = [row[0] for row in conn.execute("SELECT DISTINCT user_id FROM purchases")]
+    merchants = [row[0] for row in conn.execute("SELECT DISTINCT merchant_type_code FROM daily_merchant_net")]
+
+    rng = random.Random(args.seed)
+    userKeys = [rng.choice(users) for _ in range(args.iterations)]
+    merchantKeys = [rng.choice(merchants) for _ in range(args.iterations)]
+
+    # Inline the key into the SQL text, like the former f-string builders did
+    allByUser = getAllByUsersCall()
+    netMerchant = getNetMerchantCall()
+    cases = {
+        'allByUser': (
+            [(allByUser.replace(':user_id', str(key)), ()) for key in userKeys],
+            [(allByUser, {'user_id': key}) for key in userKeys],
+        ),
+        'netMerchant': (
+            [(netMerchant.replace(':merchant_type_code', str(key)), ()) for key in merchantKeys],
+            [(netMerchant, {'merchant_type_code': key}) for key in merchantKeys],
+        ),
+    }
+
+    print(f"{'query':<14}{'inlined us':>12}{'bound us':>12}{'speedup':>10}")
+    for name, (inlined, bound) in cases.items():
+        # warm the page cache so both variants read the same hot pages
+        timeQueries(conn, bound[:100])
+        timeQueries(uncached, inlined[:100])
+        inlinedTime = timeQueries(uncached, inlined)
+        boundTime = timeQueries(conn, bound)
+        print(f"{name:<14}{inlinedTime:>12.1f}{boundTime:>12.1f}{inlinedTime / boundTime:>9.1f}x")
+
+    conn.close()
+    uncached.close()
+
+
+if __name__ == '__main__':
+    main()
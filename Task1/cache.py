@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import OrderedDict
+
+from constants import Constants
+
+# Default generation of ResultCache.put: store the value under whatever generation is current
+_currentGeneration = object()
+
+
+class ResultCache:
+    """
+    In-process cache of final endpoint responses, with size-bounded LRU eviction and a TTL per entry.
+
+    The cache follows the database's load generation: it is read through generationSource at most once every
+    generationCheckSeconds, and every entry is dropped as soon as it changes, so a reload is never served stale for
+    longer than that interval. A value computed across a generation change is not stored (see put).
+
+    Args:
+        generationSource (callable): Returns the current load generation of the data.
+        maxEntries (int): Entries kept before the least recently used one is evicted.
+        ttlSeconds (float): Lifetime of an entry.
+        generationCheckSeconds (float): Minimum time between two reads of the load generation.
+    """
+
+    def __init__(self, generationSource, maxEntries: int = Constants.cacheMaxEntries.value,
+                 ttlSeconds: float = Constants.cacheTtlSeconds.value,
+                 generationCheckSeconds: float = Constants.cacheGenerationCheckSeconds.value):
+        self.generationSource = generationSource
+        self.maxEntries = maxEntries
+        self.ttlSeconds = ttlSeconds
+        self.generationCheckSeconds = generationCheckSeconds
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = None
+        self._checkedAt = float('-inf')
+        self._checks = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _checkGeneration(self, now: float):
+        # The source may query the database, so it is read outside the lock: one thread per interval claims the check,
+        # the others carry on with the generation they have
+        with self._lock:
+            if now - self._checkedAt < self.generationCheckSeconds:
+                return
+            self._checkedAt = now
+            self._checks += 1
+            check = self._checks
+
+        generation = self.generationSource()
+
+        with self._lock:
+            # a slow read finishing after a later one must not bring an older generation back
+            if check != self._checks or generation == self._generation:
+                return
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._generation = generation
+
+    def generation(self):
+        """
+        Return the load generation the cached entries belong to, re-reading it if the check interval has passed.
+        Callers pass it on to put, read before computing the value they store.
+        """
+        self._checkGeneration(time.monotonic())
+        with self._lock:
+            return self._generation
+
+    def get(self, key):
+        """
+        Return the cached value for a key, or None if it is missing or expired. Unhashable keys are never cached.
+        """
+        now = time.monotonic()
+        self._checkGeneration(now)
+        with self._lock:
+            try:
+                entry = self._entries.get(key)
+            except TypeError:
+                return None
+
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, generation=_currentGeneration):
+        """
+        Store a value, evicting the least recently used entries beyond maxEntries.
+
+        Args:
+            key: The cache key, unhashable keys are never cached.
+            value: The value to store.
+            generation: The generation (see generation()) read before the value was computed. The value is dropped if
+                the generation changed since, it may hold data of the previous load. Stored unconditionally if omitted.
+        """
+        now = time.monotonic()
+        self._checkGeneration(now)
+        with self._lock:
+            if generation is not _currentGeneration and generation != self._generation:
+                return
+            try:
+                self._entries[key] = (now + self.ttlSeconds, value)
+            except TypeError:
+                return
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Drop every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Return the cache counters.
+
+        Returns:
+            dict: hits, misses, evictions, invalidations, the current number of entries and the load generation.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'invalidations': self.invalidations, 'entries': len(self._entries),
+                    'generation': self._generation}
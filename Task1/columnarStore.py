@@ -0,0 +1,287 @@
+"""
+Read-only columnar copy of the transactions for the lookup endpoints. The transactions are sorted by user and written
+as fixed-width NumPy column files, next to the daily net per merchant rollup sorted by merchant. Each sort key gets an
+offsets index, so a lookup is a binary search plus a zero-copy slice of memory-mapped files, and the pages are shared
+by every worker process through the OS page cache.
+
+Build it from the SQLite database with
+    python columnarStore.py
+"""
+import json
+import os
+import shutil
+import sqlite3
+
+import numpy as np
+
+from constants import Constants
+
+# Column files of the store and their dtypes (datetime is sized to the longest value when building)
+_transactionColumns = {
+    'user_id': np.int64,
+    'amount_cents': np.int64,
+    'datetime': None,
+    'merchant_type_code': np.int64,
+    'is_return': np.int8,
+}
+_dailyColumns = {
+    'merchant_type_code': np.int64,
+    'date': 'S10',
+    'net_amount_in_cents': np.int64,
+}
+
+# File in the store directory naming the current version directory, see buildColumnarStore
+_pointerName = 'CURRENT'
+
+
+def _keyIndex(keys: np.ndarray):
+    """
+    Build the offsets index of a sorted key column: the distinct keys and, for each of them, where its rows start
+    (with the total row count appended, so key i spans offsets[i]:offsets[i + 1]).
+    """
+    if len(keys) == 0:
+        return np.empty(0, dtype=np.int64), np.zeros(1, dtype=np.int64)
+
+    starts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+    return np.asarray(keys[starts], dtype=np.int64), np.append(starts, len(keys)).astype(np.int64)
+
+
+def _fillColumns(allocate, prefix: str, columns: dict, count: int, rows, chunkRows: int) -> dict:
+    """
+    Fill freshly allocated column arrays from a cursor, one chunk of rows at a time.
+    """
+    arrays = {name: allocate(f"{prefix}_{name}", np.dtype(dtype), (count,)) for name, dtype in columns.items()}
+
+    position = 0
+    while True:
+        chunk = rows.fetchmany(chunkRows)
+        if not chunk:
+            break
+        for index, column in enumerate(arrays.values()):
+            column[position:position + len(chunk)] = [row[index] for row in chunk]
+        position += len(chunk)
+
+    return arrays
+
+
+def buildColumnarArrays(conn, allocate, chunkRows: int = Constants.loaderChunkRows.value):
+    """
+    Copy the data of a SQLite database into column arrays and build their offsets indexes. The arrays are created by
+    the allocate callback, so they can live in memory-mapped files, shared memory or plain memory.
+
+    Args:
+        conn (sqlite3.Connection): The connection object to the SQLite database.
+        allocate (callable): allocate(name, dtype, shape) returns a writable array for the named column.
+        chunkRows (int): Rows copied per batch.
+
+    Returns:
+        tuple: The arrays by name (as ColumnarTables expects them) and the load generation they were built from.
+    """
+    count = conn.execute("SELECT (SELECT count(*) FROM purchases) + (SELECT count(*) FROM returns)").fetchone()[0]
+    width = conn.execute("SELECT max(coalesce((SELECT max(length(datetime)) FROM purchases), 0), "
+                         "coalesce((SELECT max(length(datetime)) FROM returns), 0), 1)").fetchone()[0]
+    columns = dict(_transactionColumns, datetime=f'S{width}')
+
+    rows = conn.execute('''SELECT user_id, amount_cents, datetime, merchant_type_code, 0 FROM purchases
+                           UNION ALL
+                           SELECT user_id, amount_cents, datetime, merchant_type_code, 1 FROM returns
+                           ORDER BY user_id, datetime''')
+    transactions = _fillColumns(allocate, 'transactions', columns, count, rows, chunkRows)
+
+    dailyCount = conn.execute("SELECT count(*) FROM daily_merchant_net").fetchone()[0]
+    rows = conn.execute('''SELECT merchant_type_code, date, purchase_cents - return_cents FROM daily_merchant_net
+                           ORDER BY merchant_type_code, date''')
+    daily = _fillColumns(allocate, 'daily', _dailyColumns, dailyCount, rows, chunkRows)
+
+    arrays = {f"transactions_{name}": array for name, array in transactions.items()}
+    arrays.update({f"daily_{name}": array for name, array in daily.items()})
+
+    for name, keys in (('user', transactions['user_id']), ('merchant', daily['merchant_type_code'])):
+        for suffix, index in zip(('keys', 'offsets'), _keyIndex(keys)):
+            array = allocate(f"{name}_{suffix}", index.dtype, index.shape)
+            array[:] = index
+            arrays[f"{name}_{suffix}"] = array
+
+    generation = conn.execute(Constants.getGeneration.value).fetchone()
+    return arrays, generation[0] if generation else None
+
+
+def _currentVersion(directory: str) -> str:
+    # name of the version directory the pointer file names, None for a store written before versions
+    try:
+        with open(os.path.join(directory, _pointerName)) as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def buildColumnarStore(conn, directory: str = Constants.columnarDir.value,
+                       chunkRows: int = Constants.loaderChunkRows.value):
+    """
+    Write the columnar store for the data in a SQLite database. Every build goes to a new version directory inside
+    the store directory, and the pointer file naming the current version is replaced in one atomic step at the end,
+    so readers always open a complete store: the previous one or the new one, never a mix of both. The previous
+    version is kept for readers that read the pointer just before the swap, older ones are removed.
+
+    Args:
+        conn (sqlite3.Connection): The connection object to the SQLite database.
+        directory (str): Directory of the store.
+        chunkRows (int): Rows copied per batch, bounding the memory used while building.
+
+    Returns:
+        None
+    """
+    os.makedirs(directory, exist_ok=True)
+    previous = _currentVersion(directory)
+    numbers = [int(name[1:]) for name in os.listdir(directory) if name[:1] == 'v' and name[1:].isdigit()]
+    version = f"v{max(numbers, default=0) + 1}"
+    target = os.path.join(directory, version)
+    os.makedirs(target)
+
+    def allocate(name, dtype, shape):
+        return np.lib.format.open_memmap(os.path.join(target, f"{name}.npy"), mode='w+', dtype=dtype, shape=shape)
+
+    arrays, generation = buildColumnarArrays(conn, allocate, chunkRows)
+    for array in arrays.values():
+        array.flush()
+
+    with open(os.path.join(target, 'manifest.json'), 'w') as file:
+        json.dump({'transactions': len(arrays['transactions_user_id']), 'daily': len(arrays['daily_date']),
+                   'generation': generation}, file)
+
+    # Swap the new version in
+    staging = os.path.join(directory, _pointerName + '.tmp')
+    with open(staging, 'w') as file:
+        file.write(version)
+    os.replace(staging, os.path.join(directory, _pointerName))
+
+    # Mapped files of removed versions stay valid for readers that still have them open
+    for name in os.listdir(directory):
+        if name not in (_pointerName, version, previous):
+            path = os.path.join(directory, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+
+class ColumnarTables:
+    """
+    Lookups over the column arrays of a store. The arrays can come from memory-mapped files (ColumnarStore) or any
+    other source holding the same columns, such as shared memory.
+
+    Args:
+        arrays (dict): 'transactions_<column>', 'daily_<column>', 'user_keys', 'user_offsets', 'merchant_keys' and
+            'merchant_offsets' arrays.
+        generation (int): Load generation of the data the arrays were built from.
+    """
+
+    def __init__(self, arrays: dict, generation=None):
+        self.arrays = arrays
+        self.generation = generation
+
+    @staticmethod
+    def _span(keys: np.ndarray, offsets: np.ndarray, key) -> tuple:
+        # keys that are not integers match nothing, like in SQLite's integer columns: int() alone would truncate 1.5
+        # and turn True into user 1
+        if isinstance(key, (bool, np.bool_)):
+            return 0, 0
+        try:
+            integral = int(key)
+        except (TypeError, ValueError, OverflowError):
+            return 0, 0
+        if (not isinstance(key, str) and integral != key) or not -2 ** 63 <= integral < 2 ** 63:
+            return 0, 0
+        key = integral
+
+        # binary search for the key in the distinct sorted keys
+        position = int(np.searchsorted(keys, key))
+        if position == len(keys) or keys[position] != key:
+            return 0, 0
+        return int(offsets[position]), int(offsets[position + 1])
+
+    @staticmethod
+    def _narrow(values: np.ndarray, start: int, end: int, low: str = None, high: str = None) -> tuple:
+        # rows of a span are sorted by the values, so the half-open [low, high) window is found by binary search
+        if low is not None:
+            start += int(np.searchsorted(values[start:end], low.encode('ascii')))
+        if high is not None:
+            end = start + int(np.searchsorted(values[start:end], high.encode('ascii')))
+        return start, end
+
+    def userTransactions(self, userId: int, start: str = None, end: str = None) -> list:
+        """
+        Return the transactions of a user ordered by datetime, as the rows the allByUser query returns.
+
+        Args:
+            userId (int): The ID of the user.
+            start (str): Only transactions at or after this ISO 8601 date or datetime.
+            end (str): Only transactions before this ISO 8601 date or datetime.
+
+        Returns:
+            list: (user_id, amount_cents, datetime, merchant_type_code) tuples.
+        """
+        first, last = self._span(self.arrays['user_keys'], self.arrays['user_offsets'], userId)
+        first, last = self._narrow(self.arrays['transactions_datetime'], first, last, start, end)
+        if first >= last:
+            return []
+
+        return list(zip(self.arrays['transactions_user_id'][first:last].tolist(),
+                        self.arrays['transactions_amount_cents'][first:last].tolist(),
+                        np.char.decode(self.arrays['transactions_datetime'][first:last], 'ascii').tolist(),
+                        self.arrays['transactions_merchant_type_code'][first:last].tolist()))
+
+    def merchantNet(self, merchantTypeCode: int, start: str = None, end: str = None) -> list:
+        """
+        Return the daily net amounts of a merchant type ordered by date, as the rows the netMerchant query returns.
+
+        Args:
+            merchantTypeCode (int): The code representing the merchant type.
+            start (str): Only days from this date on (YYYY-MM-DD).
+            end (str): Only days before this date (YYYY-MM-DD).
+
+        Returns:
+            list: (date, net_amount_in_cents, merchant_type_code) tuples.
+        """
+        first, last = self._span(self.arrays['merchant_keys'], self.arrays['merchant_offsets'], merchantTypeCode)
+        first, last = self._narrow(self.arrays['daily_date'], first, last, start, end)
+        if first >= last:
+            return []
+
+        return list(zip(np.char.decode(self.arrays['daily_date'][first:last], 'ascii').tolist(),
+                        self.arrays['daily_net_amount_in_cents'][first:last].tolist(),
+                        self.arrays['daily_merchant_type_code'][first:last].tolist()))
+
+
+class ColumnarStore(ColumnarTables):
+    """
+    Columnar store opened from its directory, with every column memory-mapped read-only. The pointer file is read
+    once and every column comes from the version it names.
+
+    Args:
+        directory (str): Directory written by buildColumnarStore.
+
+    Raises:
+        FileNotFoundError: If no store was built in the directory.
+    """
+
+    def __init__(self, directory: str = Constants.columnarDir.value):
+        version = _currentVersion(directory)
+        path = os.path.join(directory, version) if version else directory
+        with open(os.path.join(path, 'manifest.json')) as file:
+            manifest = json.load(file)
+
+        arrays = {}
+        for name in os.listdir(path):
+            if name.endswith('.npy'):
+                arrays[name[:-4]] = np.load(os.path.join(path, name), mmap_mode='r')
+
+        super().__init__(arrays, manifest['generation'])
+        self.directory = directory
+        self.path = path
+
+
+if __name__ == '__main__':
+    connection = sqlite3.connect(Constants.dbName.value)
+    buildColumnarStore(connection)
+    connection.close()
@@ -1,29 +1,262 @@
 from enum import Enum
 
 
-def getAllByUsersCall(user_id: int) -> str:
-    allByUserCall = f'''SELECT user_id, amount_cents, datetime, merchant_type_code 
-                    FROM purchases 
-                    WHERE user_id = {user_id} 
-                    UNION ALL 
-                    SELECT user_id, amount_cents, datetime, merchant_type_code 
+def rangePredicate(column: str, start: bool = False, end: bool = False) -> str:
+    # Half-open range on an indexed column bound to :start/:end, compared as is so it stays sargable: the index
+    # range scan then only reads the requested window. Empty without bounds.
+    predicate = ''
+    if start:
+        predicate += f' AND {column} >= :start'
+    if end:
+        predicate += f' AND {column} < :end'
+    return predicate
+
+
+def getAllByUsersCall(unified: bool = False, start: bool = False, end: bool = False) -> str:
+    # Fixed statement with the user bound to :user_id, so SQLite parses and plans it once per connection. start and
+    # end add the bounds of a date range (see rangePredicate).
+    bounds = rangePredicate('datetime', start, end)
+    if unified:
+        # a single range of the (user_id, datetime, ...) covering index, already in datetime order
+        return f'''SELECT user_id, amount_cents, datetime, merchant_type_code
+                    FROM transactions
+                    WHERE user_id = :user_id{bounds}
+                    ORDER BY datetime;'''
+
+    allByUserCall = f'''SELECT user_id, amount_cents, datetime, merchant_type_code
+                    FROM purchases
+                    WHERE user_id = :user_id{bounds}
+                    UNION ALL
+                    SELECT user_id, amount_cents, datetime, merchant_type_code
                     FROM returns
-                    WHERE user_id = {user_id};'''
+                    WHERE user_id = :user_id{bounds};'''
     return allByUserCall
 
 
-def getNetMerchantCall(merchant_type_code: int) -> str:
-    netMerchantCall = f'''SELECT DATE(p.datetime) AS date, SUM(p.amount_cents - COALESCE(r.amount_cents, 0)) 
-                            AS net_amount_in_cents, p.merchant_type_code
-                            FROM purchases p
-                            LEFT JOIN returns r ON DATE(p.datetime) = DATE(r.datetime) 
-                            AND p.merchant_type_code = r.merchant_type_code
-                            WHERE p.merchant_type_code = {merchant_type_code}
-                            GROUP BY DATE(p.datetime)
+def getAllByUsersBatchCall(user_count: int, unified: bool = False) -> str:
+    # One ? per user in each IN-list, bind the user IDs twice (purchases, then returns), or once for the unified
+    # layout. Callers pad user_count to a few bucket sizes so the number of distinct statements, and so of statement
+    # cache entries, stays small.
+    placeholders = ', '.join(['?'] * user_count)
+    if unified:
+        return f'''SELECT user_id, amount_cents, datetime, merchant_type_code
+                    FROM transactions
+                    WHERE user_id IN ({placeholders});'''
+
+    allByUsersBatchCall = f'''SELECT user_id, amount_cents, datetime, merchant_type_code
+                    FROM purchases
+                    WHERE user_id IN ({placeholders})
+                    UNION ALL
+                    SELECT user_id, amount_cents, datetime, merchant_type_code
+                    FROM returns
+                    WHERE user_id IN ({placeholders});'''
+    return allByUsersBatchCall
+
+
+def getAllByUsersPageCall(unified: bool = False, end: bool = False) -> str:
+    # Keyset page of a user's history ordered by (datetime, source table, rowid), starting after the cursor bound to
+    # :datetime/:src/:rid. Each table is limited on its own so a page never reads more than :limit rows per table.
+    # The start of a date range is folded into :datetime by the caller, end adds the upper bound.
+    bounds = rangePredicate('datetime', end=end)
+    if unified:
+        # one table, so the source is always 0 and :src is not used
+        return f'''SELECT user_id, amount_cents, datetime, merchant_type_code, 0 AS src, rowid AS rid
+                    FROM transactions
+                    WHERE user_id = :user_id AND datetime >= :datetime{bounds}
+                    AND (datetime, rowid) > (:datetime, :rid)
+                    ORDER BY datetime, rowid
+                    LIMIT :limit;'''
+
+    allByUsersPageCall = f'''SELECT user_id, amount_cents, datetime, merchant_type_code, src, rid
+                    FROM (SELECT * FROM (SELECT user_id, amount_cents, datetime, merchant_type_code,
+                                                0 AS src, rowid AS rid
+                                         FROM purchases
+                                         WHERE user_id = :user_id AND datetime >= :datetime{bounds}
+                                         AND (datetime, 0, rowid) > (:datetime, :src, :rid)
+                                         ORDER BY datetime, rowid
+                                         LIMIT :limit)
+                          UNION ALL
+                          SELECT * FROM (SELECT user_id, amount_cents, datetime, merchant_type_code,
+                                                1 AS src, rowid AS rid
+                                         FROM returns
+                                         WHERE user_id = :user_id AND datetime >= :datetime{bounds}
+                                         AND (datetime, 1, rowid) > (:datetime, :src, :rid)
+                                         ORDER BY datetime, rowid
+                                         LIMIT :limit))
+                    ORDER BY datetime, src, rid
+                    LIMIT :limit;'''
+    return allByUsersPageCall
+
+
+def getNetMerchantCall(start: bool = False, end: bool = False) -> str:
+    # Reads the daily_merchant_net rollup (see schemaMigrations), a range read on its primary key for the merchant
+    # bound to :merchant_type_code, narrowed to the days from :start up to :end when given
+    bounds = rangePredicate('date', start, end)
+    netMerchantCall = f'''SELECT date, purchase_cents - return_cents AS net_amount_in_cents, merchant_type_code
+                            FROM daily_merchant_net
+                            WHERE merchant_type_code = :merchant_type_code{bounds}
+                            ORDER BY date
                             '''
     return netMerchantCall
 
 
+# First day (or hour) of the export period containing a day of the daily_merchant_net rollup
+_exportPeriods = {
+    'day': 'date',
+    'week': "date(date, 'weekday 0', '-6 days')",
+    'month': "substr(date, 1, 8) || '01'",
+}
+
+
+def getNetMerchantExportCall(granularity: str = 'day', unified: bool = False, start: bool = False,
+                             end: bool = False) -> str:
+    # Net amounts of every merchant type per period in one grouped pass, ordered by merchant type and period. Days,
+    # weeks and months are summed from the daily_merchant_net rollup (read in its primary key order for days), hours
+    # need the transactions themselves. start and end bound the date (datetime for hours) like rangePredicate.
+    if granularity == 'hour':
+        bounds = rangePredicate('datetime', start, end)
+        where = f'WHERE {bounds[5:]}' if bounds else ''
+        if unified:
+            source = f'''SELECT merchant_type_code, datetime,
+                                     CASE WHEN is_return THEN -amount_cents ELSE amount_cents END AS net_cents
+                              FROM transactions {where}'''
+        else:
+            source = f'''SELECT merchant_type_code, datetime, amount_cents AS net_cents FROM purchases {where}
+                              UNION ALL
+                              SELECT merchant_type_code, datetime, -amount_cents AS net_cents FROM returns {where}'''
+        return f'''SELECT merchant_type_code, substr(datetime, 1, 13) || ':00:00' AS period,
+                           SUM(net_cents) AS net_amount_in_cents
+                    FROM ({source})
+                    GROUP BY merchant_type_code, period
+                    ORDER BY merchant_type_code, period;'''
+
+    bounds = rangePredicate('date', start, end)
+    where = f'WHERE {bounds[5:]}' if bounds else ''
+    if granularity == 'day':
+        return f'''SELECT merchant_type_code, date AS period, purchase_cents - return_cents AS net_amount_in_cents
+                    FROM daily_merchant_net {where}
+                    ORDER BY merchant_type_code, date;'''
+
+    return f'''SELECT merchant_type_code, {_exportPeriods[granularity]} AS period,
+                       SUM(purchase_cents - return_cents) AS net_amount_in_cents
+                FROM daily_merchant_net {where}
+                GROUP BY merchant_type_code, period
+                ORDER BY merchant_type_code, period;'''
+
+
+# Ordered schema migrations applied by dbManager.migrateSchema. Migration i (0-based) brings the database to schema
+# version i + 1, which is recorded in PRAGMA user_version so each migration only ever runs once per file.
+schemaMigrations = [
+    # 1: covering lookup indexes for /allByUser and /netMerchant
+    [
+        """CREATE INDEX IF NOT EXISTS idx_purchases_user_datetime
+           ON purchases (user_id, datetime, amount_cents, merchant_type_code);""",
+        """CREATE INDEX IF NOT EXISTS idx_returns_user_datetime
+           ON returns (user_id, datetime, amount_cents, merchant_type_code);""",
+        """CREATE INDEX IF NOT EXISTS idx_purchases_merchant_date
+           ON purchases (merchant_type_code, DATE(datetime), amount_cents);""",
+        """CREATE INDEX IF NOT EXISTS idx_returns_merchant_date
+           ON returns (merchant_type_code, DATE(datetime), amount_cents);""",
+    ],
+    # 2: daily purchase and return totals per merchant behind /netMerchant
+    [
+        """CREATE TABLE IF NOT EXISTS daily_merchant_net (
+                merchant_type_code int NOT NULL,
+                date text NOT NULL,
+                purchase_cents int NOT NULL DEFAULT 0,
+                return_cents int NOT NULL DEFAULT 0,
+                PRIMARY KEY (merchant_type_code, date)
+           ) WITHOUT ROWID;""",
+        """DELETE FROM daily_merchant_net;""",
+        """INSERT INTO daily_merchant_net (merchant_type_code, date, purchase_cents, return_cents)
+           SELECT merchant_type_code, date, SUM(purchase_cents), SUM(return_cents)
+           FROM (SELECT merchant_type_code, DATE(datetime) AS date, amount_cents AS purchase_cents, 0 AS return_cents
+                 FROM purchases
+                 UNION ALL
+                 SELECT merchant_type_code, DATE(datetime) AS date, 0 AS purchase_cents, amount_cents AS return_cents
+                 FROM returns)
+           GROUP BY merchant_type_code, date;""",
+    ],
+    # 3: load generation, bumped whenever the data changes so cached results can be invalidated
+    [
+        """CREATE TABLE IF NOT EXISTS load_metadata (
+                key text PRIMARY KEY,
+                value int NOT NULL
+           );""",
+        """INSERT OR IGNORE INTO load_metadata (key, value) VALUES ('generation', 1);""",
+    ],
+    # 4: log of the incremental ingests, its latest watermark is the newest datetime loaded so far
+    [
+        """CREATE TABLE IF NOT EXISTS ingest_log (
+                id integer PRIMARY KEY,
+                source text NOT NULL,
+                rows_read int NOT NULL,
+                rows_added int NOT NULL,
+                watermark text,
+                ingested_at text NOT NULL DEFAULT (datetime('now'))
+           );""",
+        """DELETE FROM ingest_log;""",
+        """INSERT INTO ingest_log (source, rows_read, rows_added, watermark)
+           SELECT 'full load', count(*), count(*), max(datetime)
+           FROM (SELECT datetime FROM purchases UNION ALL SELECT datetime FROM returns);""",
+    ],
+]
+
+# Indexes that must exist once all the migrations above have run, checked by dbManager.verifySchema
+schemaIndexes = [
+    'idx_purchases_user_datetime',
+    'idx_returns_user_datetime',
+    'idx_purchases_merchant_date',
+    'idx_returns_merchant_date',
+]
+
+# Conversion of a migrated database to the unified layout (see dbManager.convertToUnifiedLayout): purchases and returns
+# move into one transactions table with a compact is_return flag, and are kept as views over it (inserts included) so
+# the loaders, the ingest and the rollup keep working unchanged.
+unifiedLayout = [
+    """CREATE TABLE transactions (
+            user_id integer,
+            is_return int NOT NULL,
+            merchant_type_code int,
+            amount_cents int,
+            datetime text
+       );""",
+    """INSERT INTO transactions (user_id, is_return, merchant_type_code, amount_cents, datetime)
+       SELECT user_id, 0, merchant_type_code, amount_cents, datetime FROM purchases
+       UNION ALL
+       SELECT user_id, 1, merchant_type_code, amount_cents, datetime FROM returns
+       ORDER BY 1, 5;""",
+    """DROP TABLE purchases;""",
+    """DROP TABLE returns;""",
+    """CREATE INDEX idx_transactions_user_datetime
+       ON transactions (user_id, datetime, amount_cents, merchant_type_code);""",
+    """CREATE INDEX idx_transactions_merchant_date
+       ON transactions (merchant_type_code, DATE(datetime), is_return, amount_cents);""",
+    """CREATE VIEW purchases AS
+       SELECT user_id, 'PurchaseActivity' AS transaction_type, merchant_type_code, amount_cents, datetime
+       FROM transactions WHERE is_return = 0;""",
+    """CREATE VIEW returns AS
+       SELECT user_id, 'ReturnActivity' AS transaction_type, merchant_type_code, amount_cents, datetime
+       FROM transactions WHERE is_return = 1;""",
+    """CREATE TRIGGER insert_purchase INSTEAD OF INSERT ON purchases
+       BEGIN
+           INSERT INTO transactions (user_id, is_return, merchant_type_code, amount_cents, datetime)
+           VALUES (NEW.user_id, 0, NEW.merchant_type_code, NEW.amount_cents, NEW.datetime);
+       END;""",
+    """CREATE TRIGGER insert_return INSTEAD OF INSERT ON returns
+       BEGIN
+           INSERT INTO transactions (user_id, is_return, merchant_type_code, amount_cents, datetime)
+           VALUES (NEW.user_id, 1, NEW.merchant_type_code, NEW.amount_cents, NEW.datetime);
+       END;""",
+]
+
+# Indexes of the unified layout, checked by dbManager.verifySchema instead of schemaIndexes
+unifiedIndexes = [
+    'idx_transactions_user_datetime',
+    'idx_transactions_merchant_date',
+]
+
+
 # Define an Enum class
 # Note: I konw that the common practice is to use Enums for repeated values, and even those most of these appear once in
 # code I think keeping them here makes the code more readable
@@ -31,17 +264,118 @@ class Constants(Enum):
     dbName = r"pythonsqlite.db"
     combined_transactions = "combined_transactions.csv"
 
+    # Most user IDs accepted by one /allByUser/batch request (each is bound twice, well under SQLite's variable limit)
+    maxBatchUsers = 1000
+
+    # /allByUser pagination: default and largest page size, rows fetched per chunk when streaming
+    defaultPageSize = 100
+    maxPageSize = 5000
+    streamFetchRows = 500
+
+    # /netMerchant/export: default granularity and format, rows fetched per streamed chunk
+    exportGranularity = "day"
+    exportFormat = "ndjson"
+    exportFetchRows = 5000
+
+    # asyncApp: threads running the blocking SQLite work, streamed chunks buffered ahead of a slow client
+    asyncWorkerThreads = 8
+    asyncStreamQueueChunks = 16
+
+    # Controller result cache: entries kept, their lifetime and how often the load generation is re-read
+    cacheMaxEntries = 10000
+    cacheTtlSeconds = 300
+    cacheGenerationCheckSeconds = 1
+
+    # Per-request stage timings (Server-Timing header) and the aggregated histograms on /metrics, see metrics.py, and
+    # how often each worker of the prefork server writes its share for the others to sum
+    metricsEnabled = True
+    metricsWriteSeconds = 1
+
+    # Query profiler (see queryProfiler.py): on at startup or not, slow query threshold, log file, and VM instructions
+    # between two calls of the progress handler
+    queryProfilerEnabled = False
+    slowQueryMs = 50
+    slowQueryLog = "slow_queries.jsonl"
+    profilerProgressSteps = 1000
+
+    # Cold start budget of a worker, enforced by tests/startup_test.py and measured by benchmarks/startupBenchmark.py:
+    # seconds to import main, resident memory after the first requests, modules that must stay off the serving path
+    startupImportBudgetSeconds = 0.5
+    startupRssBudgetMB = 50
+    startupLazyModules = ('pandas', 'numpy')
+
+    # Table layout dbInit builds: "split" (purchases and returns tables) or "unified" (one transactions table)
+    storageLayout = "split"
+
+    # Storage the lookups are answered from: "sqlite", "columnar" for the memory-mapped store in columnarDir, or
+    # "snapshot" for the shared memory snapshot published under snapshotName
+    storageBackend = "sqlite"
+    columnarDir = "columnar"
+    snapshotName = "kasheesh_snapshot"
+
+    # Production server (see server.py): listen address, worker processes (0 = one per CPU core), threads per worker,
+    # pending connections queue, keep-alive and request timeouts in seconds, grace period for workers on reload/stop
+    serverBind = "127.0.0.1:5000"
+    serverWorkers = 0
+    serverThreads = 4
+    serverBacklog = 2048
+    serverKeepAlive = 5
+    serverTimeout = 30
+    serverGracefulTimeout = 30
+
+    # Connection pool settings (see dbManager.ConnectionPool). mmap_size is in bytes, a negative cache_size is in KiB
+    poolMmapSize = 268435456
+    poolCacheSize = -65536
+    poolHealthCheckSeconds = 30
+    poolCachedStatements = 256
+    journalMode = "WAL"
+
     createPurchases = """ CREATE TABLE IF NOT EXISTS purchases (
-                                        user_id integer PRIMARY KEY,
+                                        user_id integer,
                                         transaction_type text,
                                         merchant_type_code int,
                                         amount_cents int,
                                         datetime text
                                     ); """
     createReturns = """CREATE TABLE IF NOT EXISTS returns (
-                                        user_id integer PRIMARY KEY,
+                                        user_id integer,
                                         transaction_type text,
                                         merchant_type_code int,
                                         amount_cents int,
                                         datetime text
                                 );"""
+
+    # Streaming CSV loader (see dbManager.loadTransactions): rows per executemany batch / transaction
+    loaderChunkRows = 100000
+    insertPurchase = "INSERT INTO purchases (user_id, transaction_type, merchant_type_code, amount_cents, datetime) " \
+                     "VALUES (?, ?, ?, ?, ?);"
+    insertReturn = "INSERT INTO returns (user_id, transaction_type, merchant_type_code, amount_cents, datetime) " \
+                   "VALUES (?, ?, ?, ?, ?);"
+
+    # Synthetic data (see dataGenerator.py): first day and length of the generated period, transactions per user on
+    # average, share of returns, Zipf exponents of user and merchant popularity
+    generatorStartDate = "2023-01-01"
+    generatorDays = 365
+    generatorRowsPerUser = 50
+    generatorReturnRatio = 0.035
+    generatorUserSkew = 0.6
+    generatorMerchantSkew = 1.2
+
+    getGeneration = "SELECT value FROM load_metadata WHERE key = 'generation';"
+    bumpGeneration = "UPDATE load_metadata SET value = value + 1 WHERE key = 'generation';"
+
+    # Incremental ingest (see dbManager.ingestTransactions): current watermark, ingest log entries, and the natural key
+    # lookups used to skip rows that are already loaded (served by the (user_id, datetime, ...) covering indexes)
+    getWatermark = "SELECT watermark FROM ingest_log WHERE watermark IS NOT NULL ORDER BY id DESC LIMIT 1;"
+    insertIngestLog = "INSERT INTO ingest_log (source, rows_read, rows_added, watermark) VALUES (?, ?, ?, ?);"
+    purchaseExists = "SELECT 1 FROM purchases WHERE user_id = ? AND datetime = ? AND amount_cents = ? " \
+                     "AND merchant_type_code = ? AND transaction_type = ? LIMIT 1;"
+    returnExists = "SELECT 1 FROM returns WHERE user_id = ? AND datetime = ? AND amount_cents = ? " \
+                   "AND merchant_type_code = ? AND transaction_type = ? LIMIT 1;"
+
+    # Adds a batch of per (merchant_type_code, date) totals onto the daily_merchant_net rollup
+    upsertDailyMerchantNet = """INSERT INTO daily_merchant_net (merchant_type_code, date, purchase_cents, return_cents)
+                                VALUES (?, ?, ?, ?)
+                                ON CONFLICT (merchant_type_code, date) DO UPDATE SET
+                                    purchase_cents = purchase_cents + excluded.purchase_cents,
+                                    return_cents = return_cents + excluded.return_cents;"""
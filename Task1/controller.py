@@ -1,47 +1,417 @@
-from constants import getAllByUsersCall, getNetMerchantCall, Constants
-from dbManager import executeQuery
-from dataTransformer import allByUserTransform, netMerchantTransform
+import base64
+import json
+import time
 
+from constants import getAllByUsersCall, getAllByUsersBatchCall, getAllByUsersPageCall, getNetMerchantCall, \
+    getNetMerchantExportCall, Constants
+from cache import ResultCache
+from metrics import addRows, setCacheStatus, stage
+from dbManager import executeQuery, iterateQuery, getConnectionPool, getDataGeneration, getStorageLayout
+from dataTransformer import allByUserTransform, allByUserBatchTransform, allByUserPageTransform, \
+    allByUserStreamTransform, netMerchantTransform, netMerchantExportTransform
 
-def allByUser(userId: int) -> str:
+
+class QueryError(Exception):
+    """
+    Raised when the database query behind a response fails (executeQuery already reported why), so the request is
+    answered with an error instead of an empty result that would look valid, be tagged and be revalidated.
+    """
+
+
+# Database file the lookups are answered from, see setDatabase
+databaseFile = Constants.dbName.value
+
+# Final JSON of the cacheable lookups, dropped whenever the database's load generation changes
+resultCache = ResultCache(lambda: getDataGeneration(getConnectionPool(databaseFile)))
+
+# Storage allByUser and netMerchant are answered from, see setStorageBackend
+storageBackend = Constants.storageBackend.value
+_columnarStore = None
+_columnarGeneration = None
+_columnarCheckedAt = float('-inf')
+_snapshotReader = None
+_layout = None
+_layoutGeneration = None
+
+
+def setDatabase(database: str):
+    """
+    Selects the SQLite database file the lookups are answered from, Constants.dbName relative to the working
+    directory by default.
+
+    Args:
+        database (str): The file path of the SQLite database.
+    """
+
+    global databaseFile, _layout
+    databaseFile = database
+    _layout = None
+    resultCache.clear()
+
+
+def setStorageBackend(backend: str):
+    """
+    Selects the storage allByUser and netMerchant are answered from.
+
+    Args:
+        backend (str): "sqlite", "columnar" for the memory-mapped store built by columnarStore.buildColumnarStore, or
+            "snapshot" for the shared memory snapshot published by sharedSnapshot.SnapshotPublisher.
+
+    Raises:
+        ValueError: If the backend is unknown.
+    """
+
+    global storageBackend, _columnarStore, _snapshotReader
+    if backend not in ('sqlite', 'columnar', 'snapshot'):
+        raise ValueError(f"Unknown storage backend: {backend}")
+
+    storageBackend = backend
+    _columnarStore = None
+    _snapshotReader = None
+    resultCache.clear()
+
+
+def getColumnarStore():
+    """
+    Returns the columnar store, reopening it whenever the database's load generation changes so a rebuilt store
+    is picked up. While the store lags behind the database it is reopened at most once per
+    Constants.cacheGenerationCheckSeconds, until a rebuild catches up.
+    """
+
+    global _columnarStore, _columnarGeneration, _columnarCheckedAt
+    generation = resultCache.generation()
+    now = time.monotonic()
+    stale = _columnarStore is not None and _columnarStore.generation != generation and \
+        now - _columnarCheckedAt >= Constants.cacheGenerationCheckSeconds.value
+    if _columnarStore is None or _columnarGeneration != generation or stale:
+        # numpy is only needed by this backend
+        from columnarStore import ColumnarStore
+        _columnarStore = ColumnarStore(Constants.columnarDir.value)
+        _columnarGeneration = generation
+        _columnarCheckedAt = now
+    return _columnarStore
+
+
+def getSnapshotTables():
+    """
+    Returns the tables of the current shared memory snapshot, following the publisher to every new snapshot.
+    """
+
+    global _snapshotReader
+    if _snapshotReader is None:
+        # numpy is only needed by this backend
+        from sharedSnapshot import SnapshotReader
+        _snapshotReader = SnapshotReader(Constants.snapshotName.value)
+    return _snapshotReader.tables()
+
+
+def servedTables():
+    """
+    Returns the tables allByUser and netMerchant are answered from: the columnar store or the shared memory snapshot
+    depending on the storage backend, or None when they are answered from SQLite. A store built from another load
+    generation than the database's is not served.
+    """
+
+    if storageBackend == 'columnar':
+        tables = getColumnarStore()
+    elif storageBackend == 'snapshot':
+        tables = getSnapshotTables()
+    else:
+        return None
+
+    # an ingest without rebuilding the store (or before the snapshot is republished) leaves it behind the database,
+    # SQLite answers until the store catches up
+    return tables if tables.generation == resultCache.generation() else None
+
+
+def isUnified() -> bool:
+    """
+    Returns whether the database uses the unified transactions table (see dbManager.convertToUnifiedLayout), looking
+    the layout up again whenever the database's load generation changes.
+    """
+
+    global _layout, _layoutGeneration
+    generation = resultCache.generation()
+    if _layout is None or _layoutGeneration != generation:
+        try:
+            _layout = getStorageLayout(getConnectionPool(databaseFile).getConnection())
+            _layoutGeneration = generation
+        except Exception as e:
+            # the lookup query then fails and reports the error itself
+            print("An error occurred:", str(e))
+            return False
+    return _layout == 'unified'
+
+
+def dataGeneration():
+    """
+    Returns the load generation of the data served by the endpoints, without querying the database more than once
+    per Constants.cacheGenerationCheckSeconds. With the columnar or snapshot backend the generation the served store
+    was built from is included, since the store is rebuilt separately and can lag behind the database.
+
+    Returns:
+        The load generation (a [database, store] pair for the columnar and snapshot backends), or None if the
+        database does not record one.
+    """
+
+    generation = resultCache.generation()
+    tables = servedTables()
+    if generation is None or tables is None:
+        return generation
+    return [generation, tables.generation]
+
+
+def allByUser(userId: int, start: str = None, end: str = None) -> str:
     """
     Retrieves all transactions associated with a given user ID from the database.
 
     Args:
         userId (int): The ID of the user.
+        start (str): Only transactions at or after this ISO 8601 date or datetime (see payloads.parseRange).
+        end (str): Only transactions before this ISO 8601 date or datetime.
 
     Returns:
         str: JSON representation of the retrieved transactions.
+
+    Raises:
+        QueryError: If the query fails.
     """
 
-    # Parse query with userID
-    query = getAllByUsersCall(userId)
-    # Execute the query against the SQL table
-    res = executeQuery(query, Constants.dbName.value)
+    # entries computed from a columnar store or snapshot only match while that store is the one answering
+    tables = servedTables()
+    cacheKey = ('allByUser', userId, start, end, None if tables is None else tables.generation)
+    # read before computing, a result finishing after a reload is not cached under the new generation
+    generation = resultCache.generation()
+    json_data = resultCache.get(cacheKey)
+    setCacheStatus('miss' if json_data is None else 'hit')
+    if json_data is not None:
+        return json_data
+
+    if tables is not None:
+        with stage('db'):
+            res = tables.userTransactions(userId, start, end)
+        addRows(len(res))
+    else:
+        # Execute the query against the SQL table with the user ID and the range bound
+        query = getAllByUsersCall(isUnified(), start is not None, end is not None)
+        res = executeQuery(query, databaseFile, getConnectionPool(databaseFile),
+                           {'user_id': userId, 'start': start, 'end': end})
+
+    if res is None:
+        raise QueryError("Database query failed.")
 
     # Parse data accordingly
     json_data = allByUserTransform(res)
 
+    resultCache.put(cacheKey, json_data, generation)
+
     return json_data
 
 
-def netMerchant(merchantTypeCode: int) -> str:
+def encodeCursor(datetime: str, src: int, rid: int) -> str:
+    """
+    Encode the position of a transaction in a user's history as an opaque pagination cursor.
+    """
+    raw = json.dumps([datetime, src, rid], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decodeCursor(cursor: str) -> tuple:
+    """
+    Decode a cursor made by encodeCursor back into its (datetime, src, rid) position.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        datetime, src, rid = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid JSON payload: 'cursor' is not a valid cursor.")
+    if not isinstance(datetime, str) or type(src) is not int or type(rid) is not int:
+        raise ValueError("Invalid JSON payload: 'cursor' is not a valid cursor.")
+    return datetime, src, rid
+
+
+def allByUserPage(userId: int, limit: int, cursor: str = None, start: str = None, end: str = None) -> str:
+    """
+    Retrieves one page of a user's transactions ordered by datetime, using keyset pagination so every page costs
+    the same no matter how deep into the history it is.
+
+    Args:
+        userId (int): The ID of the user.
+        limit (int): The maximum number of transactions in the page.
+        cursor (str): The next_cursor of the previous page, or None for the first page.
+        start (str): Only transactions at or after this ISO 8601 date or datetime.
+        end (str): Only transactions before this ISO 8601 date or datetime.
+
+    Returns:
+        str: JSON object with the page's transactions and the cursor of the next page.
+
+    Raises:
+        QueryError: If the query fails.
+    """
+
+    cacheKey = ('allByUserPage', userId, limit, cursor, start, end)
+    # read before computing, a result finishing after a reload is not cached under the new generation
+    generation = resultCache.generation()
+    json_data = resultCache.get(cacheKey)
+    setCacheStatus('miss' if json_data is None else 'hit')
+    if json_data is not None:
+        return json_data
+
+    # Start before every transaction when there is no cursor
+    datetime, src, rid = decodeCursor(cursor) if cursor else ('', -1, -1)
+    # and never before the start of the range
+    if start is not None and start > datetime:
+        datetime, src, rid = start, -1, -1
+
+    # Fetch one extra row to know if there is a next page
+    params = {'user_id': userId, 'datetime': datetime, 'src': src, 'rid': rid, 'limit': limit + 1, 'end': end}
+    query = getAllByUsersPageCall(isUnified(), end is not None)
+    res = executeQuery(query, databaseFile, getConnectionPool(databaseFile), params)
+    if res is None:
+        raise QueryError("Database query failed.")
+
+    page = res[:limit]
+    nextCursor = None
+    if len(res) > limit:
+        last = page[-1]
+        nextCursor = encodeCursor(last[2], last[4], last[5])
+
+    # Parse data accordingly, without the ordering columns
+    json_data = allByUserPageTransform([row[:4] for row in page], nextCursor)
+
+    resultCache.put(cacheKey, json_data, generation)
+
+    return json_data
+
+
+def allByUserStream(userId: int, start: str = None, end: str = None):
+    """
+    Streams all transactions of a user as a JSON array, reading the rows in batches so memory per request stays
+    bounded however long the history is.
+
+    Args:
+        userId (int): The ID of the user.
+        start (str): Only transactions at or after this ISO 8601 date or datetime.
+        end (str): Only transactions before this ISO 8601 date or datetime.
+
+    Yields:
+        str: Consecutive pieces of the JSON array.
+    """
+
+    query = getAllByUsersCall(isUnified(), start is not None, end is not None)
+    batches = iterateQuery(query, getConnectionPool(databaseFile),
+                           {'user_id': userId, 'start': start, 'end': end})
+
+    yield from allByUserStreamTransform(batches)
+
+
+def allByUserBatch(userIds: list) -> str:
+    """
+    Retrieves the transactions of several users with a single query.
+
+    Args:
+        userIds (list): The IDs of the users.
+
+    Returns:
+        str: JSON object mapping each user ID to its transactions.
+
+    Raises:
+        QueryError: If the query fails.
+    """
+
+    # Duplicates would only be fetched twice
+    userIds = list(dict.fromkeys(userIds))
+
+    # Pad the IDs to the next power of two by repeating the last one (harmless in an IN-list), so only a handful of
+    # distinct statements are ever prepared
+    bucket = 1 << (len(userIds) - 1).bit_length()
+    params = userIds + userIds[-1:] * (bucket - len(userIds))
+
+    # Parse the query with one placeholder per user and bind the IDs for both tables (once for the unified table)
+    unified = isUnified()
+    query = getAllByUsersBatchCall(bucket, unified)
+    res = executeQuery(query, databaseFile, getConnectionPool(databaseFile),
+                       tuple(params) if unified else tuple(params) * 2)
+    if res is None:
+        raise QueryError("Database query failed.")
+
+    # Parse data accordingly
+    json_data = allByUserBatchTransform(res, userIds)
+
+    return json_data
+
+
+def netMerchant(merchantTypeCode: int, start: str = None, end: str = None) -> str:
     """
     Calculates the net amount of transactions for a specific merchant type from the database.
 
     Args:
         merchantTypeCode (int): The code representing the merchant type.
+        start (str): Only days from this date on (YYYY-MM-DD).
+        end (str): Only days before this date (YYYY-MM-DD).
 
     Returns:
         str: JSON representation of the calculated net amount of transactions.
+
+    Raises:
+        QueryError: If the query fails.
     """
 
-    # Parse query with userID
-    query = getNetMerchantCall(merchantTypeCode)
-    # Execute the query against the SQL table
-    res = executeQuery(query, Constants.dbName.value)
+    # entries computed from a columnar store or snapshot only match while that store is the one answering
+    tables = servedTables()
+    cacheKey = ('netMerchant', merchantTypeCode, start, end, None if tables is None else tables.generation)
+    # read before computing, a result finishing after a reload is not cached under the new generation
+    generation = resultCache.generation()
+    json_data = resultCache.get(cacheKey)
+    setCacheStatus('miss' if json_data is None else 'hit')
+    if json_data is not None:
+        return json_data
+
+    if tables is not None:
+        with stage('db'):
+            res = tables.merchantNet(merchantTypeCode, start, end)
+        addRows(len(res))
+    else:
+        # Execute the query against the SQL table with the merchant type code and the range bound
+        query = getNetMerchantCall(start is not None, end is not None)
+        res = executeQuery(query, databaseFile, getConnectionPool(databaseFile),
+                           {'merchant_type_code': merchantTypeCode, 'start': start, 'end': end})
+
+    if res is None:
+        raise QueryError("Database query failed.")
 
     # Parse data accordingly
     json_data = netMerchantTransform(res)
 
+    resultCache.put(cacheKey, json_data, generation)
+
     return json_data
+
+
+def netMerchantExport(granularity: str = Constants.exportGranularity.value,
+                      exportFormat: str = Constants.exportFormat.value, start: str = None, end: str = None,
+                      database: str = None):
+    """
+    Streams the net amounts of every merchant type per period, computed in one grouped pass instead of one
+    netMerchant lookup per merchant type. Rows are read in batches, so memory stays bounded however large the export.
+
+    Args:
+        granularity (str): 'hour', 'day', 'week' or 'month'. Weeks start on Monday, periods are named by their start.
+        exportFormat (str): 'ndjson' or 'csv'.
+        start (str): Only periods from this date on (datetime for hours).
+        end (str): Only periods before this date (datetime for hours).
+        database (str): The file path of the SQLite database, the one selected by setDatabase if omitted.
+
+    Yields:
+        str: Consecutive pieces of the export.
+    """
+
+    pool = getConnectionPool(database or databaseFile)
+    # only hours are read from the transactions themselves
+    unified = granularity == 'hour' and getStorageLayout(pool.getConnection()) == 'unified'
+    query = getNetMerchantExportCall(granularity, unified, start is not None, end is not None)
+    batches = iterateQuery(query, pool, {'start': start, 'end': end}, Constants.exportFetchRows.value)
+
+    yield from netMerchantExportTransform(batches, exportFormat)
@@ -0,0 +1,178 @@
+"""
+Deterministic synthetic transactions for scale testing, with the columns of the combined transactions CSV
+(user_id, transaction_type, merchant_type_code, amount_cents, datetime).
+
+The same seed always gives the same rows. The rows are generated one day at a time in datetime order and handed out in
+bounded chunks, so any size (10^4 to 10^8 rows and beyond) streams to a CSV or into a database in constant memory.
+They are shaped like real card activity:
+    - a few users and merchant types account for most transactions (Zipfian popularity),
+    - amounts are log-normal around a typical ticket size of each merchant type,
+    - a fixed share of the transactions are returns,
+    - volume follows the time of day, the day of the week and the season (busier weekends and year end).
+
+    python dataGenerator.py --rows 1000000 --csv combined_transactions.csv
+    python dataGenerator.py --rows 10000000 --database large.db
+"""
+import argparse
+import csv
+import math
+
+import numpy as np
+
+import dbManager
+from constants import Constants
+
+# Merchant category codes the generated transactions use
+_merchantCodes = [5732, 4829, 7298, 5310, 6513, 5942, 4900, 5311, 5300, 5947, 5200, 5411, 5812, 5814, 5541, 5912,
+                  5999, 4121, 5691, 5651, 7832, 5921, 4814, 5045, 5722, 5977, 7230, 8011, 5661, 5331]
+
+# Relative volume per hour of the day: quiet nights, lunch and evening peaks
+_hourWeights = np.array([0.2, 0.1, 0.1, 0.1, 0.1, 0.2, 0.4, 0.7, 1.0, 1.1, 1.2, 1.4,
+                         1.7, 1.6, 1.3, 1.2, 1.3, 1.5, 1.8, 1.9, 1.7, 1.3, 0.8, 0.4])
+
+# Relative volume per day of the week, Monday first
+_weekdayWeights = np.array([0.9, 0.9, 0.95, 1.0, 1.15, 1.3, 1.2])
+
+_microsecondsPerHour = 3600 * 10 ** 6
+
+
+def _zipfCumulative(count: int, exponent: float) -> np.ndarray:
+    """
+    Cumulative probabilities of ranks 1..count with P(rank r) proportional to 1 / r ** exponent.
+    """
+    cumulative = np.cumsum(1.0 / np.arange(1, count + 1) ** exponent)
+    return cumulative / cumulative[-1]
+
+
+def _draw(cumulative: np.ndarray, rng, count: int) -> np.ndarray:
+    return np.minimum(np.searchsorted(cumulative, rng.random(count), side='right'), len(cumulative) - 1)
+
+
+def _dailyCounts(rows: int, startDate: str, days: int) -> np.ndarray:
+    """
+    Split the rows over the days by weekday and season, keeping the total exact (largest remainders get the rest).
+    """
+    dates = np.datetime64(startDate, 'D') + np.arange(days)
+    weekdays = (dates.astype('int64') + 3) % 7
+    dayOfYear = (dates - dates.astype('datetime64[Y]')).astype('int64')
+    # peak around the last week of the year, trough in summer
+    season = 1 + 0.15 * np.cos(2 * math.pi * (dayOfYear - 358) / 365.25)
+    weights = _weekdayWeights[weekdays] * season
+
+    exact = rows * weights / weights.sum()
+    counts = np.floor(exact).astype(np.int64)
+    remainder = rows - int(counts.sum())
+    counts[np.argsort(counts - exact, kind='stable')[:remainder]] += 1
+    return counts
+
+
+def generateTransactions(rows: int, seed: int = 0, chunkRows: int = Constants.loaderChunkRows.value,
+                         startDate: str = Constants.generatorStartDate.value, days: int = Constants.generatorDays.value,
+                         users: int = None, returnRatio: float = Constants.generatorReturnRatio.value,
+                         userSkew: float = Constants.generatorUserSkew.value,
+                         merchantSkew: float = Constants.generatorMerchantSkew.value):
+    """
+    Generate synthetic transactions in datetime order.
+
+    Args:
+        rows (int): Number of transactions.
+        seed (int): Seed of the generator, the rows only depend on it and the other arguments (not on chunkRows).
+        chunkRows (int): Most rows per yielded chunk.
+        startDate (str): First day of the period, YYYY-MM-DD.
+        days (int): Length of the period in days.
+        users (int): Number of distinct users, rows / Constants.generatorRowsPerUser by default.
+        returnRatio (float): Share of the transactions that are returns.
+        userSkew (float): Zipf exponent of the user popularity.
+        merchantSkew (float): Zipf exponent of the merchant type popularity.
+
+    Yields:
+        list: (user_id, transaction_type, merchant_type_code, amount_cents, datetime) tuples.
+    """
+    setup = np.random.default_rng([seed, 0])
+
+    # Popularity ranks are assigned to random user IDs and merchant types. Every rank owns a block of 7 IDs, so the
+    # IDs are unique without materializing a larger ID space.
+    userCount = users or max(1, rows // Constants.generatorRowsPerUser.value)
+    userIds = setup.permutation(userCount) * 7 + setup.integers(1, 8, userCount)
+    merchants = setup.permutation(np.array(_merchantCodes, dtype=np.int64))
+    # typical ticket of each merchant type, around $30
+    medians = np.exp(setup.normal(math.log(3000), 0.9, len(merchants)))
+
+    userCumulative = _zipfCumulative(userCount, userSkew)
+    merchantCumulative = _zipfCumulative(len(merchants), merchantSkew)
+    hourCumulative = np.cumsum(_hourWeights) / _hourWeights.sum()
+
+    start = np.datetime64(startDate, 'D')
+    chunk = []
+    for day, count in enumerate(_dailyCounts(rows, startDate, days)):
+        if count == 0:
+            continue
+        # one stream per day, so a day's rows do not depend on how the others were drawn
+        rng = np.random.default_rng([seed, 1, day])
+        count = int(count)
+
+        offsets = np.sort(_draw(hourCumulative, rng, count) * _microsecondsPerHour +
+                          rng.integers(0, _microsecondsPerHour, count))
+        datetimes = (start + day + offsets.astype('timedelta64[us]')).astype(str)
+
+        merchant = _draw(merchantCumulative, rng, count)
+        amounts = np.clip(np.rint(medians[merchant] * rng.lognormal(0.0, 0.75, count)), 100, 10 ** 7)
+        kinds = np.where(rng.random(count) < returnRatio, 'ReturnActivity', 'PurchaseActivity')
+
+        chunk.extend(zip(userIds[_draw(userCumulative, rng, count)].tolist(), kinds.tolist(),
+                         merchants[merchant].tolist(), amounts.astype(np.int64).tolist(), datetimes.tolist()))
+        while len(chunk) >= chunkRows:
+            yield chunk[:chunkRows]
+            chunk = chunk[chunkRows:]
+
+    if chunk:
+        yield chunk
+
+
+def writeCsv(path: str, chunks) -> int:
+    """
+    Write chunks of transactions to a CSV file laid out like the combined transactions CSV.
+
+    Args:
+        path (str): Path of the CSV file.
+        chunks (iterable): Chunks of transaction rows, e.g. from generateTransactions.
+
+    Returns:
+        int: The number of rows written.
+    """
+    written = 0
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['user_id', 'transaction_type', 'merchant_type_code', 'amount_cents', 'datetime'])
+        for chunk in chunks:
+            writer.writerows(chunk)
+            written += len(chunk)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, required=True)
+    parser.add_argument('--seed', type=int, default=0)
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument('--csv', help="write a combined transactions CSV")
+    output.add_argument('--database', help="build a SQLite database like dbManager.dbInit does")
+    parser.add_argument('--users', type=int, default=None)
+    parser.add_argument('--start-date', default=Constants.generatorStartDate.value)
+    parser.add_argument('--days', type=int, default=Constants.generatorDays.value)
+    parser.add_argument('--return-ratio', type=float, default=Constants.generatorReturnRatio.value)
+    parser.add_argument('--chunk-rows', type=int, default=Constants.loaderChunkRows.value)
+    parser.add_argument('--layout', choices=['split', 'unified'], default=Constants.storageLayout.value,
+                        help="table layout of the --database")
+    args = parser.parse_args()
+
+    chunks = generateTransactions(args.rows, args.seed, args.chunk_rows, args.start_date, args.days, args.users,
+                                  args.return_ratio)
+    if args.csv:
+        print(f"Wrote {writeCsv(args.csv, chunks)} rows to {args.csv}")
+    else:
+        dbManager.dbInit(database=args.database, transactions=chunks, layout=args.layout)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,66 @@
-import pandas as pd
+import json
 
+from metrics import timedStage
 
+# Largest amount (in cents) the fast encoder formats itself, pandas switches to exponent notation further up
+_maxFastCents = 10 ** 15
+
+
+class _Unsupported(Exception):
+    """
+    Raised by the fast encoder for values it cannot render exactly like pandas, which then does the encoding.
+    """
+
+
+def _encodeValue(value) -> str:
+    # bool is an int subclass, but pandas renders it as true/false
+    if type(value) is int:
+        if not -2 ** 63 <= value < 2 ** 63:
+            raise _Unsupported()
+        return str(value)
+    if type(value) is str:
+        # pandas escapes '/' and leaves DEL unescaped, everything else matches json.dumps
+        if '\x7f' in value:
+            raise _Unsupported()
+        return json.dumps(value).replace('/', '\\/')
+    raise _Unsupported()
+
+
+def _encodeDollars(cents) -> str:
+    # pandas writes floats with 10 decimals and trailing zeros stripped, which repr() does not always match
+    if type(cents) is not int or abs(cents) >= _maxFastCents:
+        raise _Unsupported()
+    text = '%.10f' % (cents / 100)
+    text = text.rstrip('0')
+    return text + '0' if text.endswith('.') else text
+
+
+def _recordsToJson(res: list, columns: list, centsColumn: str, dollarsColumn: str) -> str:
+    """
+    Encode query rows as a JSON array of records straight from the tuples, replacing the cents column with a dollars
+    column appended at the end. The output is byte-identical to building a DataFrame and calling
+    to_json(orient='records') on it.
+
+    Raises:
+        _Unsupported: If a value needs the pandas encoder (None, floats, bools, ...).
+    """
+    if not res:
+        return '[]'
+
+    centsIndex = columns.index(centsColumn)
+    fields = [(index, json.dumps(column) + ':') for index, column in enumerate(columns) if index != centsIndex]
+    dollarsKey = json.dumps(dollarsColumn) + ':'
+
+    records = []
+    for row in res:
+        parts = [key + _encodeValue(row[index]) for index, key in fields]
+        parts.append(dollarsKey + _encodeDollars(row[centsIndex]))
+        records.append('{' + ','.join(parts) + '}')
+
+    return '[' + ','.join(records) + ']'
+
+
+@timedStage('transform')
 def allByUserTransform(res: list) -> str:
     """
     Transforms the result of a database query into JSON representation for allByUser function.
@@ -22,13 +82,22 @@ def allByUserTransform(res: list) -> str:
                                     '{"user_id":1,"datetime":"2023-06-03 10:00:00","merchant_type_code":789,"amount_in_dollars":30.0}]'
     """
 
-    df = pd.DataFrame(res, columns=['user_id', 'amount_cents', 'datetime', 'merchant_type_code'])
+    columns = ['user_id', 'amount_cents', 'datetime', 'merchant_type_code']
+    try:
+        return _recordsToJson(res, columns, 'amount_cents', 'amount_in_dollars')
+    except _Unsupported:
+        pass
+
+    # pandas is only imported for the rare rows the fast encoder cannot render, it is slow to import
+    import pandas as pd
+    df = pd.DataFrame(res, columns=columns)
     df['amount_in_dollars'] = df['amount_cents'] / 100
     df.drop('amount_cents', axis=1, inplace=True)
 
     return df.to_json(orient='records')
 
 
+@timedStage('transform')
 def netMerchantTransform(res: list) -> str:
     """
     Transforms the result of a database query into JSON representation for netMerchant function.
@@ -50,9 +119,136 @@ def netMerchantTransform(res: list) -> str:
                                       '{"date":"2023-06-03","merchant_type_code":123,"net_amount_in_dollars":20.0}]'
     """
 
-    df = pd.DataFrame(res, columns=['date', 'net_amount_in_cents', 'merchant_type_code'])
+    columns = ['date', 'net_amount_in_cents', 'merchant_type_code']
+    try:
+        return _recordsToJson(res, columns, 'net_amount_in_cents', 'net_amount_in_dollars')
+    except _Unsupported:
+        pass
+
+    # pandas is only imported for the rare rows the fast encoder cannot render, it is slow to import
+    import pandas as pd
+    df = pd.DataFrame(res, columns=columns)
     df['net_amount_in_dollars'] = df['net_amount_in_cents'] / 100
     df.drop('net_amount_in_cents', axis=1, inplace=True)
 
     return df.to_json(orient='records')
 
+
+@timedStage('transform')
+def allByUserBatchTransform(res: list, userIds: list) -> str:
+    """
+    Transforms the result of a batched allByUser query into a JSON object holding each user's transactions.
+
+    Args:
+        res (list): The result of the database query, a list of tuples representing transaction records.
+        userIds (list): The requested user IDs, every one of them gets a key even if it has no transactions.
+
+    Returns:
+        str: JSON object mapping each user ID to the JSON representation allByUserTransform gives for it.
+
+    Example:
+        res = [
+            (1, 1000, '2023-06-01 10:00:00', 123),
+            (2, 2000, '2023-06-02 10:00:00', 456)
+        ]
+        allByUserBatchTransform(res, [1, 2, 3]) -> '{"1":[{"user_id":1,"datetime":"2023-06-01 10:00:00",'
+                                                   '"merchant_type_code":123,"amount_in_dollars":10.0}],'
+                                                   '"2":[{"user_id":2,"datetime":"2023-06-02 10:00:00",'
+                                                   '"merchant_type_code":456,"amount_in_dollars":20.0}],'
+                                                   '"3":[]}'
+    """
+
+    groups = {userId: [] for userId in userIds}
+    for row in res or []:
+        groups.setdefault(row[0], []).append(row)
+
+    return '{' + ','.join(json.dumps(str(userId)) + ':' + allByUserTransform(rows)
+                          for userId, rows in groups.items()) + '}'
+
+
+@timedStage('transform')
+def allByUserPageTransform(res: list, nextCursor: str) -> str:
+    """
+    Transforms one page of a user's transactions into a JSON object holding the page and the cursor of the next one.
+
+    Args:
+        res (list): The transaction records of the page, as accepted by allByUserTransform.
+        nextCursor (str): Opaque cursor for the next page, or None if this is the last page.
+
+    Returns:
+        str: JSON object with the page under "transactions" and the cursor under "next_cursor".
+
+    Example:
+        res = [
+            (1, 1000, '2023-06-01 10:00:00', 123)
+        ]
+        allByUserPageTransform(res, None) -> '{"transactions":[{"user_id":1,"datetime":"2023-06-01 10:00:00",'
+                                             '"merchant_type_code":123,"amount_in_dollars":10.0}],'
+                                             '"next_cursor":null}'
+    """
+
+    return '{"transactions":' + allByUserTransform(res) + ',"next_cursor":' + json.dumps(nextCursor) + '}'
+
+
+def allByUserStreamTransform(batches):
+    """
+    Transforms batches of transaction records into consecutive pieces of one JSON array, for streamed responses.
+    Joined together the pieces are the same JSON allByUserTransform gives for all the records at once.
+
+    Args:
+        batches (iterable): Lists of transaction records, as accepted by allByUserTransform.
+
+    Yields:
+        str: The next piece of the JSON array.
+
+    Raises:
+        Exception: Whatever batches raises (e.g. a failed query, see dbManager.iterateQuery), before the array is
+            closed, so a stream cut short never reads as a complete JSON array.
+    """
+
+    yield '['
+    separator = ''
+    for batch in batches:
+        records = allByUserTransform(batch)[1:-1]
+        if records:
+            yield separator + records
+            separator = ','
+    # only reached once every batch was read
+    yield ']'
+
+
+def _dollars(cents) -> str:
+    try:
+        return _encodeDollars(cents)
+    except _Unsupported:
+        return repr(cents / 100)
+
+
+def netMerchantExportTransform(batches, exportFormat: str = 'ndjson'):
+    """
+    Transforms batches of exported net amounts into consecutive pieces of an NDJSON (one JSON object per line) or
+    CSV document, for streamed responses and files.
+
+    Args:
+        batches (iterable): Lists of (merchant_type_code, period, net_amount_in_cents) tuples.
+        exportFormat (str): 'ndjson' or 'csv'.
+
+    Yields:
+        str: The next piece of the document, one per batch (plus the header line for CSV).
+
+    Example:
+        batches = [[(123, '2023-06-01', 5000), (123, '2023-06-02', -250)]]
+        netMerchantExportTransform(batches) -> '{"merchant_type_code":123,"period":"2023-06-01","net_amount_in_dollars":50.0}\n'
+                                               '{"merchant_type_code":123,"period":"2023-06-02","net_amount_in_dollars":-2.5}\n'
+        netMerchantExportTransform(batches, 'csv') -> 'merchant_type_code,period,net_amount_in_dollars\n',
+                                                      '123,2023-06-01,50.0\n123,2023-06-02,-2.5\n'
+    """
+
+    if exportFormat == 'csv':
+        yield 'merchant_type_code,period,net_amount_in_dollars\n'
+        for batch in batches:
+            yield ''.join(f'{merchant},{period},{_dollars(cents)}\n' for merchant, period, cents in batch)
+    else:
+        for batch in batches:
+            yield ''.join(f'{{"merchant_type_code":{merchant},"period":{json.dumps(period)},'
+                          f'"net_amount_in_dollars":{_dollars(cents)}}}\n' for merchant, period, cents in batch)
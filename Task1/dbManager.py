@@ -1,7 +1,20 @@
-import pandas as pd
+import csv
+import os
+import threading
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
 import sqlite3
 from sqlite3 import Error
-from constants import Constants
+from typing import TYPE_CHECKING
+from constants import Constants, schemaMigrations, schemaIndexes, unifiedLayout, unifiedIndexes
+from metrics import addRows, timedStage
+from queryProfiler import QueryProfiler
+
+if TYPE_CHECKING:
+    # only for annotations: pandas takes hundreds of milliseconds to import and the serving path never needs it
+    import pandas as pd
 
 
 def create_connection(db_file):
@@ -27,6 +40,156 @@ def create_connection(db_file):
     return conn
 
 
+class ConnectionPool:
+    """
+    Keeps one long-lived SQLite connection per thread for a database file, so requests reuse an already parsed
+    schema and a warm page cache instead of reconnecting on every query.
+
+    Connections are opened through a read-only URI by default and are tuned with the mmap_size/cache_size pragmas.
+    The journal mode is persistent in the database file and needs write access to change, so it is only applied
+    by pools that are not read-only (dbInit sets it when the database is built).
+
+    Args:
+        database (str): The file path of the SQLite database.
+        readOnly (bool): Open the connections with mode=ro.
+        mmapSize (int): Value for PRAGMA mmap_size, in bytes.
+        cacheSize (int): Value for PRAGMA cache_size (negative values are KiB).
+        journalMode (str): Value for PRAGMA journal_mode, only used when readOnly is False.
+        healthCheckSeconds (float): Minimum time between two liveness checks of a connection.
+        cachedStatements (int): Size of each connection's prepared statement cache.
+    """
+
+    def __init__(self, database: str, readOnly: bool = True, mmapSize: int = Constants.poolMmapSize.value,
+                 cacheSize: int = Constants.poolCacheSize.value, journalMode: str = Constants.journalMode.value,
+                 healthCheckSeconds: float = Constants.poolHealthCheckSeconds.value,
+                 cachedStatements: int = Constants.poolCachedStatements.value):
+        self.database = database
+        self.readOnly = readOnly
+        self.mmapSize = mmapSize
+        self.cacheSize = cacheSize
+        self.journalMode = journalMode
+        self.healthCheckSeconds = healthCheckSeconds
+        self.cachedStatements = cachedStatements
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._pid = os.getpid()
+
+    def _connect(self) -> sqlite3.Connection:
+        uri = Path(self.database).resolve().as_uri()
+        if self.readOnly:
+            uri += "?mode=ro"
+
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=self.cachedStatements)
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmapSize)}")
+        conn.execute(f"PRAGMA cache_size = {int(self.cacheSize)}")
+        if not self.readOnly and self.journalMode:
+            conn.execute(f"PRAGMA journal_mode = {self.journalMode}")
+
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def _isHealthy(self, conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except Error:
+            return False
+
+    def getConnection(self) -> sqlite3.Connection:
+        """
+        Return the connection owned by the calling thread, opening it on first use and replacing it if it fails
+        its periodic health check.
+
+        Returns:
+            sqlite3.Connection: The pooled connection for this thread.
+        """
+        # Connections must not be shared with a forked child, start over with an empty pool
+        if self._pid != os.getpid():
+            self._local = threading.local()
+            self._connections = []
+            self._pid = os.getpid()
+
+        conn = getattr(self._local, 'conn', None)
+        now = time.monotonic()
+
+        if conn is not None and now - self._local.checkedAt >= self.healthCheckSeconds:
+            if not self._isHealthy(conn):
+                self.discard()
+                conn = None
+            else:
+                self._local.checkedAt = now
+
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.checkedAt = now
+
+        return conn
+
+    def markSuspect(self):
+        """
+        Force a health check of the calling thread's connection the next time it is borrowed, used after a query
+        on it failed.
+        """
+        if getattr(self._local, 'conn', None) is not None:
+            self._local.checkedAt = float('-inf')
+
+    def discard(self):
+        """
+        Close and forget the calling thread's connection.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+
+        self._local.conn = None
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        try:
+            conn.close()
+        except Error:
+            pass
+
+    def closeAll(self):
+        """
+        Close every connection opened by this pool, e.g. before the database file is rebuilt.
+        """
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Error:
+                pass
+        self._local = threading.local()
+
+
+_pools = {}
+_poolsLock = threading.Lock()
+
+
+def getConnectionPool(database: str) -> ConnectionPool:
+    """
+    Return the process wide connection pool for a database file, creating it on first use.
+
+    Args:
+        database (str): The file path of the SQLite database.
+
+    Returns:
+        ConnectionPool: The pool serving that database.
+    """
+    with _poolsLock:
+        pool = _pools.get(database)
+        if pool is None:
+            pool = ConnectionPool(database)
+            _pools[database] = pool
+        return pool
+
+
 def create_table(conn, create_table_sql):
     """
     Create a table in the SQLite database using the provided SQL statement.
@@ -49,7 +212,7 @@ def create_table(conn, create_table_sql):
         print(e)
 
 
-def generateDfPurchaseReturns(transactions: pd.DataFrame) -> [pd.DataFrame]:
+def generateDfPurchaseReturns(transactions: 'pd.DataFrame') -> ['pd.DataFrame']:
     """
     Generate DataFrames for purchases and returns from a combined transactions CSV file.
 
@@ -69,16 +232,495 @@ def generateDfPurchaseReturns(transactions: pd.DataFrame) -> [pd.DataFrame]:
     return purchases, returns
 
 
-def executeQuery(query: str, database: str) -> list:
+def _toInt(value: str):
+    return int(value) if value != '' else None
+
+
+def _readTransactionChunks(csvPath: str, chunkRows: int):
+    """
+    Read the combined transactions CSV in chunks of at most chunkRows rows, so only one chunk is ever in memory.
+
+    Yields:
+        list: (user_id, transaction_type, merchant_type_code, amount_cents, datetime) tuples.
+    """
+    with open(csvPath, newline='') as file:
+        reader = csv.reader(file)
+        header = next(reader)
+        user, kind, merchant, amount, date = (header.index(column) for column in
+                                              ('user_id', 'transaction_type', 'merchant_type_code', 'amount_cents',
+                                               'datetime'))
+
+        chunk = []
+        for row in reader:
+            chunk.append((_toInt(row[user]), row[kind], _toInt(row[merchant]), _toInt(row[amount]), row[date]))
+            if len(chunk) >= chunkRows:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def insertTransactions(conn, chunks) -> int:
+    """
+    Insert chunks of transaction rows into the purchases and returns tables. Every chunk is inserted with
+    executemany inside a single transaction, so load time grows linearly with the number of rows and memory stays
+    bounded by the chunk size.
+
+    The connection is switched to loader pragmas (no journal, no fsync) while loading. The caller is expected to
+    rebuild the file from scratch on failure and to set its own journal mode afterwards.
+
+    Args:
+        conn (sqlite3.Connection): A writable connection to the SQLite database.
+        chunks (iterable): Lists of (user_id, transaction_type, merchant_type_code, amount_cents, datetime) tuples.
+
+    Returns:
+        int: The number of rows loaded.
+    """
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.commit()
+
+    loaded = 0
+    start = time.perf_counter()
+
+    for chunk in chunks:
+        # rows with any other transaction type are skipped, like generateDfPurchaseReturns does
+        purchases = [row for row in chunk if row[1] == 'PurchaseActivity']
+        returns = [row for row in chunk if row[1] == 'ReturnActivity']
+
+        conn.execute("BEGIN")
+        conn.executemany(Constants.insertPurchase.value, purchases)
+        conn.executemany(Constants.insertReturn.value, returns)
+        conn.commit()
+
+        loaded += len(purchases) + len(returns)
+        elapsed = time.perf_counter() - start
+        print(f"Loaded {loaded} rows ({loaded / elapsed if elapsed else 0:.0f} rows/s)")
+
+    conn.execute("PRAGMA synchronous = NORMAL")
+
+    return loaded
+
+
+def loadTransactions(conn, csvPath: str, chunkRows: int = Constants.loaderChunkRows.value) -> int:
+    """
+    Stream the combined transactions CSV into the purchases and returns tables. The file is read in bounded chunks
+    and inserted with insertTransactions.
+
+    Args:
+        conn (sqlite3.Connection): A writable connection to the SQLite database.
+        csvPath (str): Path of the combined transactions CSV.
+        chunkRows (int): Number of rows read and inserted per batch.
+
+    Returns:
+        int: The number of rows loaded.
+    """
+    return insertTransactions(conn, _readTransactionChunks(csvPath, chunkRows))
+
+
+def migrateSchema(conn) -> int:
+    """
+    Bring the database up to the latest schema version by running every migration in constants.schemaMigrations
+    that has not been applied yet. Each migration runs in its own transaction together with the user_version bump,
+    so an interrupted migration is simply retried on the next call.
+
+    Args:
+        conn (sqlite3.Connection): A writable connection to the SQLite database.
+
+    Returns:
+        int: The schema version of the database after migrating.
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= len(schemaMigrations):
+        return version
+
+    # settle anything the caller left pending, a migration has to start its own transaction
+    conn.commit()
+
+    for number, statements in enumerate(schemaMigrations[version:], start=version + 1):
+        # explicit BEGIN, sqlite3 would otherwise run the DDL statements in autocommit mode
+        conn.execute("BEGIN")
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = number
+
+    # refresh the planner statistics so the new indexes actually get picked
+    conn.execute("ANALYZE")
+    conn.commit()
+
+    return version
+
+
+def getStorageLayout(conn) -> str:
+    """
+    Tell which table layout a database uses.
+
+    Args:
+        conn (sqlite3.Connection): The connection object to the SQLite database.
+
+    Returns:
+        str: "unified" if the transactions live in one transactions table, "split" for purchases and returns tables.
+    """
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transactions'").fetchone()
+    return 'unified' if row else 'split'
+
+
+def convertToUnifiedLayout(conn):
+    """
+    Move the purchases and returns tables of a migrated database into the unified transactions table (see
+    constants.unifiedLayout), in a single transaction. Does nothing if the database already uses it.
+
+    Args:
+        conn (sqlite3.Connection): A writable connection to the SQLite database.
+
+    Returns:
+        None
+    """
+    if getStorageLayout(conn) == 'unified':
+        return
+
+    conn.commit()
+    conn.execute("BEGIN")
+    try:
+        for statement in unifiedLayout:
+            conn.execute(statement)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    # give the pages of the dropped tables back, then plan with statistics of the new table
+    conn.execute("VACUUM")
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+def verifySchema(conn):
+    """
+    Check that the database is at the latest schema version and that all the expected indexes exist.
+
+    Args:
+        conn (sqlite3.Connection): The connection object to the SQLite database.
+
+    Returns:
+        None
+
+    Raises:
+        Exception: If the schema version is behind or an index is missing.
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version != len(schemaMigrations):
+        raise Exception(f"Schema version is {version}, expected {len(schemaMigrations)}.")
+
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    expected = unifiedIndexes if getStorageLayout(conn) == 'unified' else schemaIndexes
+    missing = [index for index in expected if index not in existing]
+    if missing:
+        raise Exception(f"Missing indexes: {', '.join(missing)}")
+
+
+def updateDailyMerchantNet(conn, transactions):
+    """
+    Add newly ingested transactions onto the daily_merchant_net rollup, so it stays current without a rebuild.
+    The caller owns the transaction, so the rollup and the raw rows can be committed together.
+
+    Args:
+        conn (sqlite3.Connection): A writable connection to the SQLite database.
+        transactions (iterable): (transaction_type, merchant_type_code, amount_cents, datetime) tuples.
+
+    Returns:
+        None
+    """
+    totals = {}
+    for transaction_type, merchant_type_code, amount_cents, datetime in transactions:
+        # the rollup is keyed on the same YYYY-MM-DD prefix SQLite's DATE() gives for the ISO timestamps
+        key = (merchant_type_code, datetime[:10])
+        purchase_cents, return_cents = totals.get(key, (0, 0))
+        if transaction_type == 'ReturnActivity':
+            return_cents += amount_cents
+        else:
+            purchase_cents += amount_cents
+        totals[key] = (purchase_cents, return_cents)
+
+    conn.executemany(Constants.upsertDailyMerchantNet.value,
+                     [(code, date, purchase, ret) for (code, date), (purchase, ret) in totals.items()])
+
+
+def bumpGeneration(conn):
+    """
+    Record that the data changed by bumping the load generation. The caller owns the transaction, so the bump
+    becomes visible together with the new rows.
+
+    Args:
+        conn (sqlite3.Connection): A writable connection to the SQLite database.
+
+    Returns:
+        None
+    """
+    conn.execute(Constants.bumpGeneration.value)
+
+
+def _isLoaded(conn, row: tuple) -> bool:
+    query = Constants.returnExists.value if row[1] == 'ReturnActivity' else Constants.purchaseExists.value
+    user_id, transaction_type, merchant_type_code, amount_cents, datetime = row
+    return conn.execute(query, (user_id, datetime, amount_cents, merchant_type_code, transaction_type)).fetchone() \
+        is not None
+
+
+def ingestTransactions(conn, csvPaths: list, dedupe: bool = False,
+                       chunkRows: int = Constants.loaderChunkRows.value) -> dict:
+    """
+    Append new transactions from CSV files to an existing database, in a single transaction, so the cost is
+    proportional to the new rows rather than to the whole history.
+
+    By default only rows from the stored watermark (the latest datetime loaded so far) on are applied, those at the
+    watermark itself only if their natural key (all five columns) is not loaded yet. Each file is compared to the
+    watermark the files before it left, the same as ingesting them one call each. With dedupe, every row whose
+    natural key is not loaded yet is applied instead, which also accepts late arriving rows. Either way the indexes
+    are maintained by SQLite, the daily_merchant_net rollup is updated incrementally, the new watermark and one
+    ingest_log entry per file are recorded and the load generation is bumped if anything was added, all committed
+    together.
+
+    Args:
+        conn (sqlite3.Connection): A writable connection to a database at the latest schema version.
+        csvPaths (list): Paths of the CSV files, laid out like the combined transactions CSV.
+        dedupe (bool): Skip rows by natural key instead of by watermark.
+        chunkRows (int): Number of rows read and inserted per batch.
+
+    Returns:
+        dict: 'read' and 'added' row counts and the new 'watermark'.
+
+    Raises:
+        Exception: If reading or inserting fails, nothing is applied then.
+    """
+    row = conn.execute(Constants.getWatermark.value).fetchone()
+    newest = row[0] if row else None
+    totalRead = totalAdded = 0
+
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # rows repeated within the files themselves are not loaded yet when they are checked
+        seen = set()
+        for csvPath in csvPaths:
+            read = added = 0
+            # every file is compared to the watermark left by the files before it, as if ingested one call each
+            fileWatermark = newest
+            for chunk in _readTransactionChunks(csvPath, chunkRows):
+                read += len(chunk)
+                rows = [row for row in chunk if row[1] in ('PurchaseActivity', 'ReturnActivity')]
+                if dedupe:
+                    new = []
+                    for row in rows:
+                        if row not in seen and not _isLoaded(conn, row):
+                            new.append(row)
+                        seen.add(row)
+                else:
+                    # more rows of the watermark's own instant can arrive later, those are checked by natural key
+                    new = []
+                    for row in rows:
+                        if fileWatermark is None or row[4] > fileWatermark:
+                            new.append(row)
+                        elif row[4] == fileWatermark:
+                            if row not in seen and not _isLoaded(conn, row):
+                                new.append(row)
+                            seen.add(row)
+
+                conn.executemany(Constants.insertPurchase.value, [row for row in new if row[1] == 'PurchaseActivity'])
+                conn.executemany(Constants.insertReturn.value, [row for row in new if row[1] == 'ReturnActivity'])
+                updateDailyMerchantNet(conn, [row[1:] for row in new])
+
+                added += len(new)
+                if new:
+                    latest = max(row[4] for row in new)
+                    newest = latest if newest is None else max(newest, latest)
+
+            conn.execute(Constants.insertIngestLog.value, (csvPath, read, added, newest))
+            totalRead += read
+            totalAdded += added
+
+        if totalAdded:
+            bumpGeneration(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return {'read': totalRead, 'added': totalAdded, 'watermark': newest}
+
+
+def getDataGeneration(pool: ConnectionPool):
+    """
+    Read the current load generation of the database.
+
+    Args:
+        pool (ConnectionPool): The pool providing the connection.
+
+    Returns:
+        int: The generation, or None if the database does not record one (e.g. it is not migrated yet).
+    """
+    try:
+        row = pool.getConnection().execute(Constants.getGeneration.value).fetchone()
+        return row[0] if row else None
+    except Error:
+        return None
+
+
+def migrateDatabase(database: str):
+    """
+    Migrate an existing database file to the latest schema version and verify the result.
+
+    Args:
+        database (str): The file path of the SQLite database.
+
+    Returns:
+        None
+    """
     try:
         conn = create_connection(database)
+        migrateSchema(conn)
+        verifySchema(conn)
+        conn.close()
+    except Exception as e:
+        print("An error occurred:", str(e))
+
+
+def warmDatabase(database: str):
+    """
+    Read the lookup indexes and the daily rollup once, so their pages are in the OS page cache (shared by every
+    process mapping the file) before the first request arrives.
+
+    Args:
+        database (str): The file path of the SQLite database.
+
+    Returns:
+        None
+    """
+    try:
+        conn = sqlite3.connect(Path(database).resolve().as_uri() + "?mode=ro", uri=True)
+        conn.execute(f"PRAGMA mmap_size = {int(Constants.poolMmapSize.value)}")
+        indexes = unifiedIndexes if getStorageLayout(conn) == 'unified' else schemaIndexes
+        for index in indexes:
+            table = index.split('_')[1]
+            conn.execute(f"SELECT count(*) FROM {table} INDEXED BY {index}").fetchone()
+        conn.execute("SELECT count(*), sum(purchase_cents) FROM daily_merchant_net").fetchone()
+        conn.close()
+    except Exception as e:
+        print("An error occurred:", str(e))
+
+
+# Profiler of the queries run by executeQuery and iterateQuery, None while profiling is off
+_queryProfiler = None
+
+
+def enableQueryProfiler(logPath: str = Constants.slowQueryLog.value, slowMs: float = Constants.slowQueryMs.value):
+    """
+    Start profiling the queries run by executeQuery and iterateQuery (see queryProfiler.py).
+
+    Args:
+        logPath (str): File the slow query log is appended to.
+        slowMs (float): Statements taking longer than this many milliseconds are logged.
 
-        curs = conn.cursor()
+    Returns:
+        QueryProfiler: The profiler, holding the aggregated statistics of every statement.
+    """
+    global _queryProfiler
+    disableQueryProfiler()
+    _queryProfiler = QueryProfiler(logPath, slowMs)
+    return _queryProfiler
+
+
+def disableQueryProfiler():
+    """
+    Stop profiling queries.
+    """
+    global _queryProfiler
+    _queryProfiler = None
+
+
+if Constants.queryProfilerEnabled.value:
+    enableQueryProfiler()
+
+
+def _profile(conn, query: str, params):
+    if _queryProfiler is None:
+        return nullcontext({'rows': None})
+    return _queryProfiler.profile(conn, query, params)
+
+
+def _startProfile(conn, query: str, params):
+    # a statement profiled step by step (see QueryProfiler.start), None while profiling is off
+    if _queryProfiler is None:
+        return None
+    return _queryProfiler.start(conn, query, params)
+
+
+def _profileStep(statement):
+    if statement is None:
+        return nullcontext()
+    return statement.step()
+
+
+def _execute(curs, query: str, params):
+    if params is None:
         curs.execute(query)
+    else:
+        curs.execute(query, params)
+
+
+@timedStage('db')
+def executeQuery(query: str, database: str, pool: ConnectionPool = None, params: tuple = None) -> list:
+    """
+    Execute a query and return all of its rows.
+
+    Args:
+        query (str): The SQL query to execute.
+        database (str): The file path of the SQLite database.
+        pool (ConnectionPool): If given, the query runs on a pooled connection that is kept open afterwards,
+            otherwise a connection is opened and closed just for this query.
+        params (tuple): Values bound to the query's placeholders (a dict for named placeholders).
+
+    Returns:
+        list: The rows returned by the query, or None if an error occurred.
+    """
+    if pool is not None:
+        try:
+            conn = pool.getConnection()
+            with _profile(conn, query, params) as record:
+                curs = conn.cursor()
+                _execute(curs, query, params)
+
+                res = curs.fetchall()
+                curs.close()
+                record['rows'] = len(res)
+            addRows(len(res))
+
+            return res
+
+        except Exception as e:
+            pool.markSuspect()
+            print("An error occurred:", str(e))
+            return None
 
-        res = curs.fetchall()
-        curs.close()
+    try:
+        conn = create_connection(database)
+
+        with _profile(conn, query, params) as record:
+            curs = conn.cursor()
+            _execute(curs, query, params)
+
+            res = curs.fetchall()
+            curs.close()
+            record['rows'] = len(res)
         conn.close()
+        addRows(len(res))
 
         return res
 
@@ -86,10 +728,69 @@ def executeQuery(query: str, database: str) -> list:
         print("An error occurred:", str(e))
 
 
-def dbInit():
+def iterateQuery(query: str, pool: ConnectionPool, params: tuple = None,
+                 batchRows: int = Constants.streamFetchRows.value):
+    """
+    Execute a query on a pooled connection and yield its rows in batches, so a large result is never held in
+    memory at once. Errors are reported like executeQuery does and then re-raised: part of the rows may already be
+    sent, and ending the iteration quietly would make a cut off result look complete.
+
+    Args:
+        query (str): The SQL query to execute.
+        pool (ConnectionPool): The pool providing the connection.
+        params (tuple): Values bound to the query's ? placeholders.
+        batchRows (int): Number of rows fetched per batch.
+
+    Yields:
+        list: The next batch of at most batchRows rows.
+
+    Raises:
+        Exception: If the query fails, before or after some batches were yielded.
+    """
+    curs = None
+    statement = None
+    fetched = None
+    try:
+        conn = pool.getConnection()
+        # only the execution and the fetches are profiled, not the time the consumer takes between batches
+        statement = _startProfile(conn, query, params)
+        with _profileStep(statement):
+            curs = conn.cursor()
+            _execute(curs, query, params)
+
+        fetched = 0
+        while True:
+            with _profileStep(statement):
+                rows = curs.fetchmany(batchRows)
+            if not rows:
+                break
+            fetched += len(rows)
+            yield rows
+
+    except Exception as e:
+        pool.markSuspect()
+        print("An error occurred:", str(e))
+        raise
+    finally:
+        if curs is not None:
+            curs.close()
+        if statement is not None:
+            statement.rows = fetched
+            statement.finish()
+
+
+def dbInit(columnar: bool = False, database: str = Constants.dbName.value, transactions=None,
+           layout: str = Constants.storageLayout.value):
     """
     Initialize the database by creating tables and filling them with data.
 
+    Args:
+        columnar (bool): Also write the memory-mapped columnar store (see columnarStore.py) from the loaded data.
+        database (str): The file path of the SQLite database.
+        transactions (iterable): Chunks of transaction rows to load (see insertTransactions) instead of the combined
+            transactions CSV, e.g. from dataGenerator.generateTransactions.
+        layout (str): "split" for the purchases and returns tables, "unified" for one transactions table.
+
     Returns:
         None
 
@@ -97,17 +798,24 @@ def dbInit():
         Exception: If an error occurs during the database connection, table creation, or data insertion.
     """
     try:
-        database = Constants.dbName.value
-
         sql_create_purchases_table = Constants.createPurchases.value
 
         sql_create_returns_table = Constants.createReturns.value
 
+        # pooled readers would keep serving the old file, drop them before rebuilding it
+        getConnectionPool(database).closeAll()
+
         # create a database connection
         conn = create_connection(database)
 
-        # create tables
+        # start from empty tables at schema version 0, the migrations below rebuild the indexes after loading
         if conn is not None:
+            # in the unified layout purchases and returns are views over the transactions table
+            for name, kind in conn.execute("SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view') "
+                                           "AND name IN ('purchases', 'returns', 'transactions')").fetchall():
+                conn.execute(f"DROP {kind.upper()} {name}")
+            conn.execute("PRAGMA user_version = 0")
+
             # create purchases table
             create_table(conn, sql_create_purchases_table)
 
@@ -116,13 +824,29 @@ def dbInit():
         else:
             raise Exception("Error! Cannot create the database connection.")
 
-        # generates the DataFrames to fill up the purchase and returns tables
-        transactions = pd.read_csv(Constants.combined_transactions.value)
-        purchases, returns = generateDfPurchaseReturns(transactions)
+        # streams the CSV (or the given rows) into the purchase and returns tables
+        if transactions is None:
+            loadTransactions(conn, Constants.combined_transactions.value)
+        else:
+            insertTransactions(conn, transactions)
+
+        # indexes are cheaper to build once over the loaded rows than to maintain during the load
+        migrateSchema(conn)
+        if layout == 'unified':
+            convertToUnifiedLayout(conn)
+        verifySchema(conn)
+
+        # let the readers know the data changed
+        bumpGeneration(conn)
+        conn.commit()
+
+        # the journal mode is stored in the file, so readers opened in read-only mode pick it up from here
+        conn.execute(f"PRAGMA journal_mode = {Constants.journalMode.value}")
 
-        # uses the DataFrames to fill the purchase and returns tables
-        purchases.to_sql('purchases', conn, if_exists='replace', index=False)
-        returns.to_sql('returns', conn, if_exists='replace', index=False)
+        if columnar:
+            # numpy is only needed for the columnar store
+            from columnarStore import buildColumnarStore
+            buildColumnarStore(conn)
         conn.close()
     except Exception as e:
         print("An error occurred:", str(e))
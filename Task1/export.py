@@ -0,0 +1,54 @@
+"""
+Bulk export of the net amounts of every merchant type, the same records /netMerchant/export streams: one grouped pass
+over the database instead of one /netMerchant call per merchant type, written out in bounded batches.
+
+    python export.py --granularity month --format csv --output net_merchant.csv [--start 2023-01-01] [--end ...]
+"""
+import argparse
+import contextlib
+import sys
+import time
+
+from constants import Constants
+from controller import netMerchantExport
+from payloads import parseNetMerchantExportPayload
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--granularity', default=Constants.exportGranularity.value,
+                        choices=['hour', 'day', 'week', 'month'])
+    parser.add_argument('--format', default=Constants.exportFormat.value, choices=['ndjson', 'csv'])
+    parser.add_argument('--start', help="first period to export, its first date (whole hour for hours)")
+    parser.add_argument('--end', help="period the export stops before, its first date (whole hour for hours)")
+    parser.add_argument('--output', help="file to write, standard output by default")
+    parser.add_argument('--database', default=Constants.dbName.value)
+    args = parser.parse_args()
+
+    try:
+        options = {field: value for field, value in (('start', args.start), ('end', args.end)) if value is not None}
+        payload = parseNetMerchantExportPayload(dict(options, granularity=args.granularity, format=args.format))
+    except ValueError as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    output = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        # the queries report errors on standard output, which may be carrying the export itself
+        with contextlib.redirect_stdout(sys.stderr):
+            for piece in netMerchantExport(payload['granularity'], payload['format'], payload['start'],
+                                           payload['end'], args.database):
+                output.write(piece)
+    except Exception as e:
+        print("Export failed, the output is incomplete:", str(e), file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if args.output:
+            output.close()
+
+    if args.output:
+        print(f"Exported to {args.output} in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
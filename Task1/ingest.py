@@ -0,0 +1,42 @@
+"""
+Incremental ingest: appends the transactions of new CSV files to the database instead of rebuilding it with dbInit
+(see dbManager.ingestTransactions). Running servers pick the new rows up through the load generation.
+
+    python ingest.py delta_2023-06-02.csv [more.csv ...] [--dedupe] [--database pythonsqlite.db]
+"""
+import argparse
+import time
+
+import dbManager
+from constants import Constants
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('csv', nargs='+', help="CSV files laid out like the combined transactions CSV")
+    parser.add_argument('--database', default=Constants.dbName.value)
+    parser.add_argument('--dedupe', action='store_true',
+                        help="skip rows already loaded by natural key instead of rows older than the watermark")
+    parser.add_argument('--columnar', action='store_true', help="rebuild the columnar store afterwards")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    conn = dbManager.create_connection(args.database)
+    try:
+        dbManager.migrateSchema(conn)
+        result = dbManager.ingestTransactions(conn, args.csv, args.dedupe)
+        print(f"Added {result['added']} of {result['read']} rows in {time.perf_counter() - start:.2f}s, "
+              f"watermark {result['watermark']}")
+
+        if args.columnar and result['added']:
+            # numpy is only needed for the columnar store
+            from columnarStore import buildColumnarStore
+            buildColumnarStore(conn)
+    except Exception as e:
+        print("An error occurred:", str(e))
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
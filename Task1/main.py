@@ -1,4 +1,5 @@
 from flask import Flask
+
 from routes import allByUser_bp
 from routes import netMerchant_bp
 
@@ -19,6 +20,10 @@ if __name__ == '__main__':
     # this func initializes the database (creates and fills it). Since the pythonsqlite.db file is static and my csv
     # won't change throughout the project there is no point in running this anymore. However, I'll keep it in
     # here to show how I ran it originally.
-    # dbManager.dbInit()
+    # from dbManager import dbInit
+    # dbInit()
 
-    app.run()
+    # serve with the production server (see server.py), which also brings the database file up to the current schema
+    # version before starting the workers. app.run() is Flask's single process development server.
+    from server import runServer
+    runServer(app)
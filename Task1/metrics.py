@@ -0,0 +1,371 @@
+"""
+Request instrumentation. While a request is being served, the pipeline (routes -> controller -> dbManager ->
+dataTransformer) records how long each stage took, how many rows the queries returned and whether the result cache
+answered. When the request ends the timings are returned as a Server-Timing header value and aggregated into
+histograms, rendered in the Prometheus text format by renderMetrics (served on /metrics).
+
+The timings live in a context variable, so concurrent requests in other threads never mix. Outside of a request, or
+with metrics disabled, every recording call is a single context variable lookup.
+
+Each process aggregates its own requests. Processes sharing a directory (see shareAcrossProcesses, set up by the
+prefork server for its workers) also write their series to a file of their own there, and renderMetrics sums the
+files of all of them, so /metrics reports the whole server whichever worker answers the scrape.
+"""
+import bisect
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+
+from constants import Constants
+
+# Histogram buckets: seconds, response bytes and rows
+_secondsBuckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+_bytesBuckets = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+_rowsBuckets = (0, 1, 10, 100, 1000, 10000, 100000)
+
+enabled = Constants.metricsEnabled.value
+
+_current = contextvars.ContextVar('requestTimings', default=None)
+
+
+class RequestTimings:
+    """
+    What the stages of one request recorded.
+    """
+    __slots__ = ('endpoint', 'method', 'start', 'stages', 'rows', 'cache')
+
+    def __init__(self, endpoint: str, method: str):
+        self.endpoint = endpoint
+        self.method = method
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.rows = None
+        self.cache = None
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+
+class _Stage:
+    __slots__ = ('timings', 'name', 'start')
+
+    def __init__(self, timings: RequestTimings, name: str):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timings.add(self.name, time.perf_counter() - self.start)
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_noStage = _NoStage()
+
+
+def stage(name: str):
+    """
+    Context manager timing a block as a stage of the current request (repeated stages add up).
+
+    Args:
+        name (str): The stage name, e.g. 'db' or 'transform'.
+    """
+    timings = _current.get()
+    if timings is None:
+        return _noStage
+    return _Stage(timings, name)
+
+
+def timedStage(name: str):
+    """
+    Decorator timing every call of a function as a stage of the current request.
+
+    Args:
+        name (str): The stage name.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timings = _current.get()
+            if timings is None:
+                return func(*args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings.add(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def addRows(count: int):
+    """
+    Count rows returned by a query of the current request.
+    """
+    timings = _current.get()
+    if timings is not None:
+        timings.rows = (timings.rows or 0) + count
+
+
+def setCacheStatus(status: str):
+    """
+    Record whether the result cache answered the current request ('hit' or 'miss').
+    """
+    timings = _current.get()
+    if timings is not None:
+        timings.cache = status
+
+
+class Histogram:
+    """
+    Cumulative histogram in the Prometheus sense: counts per upper bound, plus the sum and count of observations.
+
+    Args:
+        buckets (tuple): Sorted upper bounds, +Inf is implied.
+    """
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> list:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+# name -> (type, help, buckets), in rendering order
+_metrics = {
+    'kasheesh_requests_total': ('counter', "Requests served.", None),
+    'kasheesh_request_duration_seconds': ('histogram', "Time spent in the app per request.", _secondsBuckets),
+    'kasheesh_stage_duration_seconds': ('histogram', "Time spent per pipeline stage.", _secondsBuckets),
+    'kasheesh_response_bytes': ('histogram', "Size of the response bodies.", _bytesBuckets),
+    'kasheesh_query_rows': ('histogram', "Rows returned by the queries of a request.", _rowsBuckets),
+    'kasheesh_cache_requests_total': ('counter', "Result cache lookups.", None),
+}
+
+_series = {name: {} for name in _metrics}
+_lock = threading.Lock()
+
+# Directory shared with the other processes of the server, see shareAcrossProcesses
+_sharedDirectory = None
+_writerPid = None
+_changed = False
+
+
+def _labels(**labels) -> str:
+    return ','.join(f'{key}="{value}"' for key, value in labels.items())
+
+
+def _increment(name: str, labels: str):
+    series = _series[name]
+    series[labels] = series.get(labels, 0) + 1
+
+
+def _observe(name: str, labels: str, value: float):
+    histogram = _series[name].get(labels)
+    if histogram is None:
+        histogram = _series[name][labels] = Histogram(_metrics[name][2])
+    histogram.observe(value)
+
+
+def shareAcrossProcesses(directory: str = None):
+    """
+    Aggregate the metrics of every process given the same directory, e.g. the workers of a prefork server (call it
+    before forking). Each process writes its series to <pid>.json in the directory at most
+    Constants.metricsWriteSeconds after they change, and renderMetrics sums the files of every process, including
+    the ones that exited so the counters never go back.
+
+    Args:
+        directory (str): The shared directory, None to only report this process again.
+    """
+    global _sharedDirectory
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+    _sharedDirectory = directory
+
+
+def _writeSeries():
+    # Write this process's series to its file in the shared directory, if they changed since the last write
+    global _changed
+    directory = _sharedDirectory
+    if directory is None:
+        return
+    with _lock:
+        if not _changed:
+            return
+        snapshot = {name: {labels: [value.counts, value.sum, value.count] if isinstance(value, Histogram) else value
+                           for labels, value in series.items()}
+                    for name, series in _series.items()}
+        _changed = False
+
+    path = os.path.join(directory, f'{os.getpid()}.json')
+    with open(path + '.tmp', 'w') as file:
+        json.dump(snapshot, file)
+    os.replace(path + '.tmp', path)
+
+
+def _writeLoop():
+    while True:
+        time.sleep(Constants.metricsWriteSeconds.value)
+        try:
+            _writeSeries()
+        except Exception as e:
+            print("An error occurred:", str(e))
+
+
+def _startWriter():
+    # one writer thread per process, threads do not survive a fork
+    global _writerPid
+    with _lock:
+        if _writerPid == os.getpid():
+            return
+        _writerPid = os.getpid()
+    threading.Thread(target=_writeLoop, name='metrics-writer', daemon=True).start()
+
+
+def _readShared() -> dict:
+    # Sum of the series written by every process sharing the directory
+    totals = {name: {} for name in _metrics}
+    for entry in os.listdir(_sharedDirectory):
+        if not entry.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(_sharedDirectory, entry)) as file:
+                written = json.load(file)
+        except (OSError, ValueError):
+            continue
+        for name, series in written.items():
+            if name not in totals:
+                continue
+            for labels, value in series.items():
+                if _metrics[name][0] == 'histogram':
+                    histogram = totals[name].get(labels)
+                    if histogram is None:
+                        histogram = totals[name][labels] = Histogram(_metrics[name][2])
+                    counts, total, count = value
+                    histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                    histogram.sum += total
+                    histogram.count += count
+                else:
+                    totals[name][labels] = totals[name].get(labels, 0) + value
+    return totals
+
+
+def startRequest(endpoint: str, method: str):
+    """
+    Start recording the request handled by the calling thread (a no-op when metrics are disabled).
+
+    Args:
+        endpoint (str): The endpoint, e.g. '/netMerchant'.
+        method (str): The HTTP method.
+    """
+    if enabled:
+        _current.set(RequestTimings(endpoint, method))
+
+
+def finishRequest(status: int, responseBytes: int = None) -> str:
+    """
+    Stop recording the current request and aggregate what it recorded.
+
+    Args:
+        status (int): The response status code.
+        responseBytes (int): Size of the response body, None if unknown (streamed).
+
+    Returns:
+        str: The Server-Timing header value (durations in milliseconds), or None if no request was being recorded.
+    """
+    global _changed
+    timings = _current.get()
+    if timings is None:
+        return None
+    _current.set(None)
+
+    total = time.perf_counter() - timings.start
+    endpoint = _labels(endpoint=timings.endpoint)
+    if _sharedDirectory is not None and _writerPid != os.getpid():
+        _startWriter()
+
+    with _lock:
+        _changed = True
+        _increment('kasheesh_requests_total', _labels(endpoint=timings.endpoint, method=timings.method, status=status))
+        _observe('kasheesh_request_duration_seconds', _labels(endpoint=timings.endpoint, method=timings.method), total)
+        for name, seconds in timings.stages.items():
+            _observe('kasheesh_stage_duration_seconds', _labels(endpoint=timings.endpoint, stage=name), seconds)
+        if responseBytes is not None:
+            _observe('kasheesh_response_bytes', endpoint, responseBytes)
+        if timings.rows is not None:
+            _observe('kasheesh_query_rows', endpoint, timings.rows)
+        if timings.cache is not None:
+            _increment('kasheesh_cache_requests_total', _labels(endpoint=timings.endpoint, result=timings.cache))
+
+    header = [f'{name};dur={seconds * 1000:.3f}' for name, seconds in timings.stages.items()]
+    if timings.cache is not None:
+        header.append(f'cache;desc="{timings.cache}"')
+    header.append(f'app;dur={total * 1000:.3f}')
+    return ', '.join(header)
+
+
+def renderMetrics() -> str:
+    """
+    Render the aggregated metrics in the Prometheus text exposition format: those of every process sharing the
+    directory (this one's up to date, the others' as of their last write), or of this process alone.
+
+    Returns:
+        str: The exposition text.
+    """
+    if _sharedDirectory is not None:
+        _writeSeries()
+        return _render(_readShared())
+    with _lock:
+        return _render(_series)
+
+
+def _render(series: dict) -> str:
+    lines = []
+    for name, (kind, description, _) in _metrics.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(series[name].items()):
+            if kind == 'histogram':
+                lines.extend(value.render(name, labels))
+            else:
+                lines.append(f'{name}{{{labels}}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """
+    Drop everything this process aggregated so far.
+    """
+    global _changed
+    with _lock:
+        _changed = True
+        for series in _series.values():
+            series.clear()
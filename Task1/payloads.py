@@ -0,0 +1,236 @@
+from datetime import date, datetime
+
+from constants import Constants
+
+
+def checkExtraFields(data: dict, allowed: tuple):
+    """
+    Reject JSON payloads carrying fields the endpoint does not know about.
+
+    Args:
+        data (dict): JSON data from the request.
+        allowed (tuple): The field names accepted by the endpoint.
+
+    Raises:
+        ValueError: If there are extra fields found in the JSON payload.
+    """
+    extra_fields = [field for field in data if field not in allowed]
+    if extra_fields:
+        raise ValueError(f"Invalid JSON payload: Extra fields found: {', '.join(extra_fields)}")
+
+
+def parseRange(data: dict, dateOnly: bool = False) -> tuple:
+    """
+    Validate the optional 'start' and 'end' bounds of a payload. The range is half-open: 'start' is included, 'end'
+    is not. Bounds are normalized to the ISO 8601 form the datetime column stores (e.g. '2023-06-01T10:00:00' or
+    '2023-03-25T12:35:49.0712', without trailing zeros in the fraction), so they compare against it as text.
+
+    Args:
+        data (dict): JSON data from the request.
+        dateOnly (bool): Only accept dates (YYYY-MM-DD), for data aggregated per day.
+
+    Returns:
+        tuple: The normalized (start, end), None for a missing bound.
+
+    Raises:
+        ValueError: If a bound is not an ISO 8601 date or datetime, or 'start' is not before 'end'.
+    """
+    bounds = []
+    for field in ('start', 'end'):
+        value = data.get(field)
+        if value is not None:
+            expected = "a date (YYYY-MM-DD)" if dateOnly else "an ISO 8601 date or datetime"
+            try:
+                if not isinstance(value, str):
+                    raise ValueError()
+                if dateOnly or len(value) == 10:
+                    value = date.fromisoformat(value).isoformat()
+                else:
+                    parsed = datetime.fromisoformat(value)
+                    if parsed.tzinfo is not None:
+                        raise ValueError()
+                    # the column stores as few fractional digits as needed (e.g. '...49.0712'), six digits would sort
+                    # after the same instant
+                    value = parsed.isoformat().rstrip('0') if parsed.microsecond else parsed.isoformat()
+            except ValueError:
+                raise ValueError(f"Invalid JSON payload: '{field}' must be {expected}.")
+        bounds.append(value)
+
+    start, end = bounds
+    if start is not None and end is not None and start >= end:
+        raise ValueError("Invalid JSON payload: 'start' must be before 'end'.")
+    return start, end
+
+
+def parseAllByUserPayload(data: dict) -> dict:
+    """
+    Validate an /allByUser payload and work out which kind of lookup it asks for.
+
+    Args:
+        data (dict): JSON data from the request containing the 'user_id' key.
+
+    Returns:
+        dict: 'user_id', 'mode' ('all', 'page' or 'stream'), the 'start' and 'end' bounds (see parseRange) and, for
+            pages, 'limit' and 'cursor'.
+
+    Raises:
+        ValueError: If there are extra fields found in the JSON payload or the pagination or range fields are invalid.
+        KeyError: If the 'user_id' key is missing in the JSON payload.
+    """
+    if 'user_id' not in data:
+        raise KeyError("Invalid JSON payload: 'user_id' key is missing.")
+
+    # Check if there are extra fields in the JSON data
+    checkExtraFields(data, ('user_id', 'limit', 'cursor', 'stream', 'start', 'end'))
+
+    start, end = parseRange(data)
+    request = {'user_id': data['user_id'], 'mode': 'all', 'start': start, 'end': end}
+
+    if data.get('stream', False) is not False:
+        if data['stream'] is not True:
+            raise ValueError("Invalid JSON payload: 'stream' must be a boolean.")
+        if 'limit' in data or 'cursor' in data:
+            raise ValueError("Invalid JSON payload: 'stream' cannot be combined with 'limit' or 'cursor'.")
+        request['mode'] = 'stream'
+
+    elif 'limit' in data or 'cursor' in data:
+        limit = data.get('limit', Constants.defaultPageSize.value)
+        if type(limit) is not int or not 0 < limit <= Constants.maxPageSize.value:
+            raise ValueError(f"Invalid JSON payload: 'limit' must be an integer between 1 and "
+                             f"{Constants.maxPageSize.value}.")
+        cursor = data.get('cursor')
+        if cursor is not None and not isinstance(cursor, str):
+            raise ValueError("Invalid JSON payload: 'cursor' must be a string.")
+        request.update(mode='page', limit=limit, cursor=cursor)
+
+    return request
+
+
+def parseAllByUserBatchPayload(data: dict) -> dict:
+    """
+    Validate an /allByUser/batch payload.
+
+    Args:
+        data (dict): JSON data from the request containing the 'user_ids' key.
+
+    Returns:
+        dict: The requested 'user_ids'.
+
+    Raises:
+        ValueError: If there are extra fields in the JSON payload or 'user_ids' is not a valid list of IDs.
+        KeyError: If the 'user_ids' key is missing in the JSON payload.
+    """
+    if 'user_ids' not in data:
+        raise KeyError("Invalid JSON payload: 'user_ids' key is missing.")
+
+    # Check if there are extra fields in the JSON data
+    checkExtraFields(data, ('user_ids',))
+
+    user_ids = data['user_ids']
+    if not isinstance(user_ids, list) or not user_ids:
+        raise ValueError("Invalid JSON payload: 'user_ids' must be a non-empty list.")
+    if len(user_ids) > Constants.maxBatchUsers.value:
+        raise ValueError(f"Invalid JSON payload: at most {Constants.maxBatchUsers.value} user IDs per request.")
+    if any(type(user_id) is not int for user_id in user_ids):
+        raise ValueError("Invalid JSON payload: 'user_ids' must only contain integers.")
+
+    return {'user_ids': user_ids}
+
+
+def parseNetMerchantPayload(data: dict) -> dict:
+    """
+    Validate a /netMerchant payload.
+
+    Args:
+        data (dict): JSON data from the request containing the 'merchant_type_code' key.
+
+    Returns:
+        dict: The requested 'merchant_type_code' and the 'start' and 'end' dates (see parseRange).
+
+    Raises:
+        ValueError: If there are extra fields found in the JSON payload or the range fields are invalid.
+        KeyError: If the 'merchant_type_code' key is missing in the JSON payload.
+    """
+    if 'merchant_type_code' not in data:
+        raise KeyError("Invalid JSON payload: 'merchant_type_code' key is missing.")
+
+    # Check if there are extra fields in the JSON data
+    checkExtraFields(data, ('merchant_type_code', 'start', 'end'))
+
+    # the rollup behind /netMerchant holds whole days
+    start, end = parseRange(data, dateOnly=True)
+    return {'merchant_type_code': data['merchant_type_code'], 'start': start, 'end': end}
+
+
+def parseNetMerchantExportPayload(data: dict) -> dict:
+    """
+    Validate a /netMerchant/export payload.
+
+    Args:
+        data (dict): JSON data from the request, every field is optional.
+
+    Returns:
+        dict: The 'granularity' ('hour', 'day', 'week' or 'month'), the 'format' ('ndjson' or 'csv') and the 'start'
+            and 'end' bounds (see parseRange, dates unless the granularity is 'hour'). Bounds fall on the start of a
+            period: a whole hour, a Monday or the first day of a month.
+
+    Raises:
+        ValueError: If there are extra fields found in the JSON payload or a field is invalid.
+    """
+    # Check if there are extra fields in the JSON data
+    checkExtraFields(data, ('granularity', 'format', 'start', 'end'))
+
+    granularity = data.get('granularity', Constants.exportGranularity.value)
+    if granularity not in ('hour', 'day', 'week', 'month'):
+        raise ValueError("Invalid JSON payload: 'granularity' must be one of hour, day, week or month.")
+    exportFormat = data.get('format', Constants.exportFormat.value)
+    if exportFormat not in ('ndjson', 'csv'):
+        raise ValueError("Invalid JSON payload: 'format' must be ndjson or csv.")
+
+    start, end = parseRange(data, dateOnly=granularity != 'hour')
+
+    # Periods are exported whole: a bound inside one would sum part of it under the label of the full period
+    for field, value in (('start', start), ('end', end)):
+        if value is None:
+            continue
+        if granularity == 'hour' and len(value) > 10 and value[13:] != ':00:00':
+            raise ValueError(f"Invalid JSON payload: '{field}' must be a whole hour for hourly periods.")
+        if granularity == 'week' and date.fromisoformat(value).weekday() != 0:
+            raise ValueError(f"Invalid JSON payload: '{field}' must be a Monday for weekly periods.")
+        if granularity == 'month' and value[8:] != '01':
+            raise ValueError(f"Invalid JSON payload: '{field}' must be the first day of a month for monthly periods.")
+
+    return {'granularity': granularity, 'format': exportFormat, 'start': start, 'end': end}
+
+
+def parseQueryArgs(args: dict, intFields: tuple = (), boolFields: tuple = ()) -> dict:
+    """
+    Turn query string arguments into the JSON payload the POST endpoints take, converting the typed fields.
+
+    Args:
+        args (dict): The query string arguments.
+        intFields (tuple): Fields holding integers.
+        boolFields (tuple): Fields holding booleans ('true' or 'false').
+
+    Returns:
+        dict: The equivalent JSON payload.
+
+    Raises:
+        ValueError: If a typed field does not hold a value of its type.
+    """
+    data = dict(args)
+
+    for field in intFields:
+        if field in data:
+            try:
+                data[field] = int(data[field])
+            except ValueError:
+                raise ValueError(f"Invalid query parameter: '{field}' must be an integer.")
+
+    for field in boolFields:
+        if field in data:
+            if data[field] not in ('true', 'false'):
+                raise ValueError(f"Invalid query parameter: '{field}' must be 'true' or 'false'.")
+            data[field] = data[field] == 'true'
+
+    return data
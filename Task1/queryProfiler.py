@@ -0,0 +1,228 @@
+"""
+Opt-in profiler for the queries run through dbManager. Every statement gets its duration, row count and SQLite VM
+step count recorded (aggregated per SQL text, see QueryProfiler.stats). Statements slower than the threshold, doing
+a full scan of a table, or failing are written to the slow query log as JSON lines together with their EXPLAIN QUERY
+PLAN, e.g.
+
+    {"time": "2023-06-01T10:00:00", "reasons": ["full_scan"], "duration_ms": 12.5, "rows": 31, "vm_steps": 52000,
+     "sql": "SELECT ... WHERE merchant_type_code = 5200 ...", "plan": ["SCAN purchases", ...]}
+
+While a statement is profiled the profiler hooks into its connection: the trace callback captures the statement
+SQLite actually runs (with the bound values expanded), the progress handler counts VM steps. A statement consumed
+batch by batch is profiled in steps (see ProfiledStatement), so the hooks and the timing cover the database work only,
+not the pauses between batches.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from constants import Constants
+
+
+class _ConnectionState:
+    __slots__ = ('sql', 'steps')
+
+    def __init__(self):
+        self.sql = None
+        self.steps = 0
+
+
+class QueryProfiler:
+    """
+    Args:
+        logPath (str): File the slow query log is appended to.
+        slowMs (float): Statements taking longer than this many milliseconds are logged.
+        progressSteps (int): VM instructions between two calls of the progress handler (the step count resolution).
+    """
+
+    def __init__(self, logPath: str = Constants.slowQueryLog.value, slowMs: float = Constants.slowQueryMs.value,
+                 progressSteps: int = Constants.profilerProgressSteps.value):
+        self.logPath = logPath
+        self.slowMs = slowMs
+        self.progressSteps = progressSteps
+
+        self._plans = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _attach(self, conn, state: _ConnectionState):
+        # Hooks are only installed while a profiled statement runs, see ProfiledStatement.step
+        def trace(statement):
+            state.sql = statement
+
+        def progress():
+            state.steps += self.progressSteps
+            return 0
+
+        conn.set_trace_callback(trace)
+        conn.set_progress_handler(progress, self.progressSteps)
+
+    @staticmethod
+    def _detach(conn):
+        conn.set_trace_callback(None)
+        conn.set_progress_handler(None, 0)
+
+    def _explain(self, conn, query: str, params) -> tuple:
+        """
+        Return the query plan details of a query and whether it scans a whole table. Plans are cached per SQL text,
+        the bound values do not change them.
+        """
+        cached = self._plans.get(query)
+        if cached is not None:
+            return cached
+
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+        rows = conn.execute("EXPLAIN QUERY PLAN " + query, params if params is not None else ()).fetchall()
+        plan = [row[-1] for row in rows]
+        # "SCAN <table>" reads every row of a table (or all of an index over it), "SEARCH" uses an index lookup unless
+        # it is a skip-scan, which walks the whole index over the leading ANY(...) columns
+        fullScan = any(detail.split()[1] in tables and (detail.startswith('SCAN ') or 'ANY(' in detail)
+                       for detail in plan if len(detail.split()) > 1)
+
+        self._plans[query] = (plan, fullScan)
+        return plan, fullScan
+
+    def _write(self, record: dict):
+        line = json.dumps(record, default=str)
+        with self._lock:
+            with open(self.logPath, 'a') as file:
+                file.write(line + '\n')
+
+    def start(self, conn, query: str, params=None) -> 'ProfiledStatement':
+        """
+        Start profiling a statement run in several steps, e.g. executed and then fetched batch by batch.
+
+        Args:
+            conn (sqlite3.Connection): The connection running the statement.
+            query (str): The SQL text.
+            params: The bound values.
+
+        Returns:
+            ProfiledStatement: The statement, to run its steps in and finish.
+        """
+        return ProfiledStatement(self, conn, query, params)
+
+    @contextmanager
+    def profile(self, conn, query: str, params=None):
+        """
+        Profile the statement run inside the block. The block sets record['rows'] to the number of rows fetched.
+
+        Args:
+            conn (sqlite3.Connection): The connection running the statement.
+            query (str): The SQL text.
+            params: The bound values.
+
+        Yields:
+            dict: The record of the statement.
+        """
+        statement = self.start(conn, query, params)
+        record = {'rows': None}
+        try:
+            with statement.step():
+                yield record
+        finally:
+            statement.rows = record['rows']
+            statement.finish()
+
+    def _finish(self, conn, state, query, params, record, duration, error):
+        rows = record['rows'] or 0
+        with self._lock:
+            stats = self._stats.setdefault(query, {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0,
+                                                   'vm_steps': 0})
+            stats['calls'] += 1
+            stats['total_ms'] += duration
+            stats['max_ms'] = max(stats['max_ms'], duration)
+            stats['rows'] += rows
+            stats['vm_steps'] += state.steps
+
+        executed, steps = state.sql or query, state.steps
+        reasons = []
+        plan = None
+        try:
+            plan, fullScan = self._explain(conn, query, params)
+            if fullScan:
+                reasons.append('full_scan')
+        except Exception:
+            # statements EXPLAIN cannot take (e.g. PRAGMAs) are only checked for their duration
+            pass
+        if duration > self.slowMs:
+            reasons.append('slow')
+        if error is not None:
+            reasons.append('error')
+        if not reasons:
+            return
+
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'reasons': reasons,
+            'duration_ms': round(duration, 3),
+            'rows': record['rows'],
+            'vm_steps': steps,
+            'sql': executed,
+            'plan': plan,
+        }
+        if error is not None:
+            entry['error'] = str(error)
+        self._write(entry)
+
+    def stats(self) -> dict:
+        """
+        Return the aggregated calls, total and max milliseconds, rows and VM steps of every SQL text seen so far.
+        """
+        with self._lock:
+            return {query: dict(stats) for query, stats in self._stats.items()}
+
+
+class ProfiledStatement:
+    """
+    A statement profiled over one or more steps (see QueryProfiler.start). Only the steps count towards its duration
+    and the profiler's hooks are only installed on the connection during a step, so the time the caller spends
+    between two batches is neither measured nor traced.
+
+    Args:
+        profiler (QueryProfiler): The profiler the statement is reported to.
+        conn (sqlite3.Connection): The connection running the statement.
+        query (str): The SQL text.
+        params: The bound values.
+    """
+
+    def __init__(self, profiler: QueryProfiler, conn, query: str, params=None):
+        self.profiler = profiler
+        self.conn = conn
+        self.query = query
+        self.params = params
+        self.rows = None
+        self.duration = 0.0
+        self.error = None
+
+        self._state = _ConnectionState()
+        self._finished = False
+
+    @contextmanager
+    def step(self):
+        """
+        Run one step of the statement, e.g. its execution or a fetch, timed and with the hooks installed.
+        """
+        self.profiler._attach(self.conn, self._state)
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.error = e
+            raise
+        finally:
+            self.duration += (time.perf_counter() - start) * 1000
+            self.profiler._detach(self.conn)
+
+    def finish(self):
+        """
+        Add the statement to the profiler's statistics and log it if it was slow, scanned a whole table or failed.
+        Only the first call counts.
+        """
+        if self._finished:
+            return
+        self._finished = True
+        self.profiler._finish(self.conn, self._state, self.query, self.params, {'rows': self.rows}, self.duration,
+                              self.error)
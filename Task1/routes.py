@@ -1,9 +1,47 @@
-from flask import Blueprint, request, jsonify, current_app
-from controller import allByUser, netMerchant
+import hashlib
+import json
+
+from flask import Blueprint, Response, request, jsonify, current_app, make_response, stream_with_context
+from controller import allByUser, allByUserBatch, allByUserPage, allByUserStream, netMerchant, netMerchantExport, \
+    dataGeneration
+from payloads import parseAllByUserPayload, parseAllByUserBatchPayload, parseNetMerchantPayload, \
+    parseNetMerchantExportPayload, parseQueryArgs
+from metrics import startRequest, finishRequest, renderMetrics, stage
 
 routes = Blueprint('routes', __name__)
 
 
+@routes.before_request
+def startTiming():
+    """
+    Start recording the stage timings of the request (see metrics.py).
+    """
+    if request.url_rule is not None and request.url_rule.rule != '/metrics':
+        startRequest(request.url_rule.rule, request.method)
+
+
+@routes.after_request
+def finishTiming(response):
+    """
+    Aggregate the stage timings of the request and report them to the client in a Server-Timing header.
+    """
+    serverTiming = finishRequest(response.status_code, None if response.is_streamed else response.content_length)
+    if serverTiming is not None:
+        response.headers['Server-Timing'] = serverTiming
+    return response
+
+
+@routes.route('/metrics', methods=['GET'])
+def metricsGet():
+    """
+    Handle a GET request for the aggregated request metrics (of every worker under the production server).
+
+    Returns:
+    The metrics in the Prometheus text exposition format.
+    """
+    return Response(renderMetrics(), mimetype='text/plain; version=0.0.4')
+
+
 @routes.route('/allByUser', methods=['POST'])
 def allByUserPost():
     """
@@ -11,14 +49,21 @@ def allByUserPost():
 
     Request JSON:
     {
-        "user_id": int
+        "user_id": int,
+        "limit": int,       (optional, return one page of at most this many transactions)
+        "cursor": str,      (optional, the next_cursor of the previous page)
+        "stream": bool,     (optional, stream the whole history instead of building it in memory)
+        "start": str,       (optional, only transactions at or after this ISO 8601 date or datetime)
+        "end": str          (optional, only transactions before this ISO 8601 date or datetime)
     }
 
     Returns:
-    JSON response containing the data for the user.
+    JSON response containing the data for the user. With 'limit' or 'cursor' the response is an object holding
+    the page under "transactions" and the cursor of the next page (null on the last page) under "next_cursor".
 
     Error Responses:
     - 400 Bad Request: If the 'user_id' key is missing in the JSON payload.
+    - 400 Bad Request: If 'start' or 'end' is not a valid date or datetime, or 'start' is not before 'end'.
     - 400 Bad Request: If the request Content-Type is not 'application/json'.
     - 500 Internal Server Error: If an unexpected error occurs.
     """
@@ -37,6 +82,64 @@ def allByUserPost():
         return jsonify({"error": str(e)}), 500
 
 
+@routes.route('/allByUser', methods=['GET'])
+def allByUserGet():
+    """
+    Handle a GET request to retrieve all data for a specific user. Same as allByUserPost with the payload fields
+    passed in the query string (e.g. /allByUser?user_id=38493&limit=50), so HTTP caches can store and revalidate it.
+
+    Returns:
+    JSON response containing the data for the user.
+
+    Error Responses:
+    - 400 Bad Request: If the 'user_id' parameter is missing or a parameter is invalid.
+    - 500 Internal Server Error: If an unexpected error occurs.
+    """
+    try:
+        data = parseQueryArgs(request.args.to_dict(), intFields=('user_id', 'limit'), boolFields=('stream',))
+        response = handle_allByUser_request(data)
+        return response
+    except KeyError as e:
+        return jsonify({"error": str(e)}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@routes.route('/allByUser/batch', methods=['POST'])
+def allByUserBatchPost():
+    """
+    Handle a POST request to retrieve all data for several users at once.
+
+    Request JSON:
+    {
+        "user_ids": [int, ...]
+    }
+
+    Returns:
+    JSON object mapping each requested user ID to the data for that user.
+
+    Error Responses:
+    - 400 Bad Request: If the 'user_ids' key is missing or is not a list of at most maxBatchUsers integers.
+    - 415 Unsupported Media Type: If the request Content-Type is not 'application/json'.
+    - 500 Internal Server Error: If an unexpected error occurs.
+    """
+    try:
+        if request.headers.get('Content-Type') != 'application/json':
+            return jsonify({"error": "Unsupported Media Type: Content-Type must be 'application/json'."}), 415
+
+        data = request.get_json()
+        response = handle_allByUserBatch_request(data)
+        return response
+    except KeyError as e:
+        return jsonify({"error": str(e)}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @routes.route('/netMerchant', methods=['POST'])
 def netMerchantPost():
     """
@@ -44,7 +147,9 @@ def netMerchantPost():
 
     Request JSON:
     {
-        "merchant_type_code": int
+        "merchant_type_code": int,
+        "start": str,       (optional, only days from this date on, YYYY-MM-DD)
+        "end": str          (optional, only days before this date, YYYY-MM-DD)
     }
 
     Returns:
@@ -52,6 +157,7 @@ def netMerchantPost():
 
     Error Responses:
     - 400 Bad Request: If the 'merchant_type_code' key is missing in the JSON payload.
+    - 400 Bad Request: If 'start' or 'end' is not a valid date, or 'start' is not before 'end'.
     - 400 Bad Request: If the request Content-Type is not 'application/json'.
     - 500 Internal Server Error: If an unexpected error occurs.
     """
@@ -70,6 +176,105 @@ def netMerchantPost():
         return jsonify({"error": str(e)}), 500
 
 
+@routes.route('/netMerchant', methods=['GET'])
+def netMerchantGet():
+    """
+    Handle a GET request to retrieve net merchant data for a specific merchant type code. Same as netMerchantPost
+    with the payload fields passed in the query string (e.g. /netMerchant?merchant_type_code=5200).
+
+    Returns:
+    JSON response containing the net merchant data.
+
+    Error Responses:
+    - 400 Bad Request: If the 'merchant_type_code' parameter is missing or a parameter is invalid.
+    - 500 Internal Server Error: If an unexpected error occurs.
+    """
+    try:
+        data = parseQueryArgs(request.args.to_dict(), intFields=('merchant_type_code',))
+        response = handle_netMerchant_request(data)
+        return response
+    except KeyError as e:
+        return jsonify({"error": str(e)}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@routes.route('/netMerchant/export', methods=['GET'])
+def netMerchantExportGet():
+    """
+    Handle a GET request to export the net amounts of every merchant type at once, e.g.
+    /netMerchant/export?granularity=month&format=csv&start=2023-01-01.
+
+    Query parameters (all optional):
+        granularity: hour, day (default), week or month
+        format: ndjson (default, one JSON object per line) or csv
+        start, end: only periods from start on and before end (dates, or datetimes for hours)
+
+    Returns:
+    The streamed export, one record per merchant type and period ordered by merchant type and period.
+
+    Error Responses:
+    - 400 Bad Request: If a parameter is unknown or invalid.
+    - 500 Internal Server Error: If an unexpected error occurs.
+    """
+    try:
+        response = handle_netMerchantExport_request(request.args.to_dict())
+        return response
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def computeETag(endpoint: str, payload: dict):
+    """
+    Compute the strong ETag of a response. Responses are fully determined by the request and the data, so the
+    tag only needs the load generation of the served data (see controller.dataGeneration) and the validated payload.
+
+    Args:
+        endpoint (str): The endpoint name.
+        payload (dict): The validated payload of the request.
+
+    Returns:
+        str: The ETag (unquoted), or None if the database does not record a load generation.
+    """
+    generation = dataGeneration()
+    if generation is None:
+        return None
+
+    key = json.dumps([generation, endpoint, payload], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def conditionalResponse(endpoint: str, payload: dict, produce):
+    """
+    Answer with 304 Not Modified when the client's If-None-Match holds the current ETag, without calling produce
+    (and so without touching SQLite or dataTransformer). Otherwise build the response and tag it. If produce fails
+    (e.g. controller.QueryError) the error propagates untagged, so a failed lookup is never revalidated as current.
+
+    Args:
+        endpoint (str): The endpoint name.
+        payload (dict): The validated payload of the request.
+        produce (callable): Builds the response body.
+
+    Returns:
+        The Flask response.
+    """
+    etag = computeETag(endpoint, payload)
+
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    response = make_response(produce())
+    if etag is not None:
+        response.set_etag(etag)
+    return response
+
+
 def handle_allByUser_request(data):
     """
     Handle the request to retrieve all data for a specific user.
@@ -81,21 +286,40 @@ def handle_allByUser_request(data):
         Response data for the user.
 
     Raises:
-        ValueError: If there are extra fields found in the JSON payload.
+        ValueError: If there are extra fields found in the JSON payload or the pagination fields are invalid.
         KeyError: If the 'user_id' key is missing in the JSON payload.
     """
     with current_app.app_context():
-        if 'user_id' in data:
+        with stage('parse'):
+            payload = parseAllByUserPayload(data)
+        user_id, start, end = payload['user_id'], payload['start'], payload['end']
+
+        if payload['mode'] == 'stream':
+            return Response(stream_with_context(allByUserStream(user_id, start, end)), mimetype='application/json')
+        if payload['mode'] == 'page':
+            return conditionalResponse('allByUser', payload,
+                                       lambda: allByUserPage(user_id, payload['limit'], payload['cursor'], start, end))
+        return conditionalResponse('allByUser', payload, lambda: allByUser(user_id, start, end))
+
+
+def handle_allByUserBatch_request(data):
+    """
+    Handle the request to retrieve all data for several users.
 
-            # Check if there are extra fields in the JSON data
-            if len(data) > 1:
-                extra_fields = [field for field in data if field != 'user_id']
-                raise ValueError(f"Invalid JSON payload: Extra fields found: {', '.join(extra_fields)}")
+    Args:
+        data (dict): JSON data from the request containing the 'user_ids' key.
 
-            user_id = data['user_id']
-            return allByUser(user_id)
-        else:
-            raise KeyError(f"Invalid JSON payload: 'user_id' key is missing.")
+    Returns:
+        Response data for the users, keyed by user ID.
+
+    Raises:
+        ValueError: If there are extra fields in the JSON payload or 'user_ids' is not a valid list of IDs.
+        KeyError: If the 'user_ids' key is missing in the JSON payload.
+    """
+    with current_app.app_context():
+        with stage('parse'):
+            payload = parseAllByUserBatchPayload(data)
+        return conditionalResponse('allByUserBatch', payload, lambda: allByUserBatch(payload['user_ids']))
 
 
 def handle_netMerchant_request(data):
@@ -113,17 +337,35 @@ def handle_netMerchant_request(data):
         KeyError: If the 'merchant_type_code' key is missing in the JSON payload.
     """
     with current_app.app_context():
-        if 'merchant_type_code' in data:
+        with stage('parse'):
+            payload = parseNetMerchantPayload(data)
+        return conditionalResponse('netMerchant', payload,
+                                   lambda: netMerchant(payload['merchant_type_code'], payload['start'], payload['end']))
+
 
-            # Check if there are extra fields in the JSON data
-            if len(data) > 1:
-                extra_fields = [field for field in data if field != 'merchant_type_code']
-                raise ValueError(f"Invalid JSON payload: Extra fields found: {', '.join(extra_fields)}")
+def handle_netMerchantExport_request(data):
+    """
+    Handle the request to export the net amounts of every merchant type.
 
-            merchant_type_code = data['merchant_type_code']
-            return netMerchant(merchant_type_code)
-        else:
-            raise KeyError("Invalid JSON payload: 'merchant_type_code' key is missing.")
+    Args:
+        data (dict): The export options (granularity, format, start, end).
+
+    Returns:
+        Streamed response with the export.
+
+    Raises:
+        ValueError: If there are extra fields in the payload or a field is invalid.
+    """
+    with current_app.app_context():
+        with stage('parse'):
+            payload = parseNetMerchantExportPayload(data)
+
+        export = netMerchantExport(payload['granularity'], payload['format'], payload['start'], payload['end'])
+        extension, mimetype = ('csv', 'text/csv') if payload['format'] == 'csv' else ('ndjson', 'application/x-ndjson')
+        response = Response(stream_with_context(export), mimetype=mimetype)
+        response.headers['Content-Disposition'] = \
+            f'attachment; filename="net_merchant_{payload["granularity"]}.{extension}"'
+        return response
 
 
 # Create a separate Blueprint object for each set of routes
@@ -0,0 +1,161 @@
+"""
+Production entry point: serves the Flask app with gunicorn (pip install gunicorn) from a prefork pool of worker
+processes, each running several request threads, so the service uses every core of the host.
+
+The app and the database setup are loaded once in the master before it forks: the schema is migrated, the lookup
+indexes are read into the OS page cache and, with the "snapshot" storage backend, the shared memory snapshot is
+published (with the "columnar" backend, the columnar store is built if it is missing or behind the database). Every
+worker then opens its own pooled connections on that warm file.
+
+    python main.py [--bind 0.0.0.0:8000] [--workers 8] [--threads 4]
+
+Send SIGHUP to the master for a graceful reload (new workers are started and the old ones finish their requests,
+the snapshot is republished from the current database first), SIGTERM for a graceful stop.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+from gunicorn.app.base import BaseApplication
+
+import controller
+import dbManager
+import metrics
+from constants import Constants
+
+
+class ProductionServer(BaseApplication):
+    """
+    gunicorn application serving an already imported WSGI app.
+
+    Args:
+        app (flask.Flask): The WSGI app to serve, loaded before the workers are forked.
+        options (dict): gunicorn settings.
+        backend (str): Storage backend the workers answer the lookups from (see controller.setStorageBackend).
+    """
+
+    def __init__(self, app, options: dict = None, backend: str = Constants.storageBackend.value):
+        self.application = app
+        self.options = options or {}
+        self.backend = backend
+        self.publisher = None
+        self.metricsDirectory = None
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+        self.cfg.set('on_starting', self.onStarting)
+        self.cfg.set('on_reload', self.onReload)
+        self.cfg.set('post_fork', self.postFork)
+        self.cfg.set('on_exit', self.onExit)
+
+    def load(self):
+        return self.application
+
+    def prepareData(self):
+        """
+        Bring the database up to date and warm it, then publish the snapshot or build the columnar store if the
+        workers read from one. A columnar store already built from the current load generation is kept.
+        """
+        dbManager.migrateDatabase(Constants.dbName.value)
+        dbManager.warmDatabase(Constants.dbName.value)
+
+        if self.backend == 'columnar':
+            # numpy is only needed by this backend
+            import sqlite3
+            from columnarStore import ColumnarStore, buildColumnarStore
+            conn = sqlite3.connect(Constants.dbName.value)
+            row = conn.execute(Constants.getGeneration.value).fetchone()
+            try:
+                current = ColumnarStore(Constants.columnarDir.value).generation == (row[0] if row else None)
+            except FileNotFoundError:
+                current = False
+            if not current:
+                buildColumnarStore(conn, Constants.columnarDir.value)
+            conn.close()
+
+        if self.backend == 'snapshot':
+            # numpy is only needed by this backend
+            import sqlite3
+            from sharedSnapshot import SnapshotPublisher
+            if self.publisher is None:
+                self.publisher = SnapshotPublisher(Constants.snapshotName.value)
+            conn = sqlite3.connect(Constants.dbName.value)
+            self.publisher.publish(conn)
+            conn.close()
+
+    def onStarting(self, arbiter):
+        # every worker writes its metrics there and /metrics sums them, whichever worker answers the scrape
+        self.metricsDirectory = tempfile.mkdtemp(prefix='kasheesh_metrics_')
+        metrics.shareAcrossProcesses(self.metricsDirectory)
+        self.prepareData()
+
+    def onReload(self, arbiter):
+        self.prepareData()
+
+    def postFork(self, arbiter, worker):
+        # Each worker starts with an empty cache, and its connection pool opens its own connections on first use
+        controller.setStorageBackend(self.backend)
+
+    def onExit(self, arbiter):
+        if self.publisher is not None:
+            self.publisher.close()
+        if self.metricsDirectory is not None:
+            shutil.rmtree(self.metricsDirectory, ignore_errors=True)
+
+
+def serverOptions(bind: str = Constants.serverBind.value, workers: int = Constants.serverWorkers.value,
+                  threads: int = Constants.serverThreads.value) -> dict:
+    """
+    Build the gunicorn settings of the production server.
+
+    Args:
+        bind (str): Address to listen on, host:port.
+        workers (int): Worker processes, 0 for one per CPU core.
+        threads (int): Request threads per worker.
+
+    Returns:
+        dict: The gunicorn settings.
+    """
+    return {
+        'bind': bind,
+        'workers': workers or os.cpu_count() or 1,
+        'threads': threads,
+        # threaded workers keep idle keep-alive connections open without tying up a thread
+        'worker_class': 'gthread',
+        'backlog': Constants.serverBacklog.value,
+        'keepalive': Constants.serverKeepAlive.value,
+        'timeout': Constants.serverTimeout.value,
+        'graceful_timeout': Constants.serverGracefulTimeout.value,
+        'preload_app': True,
+    }
+
+
+def runServer(app, argv: list = None):
+    """
+    Serve an app with the production server, configured from the command line.
+
+    Args:
+        app (flask.Flask): The WSGI app to serve.
+        argv (list): Command line arguments, sys.argv by default.
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bind', default=Constants.serverBind.value)
+    parser.add_argument('--workers', type=int, default=Constants.serverWorkers.value)
+    parser.add_argument('--threads', type=int, default=Constants.serverThreads.value)
+    parser.add_argument('--backend', default=Constants.storageBackend.value, choices=('sqlite', 'columnar', 'snapshot'))
+    parser.add_argument('--profile-queries', action='store_true',
+                        help=f"log slow and full scan queries to {Constants.slowQueryLog.value}")
+    args = parser.parse_args(argv)
+
+    if args.profile_queries:
+        dbManager.enableQueryProfiler()
+
+    ProductionServer(app, serverOptions(args.bind, args.workers, args.threads), args.backend).run()
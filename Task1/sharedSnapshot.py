@@ -0,0 +1,221 @@
+"""
+In-memory snapshot of the lookup data shared by prefork workers. A parent process loads the transactions and the
+daily net rollup once into multiprocessing.shared_memory segments (the same columns and offsets indexes as
+columnarStore), and the workers attach to them read-only, so every worker answers from the same physical memory.
+
+A small control segment names the current snapshot. Publishing a new one fills fresh segments and then swaps the
+name under a sequence counter, readers notice the change on their next lookup and move over to the new segments.
+"""
+import json
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from columnarStore import ColumnarTables, buildColumnarArrays
+from constants import Constants
+
+# Control segment layout: sequence counter (odd while a swap is in progress), then the manifest segment name
+_controlFormat = 'Q'
+_controlSize = 256
+_nameOffset = struct.calcsize(_controlFormat)
+# A swap only writes the name, readers finding one in progress back off this long between reads, this many times
+_retryDelaySeconds = 0.0001
+_controlRetries = 10000
+
+
+def _untracked(name: str, create: bool = False, size: int = 0) -> shared_memory.SharedMemory:
+    """
+    Open a shared memory segment without the resource tracker, which would otherwise unlink it as soon as the first
+    process using it exits. The publisher unlinks its segments itself.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+    except TypeError:
+        # Python < 3.13 has no track argument, take the segment back from the tracker instead
+        from multiprocessing import resource_tracker
+        segment = shared_memory.SharedMemory(name=name, create=create, size=size)
+        resource_tracker.unregister(segment._name, 'shared_memory')
+        return segment
+
+
+def _unlink(segment: shared_memory.SharedMemory):
+    """
+    Remove a segment opened by _untracked. Before Python 3.13 SharedMemory.unlink also unregisters the segment from
+    the resource tracker, which no longer knows it, so the name is removed directly.
+    """
+    if getattr(segment, '_track', True) is False or not hasattr(shared_memory, '_posixshmem'):
+        segment.unlink()
+    else:
+        shared_memory._posixshmem.shm_unlink(segment._name)
+
+
+class SnapshotTables(ColumnarTables):
+    """
+    ColumnarTables over attached shared memory segments. The segments are closed once the tables are no longer
+    used, after the arrays viewing them are gone.
+    """
+
+    def __init__(self, arrays: dict, generation, segments: list):
+        super().__init__(arrays, generation)
+        self.segments = segments
+
+    def __del__(self):
+        self.arrays = None
+        for segment in self.segments:
+            segment.close()
+
+
+class SnapshotPublisher:
+    """
+    Owner of a snapshot: loads the data into shared memory and publishes it for the readers.
+
+    Args:
+        name (str): Name of the control segment, shared with the readers.
+    """
+
+    def __init__(self, name: str = Constants.snapshotName.value):
+        self.name = name
+        self.sequence = 0
+        self._segments = []
+
+        # A control segment left behind by a crashed publisher is replaced
+        try:
+            stale = _untracked(name)
+            stale.close()
+            _unlink(stale)
+        except FileNotFoundError:
+            pass
+        self._control = _untracked(name, create=True, size=_controlSize)
+        struct.pack_into(_controlFormat, self._control.buf, 0, 0)
+
+    def publish(self, conn) -> int:
+        """
+        Load the data of a SQLite database into new shared memory segments and make them the current snapshot.
+        The segments of the previous snapshot are unlinked, readers still using them keep their mappings.
+
+        Args:
+            conn (sqlite3.Connection): The connection object to the SQLite database.
+
+        Returns:
+            int: The load generation of the published snapshot.
+        """
+        prefix = f"{self.name}_{self.sequence // 2 + 1}"
+        segments = []
+        layout = {}
+
+        def allocate(name, dtype, shape):
+            segment = _untracked(f"{prefix}_{name}", create=True, size=max(1, dtype.itemsize * int(np.prod(shape))))
+            segments.append(segment)
+            layout[name] = [segment.name, dtype.str, list(shape)]
+            return np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+
+        arrays, generation = buildColumnarArrays(conn, allocate)
+        # the arrays view the segments' buffers, they have to go before the segments can be closed
+        del arrays
+
+        manifest = json.dumps({'generation': generation, 'arrays': layout}).encode()
+        manifestSegment = _untracked(f"{prefix}_manifest", create=True, size=len(manifest))
+        manifestSegment.buf[:len(manifest)] = manifest
+        segments.append(manifestSegment)
+
+        # Swap: an odd counter tells readers a swap is in progress
+        name = manifestSegment.name.lstrip('/').encode()
+        self.sequence += 1
+        struct.pack_into(_controlFormat, self._control.buf, 0, self.sequence)
+        self._control.buf[_nameOffset:_controlSize] = name.ljust(_controlSize - _nameOffset, b'\0')
+        self.sequence += 1
+        struct.pack_into(_controlFormat, self._control.buf, 0, self.sequence)
+
+        self._release(self._segments)
+        self._segments = segments
+        return generation
+
+    @staticmethod
+    def _release(segments: list):
+        for segment in segments:
+            segment.close()
+            try:
+                _unlink(segment)
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        """
+        Unlink the current snapshot and the control segment.
+        """
+        self._release(self._segments)
+        self._segments = []
+        self._release([self._control])
+
+
+class SnapshotReader:
+    """
+    Read-only view of the snapshot published under a control segment name, following every new publication.
+
+    Args:
+        name (str): Name of the control segment.
+    """
+
+    def __init__(self, name: str = Constants.snapshotName.value):
+        self.name = name
+        self._control = None
+        self._sequence = None
+        self._tables = None
+        # request threads of a worker share the reader, only one attaches at a time
+        self._lock = threading.Lock()
+
+    def _readControl(self) -> tuple:
+        # Retry until the counter is even and unchanged around reading the name, i.e. no swap happened meanwhile
+        for _ in range(_controlRetries):
+            sequence = struct.unpack_from(_controlFormat, self._control.buf, 0)[0]
+            if sequence % 2 == 0:
+                name = bytes(self._control.buf[_nameOffset:_controlSize]).rstrip(b'\0').decode()
+                if struct.unpack_from(_controlFormat, self._control.buf, 0)[0] == sequence:
+                    return sequence, name
+            # leave the CPU to the publisher finishing the swap
+            time.sleep(_retryDelaySeconds)
+        # a publisher that died mid-swap leaves the counter odd for good
+        raise TimeoutError(f"The snapshot published under {self.name} is still being swapped")
+
+    def _attach(self, manifestName: str) -> SnapshotTables:
+        manifestSegment = _untracked(manifestName)
+        manifest = json.loads(bytes(manifestSegment.buf).rstrip(b'\0'))
+        segments = [manifestSegment]
+
+        arrays = {}
+        for column, (segmentName, dtype, shape) in manifest['arrays'].items():
+            segment = _untracked(segmentName)
+            segments.append(segment)
+            array = np.ndarray(tuple(shape), dtype=np.dtype(dtype), buffer=segment.buf)
+            array.flags.writeable = False
+            arrays[column] = array
+
+        return SnapshotTables(arrays, manifest['generation'], segments)
+
+    def tables(self) -> SnapshotTables:
+        """
+        Return the tables of the current snapshot, attaching to a newly published one if there is one.
+
+        Raises:
+            FileNotFoundError: If nothing has been published under the name yet.
+            TimeoutError: If a swap of the snapshot does not finish.
+        """
+        with self._lock:
+            if self._control is None:
+                self._control = _untracked(self.name)
+
+            while True:
+                sequence, manifestName = self._readControl()
+                if sequence == self._sequence:
+                    return self._tables
+                if not manifestName:
+                    raise FileNotFoundError(f"No snapshot published under {self.name}")
+                try:
+                    self._tables = self._attach(manifestName)
+                    self._sequence = sequence
+                except FileNotFoundError:
+                    # the snapshot was replaced (and unlinked) while attaching, read the control segment again
+                    continue
@@ -0,0 +1,96 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import patch
+
+from Task1.asyncApp import app
+
+
+async def call_app(path, payload, content_type=b'application/json'):
+    # Drive the ASGI app directly with a single request and collect the response
+    body = json.dumps(payload).encode()
+    response = {'body': b''}
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        else:
+            response['body'] += message.get('body', b'')
+
+    scope = {'type': 'http', 'method': 'POST', 'path': path, 'headers': [(b'content-type', content_type)]}
+    await app(scope, receive, send)
+    return response['status'], response['body'].decode()
+
+
+class AsyncAppTestCase(unittest.TestCase):
+    def test_allByUser_with_valid_payload(self):
+        status, body = asyncio.run(call_app('/allByUser', {'user_id': 12345}))
+
+        self.assertEqual(status, 200)
+        self.assertIsInstance(json.loads(body), list)
+
+    def test_allByUser_stream(self):
+        status, body = asyncio.run(call_app('/allByUser', {'user_id': 12345, 'stream': True}))
+
+        self.assertEqual(status, 200)
+        self.assertIsInstance(json.loads(body), list)
+
+    def test_allByUser_stream_error(self):
+        # A query failing part way through the stream
+        def failingStream(user_id, start, end):
+            yield '[{"user_id":12345}'
+            raise RuntimeError("disk I/O error")
+
+        messages = []
+
+        async def run():
+            async def receive():
+                return {'type': 'http.request', 'body': b'{"user_id": 12345, "stream": true}', 'more_body': False}
+
+            async def send(message):
+                messages.append(message)
+
+            scope = {'type': 'http', 'method': 'POST', 'path': '/allByUser',
+                     'headers': [(b'content-type', b'application/json')]}
+            await app(scope, receive, send)
+
+        with patch('Task1.asyncApp.allByUserStream', failingStream):
+            with self.assertRaises(RuntimeError):
+                asyncio.run(run())
+
+        # The body is never ended, so the server aborts the response instead of completing a truncated array
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertTrue(all(message.get('more_body') for message in messages[1:]))
+
+    def test_allByUser_with_missing_user_id(self):
+        status, body = asyncio.run(call_app('/allByUser', {}))
+
+        self.assertEqual(status, 400)
+        self.assertEqual(json.loads(body), {"error": '"Invalid JSON payload: \'user_id\' key is missing."'})
+
+    def test_netMerchant_with_extra_fields(self):
+        status, body = asyncio.run(call_app('/netMerchant', {'merchant_type_code': 12345, 'extra_field': 'extra'}))
+
+        self.assertEqual(status, 400)
+        self.assertEqual(json.loads(body), {"error": "Invalid JSON payload: Extra fields found: extra_field"})
+
+    def test_unsupported_media_type(self):
+        status, _ = asyncio.run(call_app('/netMerchant', {'merchant_type_code': 12345}, b'text/plain'))
+
+        self.assertEqual(status, 415)
+
+    def test_concurrent_requests(self):
+        # Many requests in flight at once on a single event loop
+        async def run_all():
+            return await asyncio.gather(*(call_app('/netMerchant', {'merchant_type_code': code})
+                                          for code in range(5000, 5100)))
+
+        statuses = [status for status, _ in asyncio.run(run_all())]
+        self.assertEqual(statuses, [200] * 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+from unittest.mock import patch
+
+from Task1.cache import ResultCache
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.generation = 1
+        self.cache = ResultCache(lambda: self.generation, maxEntries=2, ttlSeconds=60, generationCheckSeconds=0)
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.put('a', '[]')
+
+        self.assertEqual(self.cache.get('a'), '[]')
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_lru_eviction(self):
+        self.cache.put('a', '1')
+        self.cache.put('b', '2')
+        # Touch 'a' so 'b' becomes the least recently used entry
+        self.cache.get('a')
+        self.cache.put('c', '3')
+
+        self.assertEqual(self.cache.get('a'), '1')
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_ttl_expiry(self):
+        with patch('Task1.cache.time.monotonic', return_value=1000.0):
+            self.cache.put('a', '1')
+        with patch('Task1.cache.time.monotonic', return_value=1059.0):
+            self.assertEqual(self.cache.get('a'), '1')
+        with patch('Task1.cache.time.monotonic', return_value=1061.0):
+            self.assertIsNone(self.cache.get('a'))
+
+    def test_generation_change_invalidates(self):
+        self.cache.put('a', '1')
+        self.generation = 2
+
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.stats()['invalidations'], 1)
+        self.assertEqual(self.cache.stats()['generation'], 2)
+
+    def test_put_from_previous_generation_dropped(self):
+        # A request reads the generation, then a reload lands while it computes its result
+        generation = self.cache.generation()
+        self.generation = 2
+        self.cache.put('a', 'old', generation)
+
+        self.assertIsNone(self.cache.get('a'))
+
+        generation = self.cache.generation()
+        self.cache.put('a', 'new', generation)
+        self.assertEqual(self.cache.get('a'), 'new')
+
+    def test_generation_read_outside_lock(self):
+        # The source queries SQLite, other threads must not wait on the cache lock meanwhile
+        held = []
+        self.cache.generationSource = lambda: held.append(self.cache._lock.locked()) or self.generation
+
+        self.cache.get('a')
+        self.cache.put('a', '1')
+
+        self.assertEqual(held, [False, False])
+
+    def test_unhashable_key_not_cached(self):
+        self.cache.put(('allByUser', [1]), '[]')
+        self.assertIsNone(self.cache.get(('allByUser', [1])))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from Task1.columnarStore import buildColumnarStore, ColumnarStore
+from Task1.constants import getAllByUsersCall, getNetMerchantCall
+from Task1.tests.fixtures import makeDatabase
+
+
+class TestColumnarStore(unittest.TestCase):
+    def setUp(self):
+        self.conn = makeDatabase([
+            (2, 'PurchaseActivity', 5200, 1000, '2023-06-01T10:00:00'),
+            (1, 'PurchaseActivity', 5732, 2000, '2023-06-02T10:00:00'),
+            (2, 'PurchaseActivity', 5200, 3000, '2023-06-03T10:00:00.123456'),
+            (2, 'ReturnActivity', 5200, 500, '2023-06-02T12:00:00'),
+        ])
+
+        self.directory = os.path.join(tempfile.mkdtemp(), 'columnar')
+        buildColumnarStore(self.conn, self.directory, chunkRows=2)
+        self.store = ColumnarStore(self.directory)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(os.path.dirname(self.directory))
+
+    def test_user_transactions(self):
+        # Purchases and returns of the user, ordered by datetime
+        self.assertEqual(self.store.userTransactions(2), [
+            (2, 1000, '2023-06-01T10:00:00', 5200),
+            (2, 500, '2023-06-02T12:00:00', 5200),
+            (2, 3000, '2023-06-03T10:00:00.123456', 5200),
+        ])
+        self.assertEqual(self.store.userTransactions(1), [(1, 2000, '2023-06-02T10:00:00', 5732)])
+
+    def test_unknown_keys(self):
+        self.assertEqual(self.store.userTransactions(3), [])
+        self.assertEqual(self.store.userTransactions(0), [])
+        self.assertEqual(self.store.userTransactions('abc'), [])
+        self.assertEqual(self.store.merchantNet(1234), [])
+
+    def test_non_integral_keys(self):
+        # SQLite's integer columns only match whole numbers
+        self.assertEqual(self.store.userTransactions(1.5), [])
+        self.assertEqual(self.store.userTransactions(True), [])
+        self.assertEqual(self.store.userTransactions(2 ** 70), [])
+        self.assertEqual(self.store.userTransactions(1.0), [(1, 2000, '2023-06-02T10:00:00', 5732)])
+        self.assertEqual(self.store.userTransactions('1'), [(1, 2000, '2023-06-02T10:00:00', 5732)])
+
+    def test_merchant_net(self):
+        self.assertEqual(self.store.merchantNet(5200), [
+            ('2023-06-01', 1000, 5200),
+            ('2023-06-02', -500, 5200),
+            ('2023-06-03', 3000, 5200),
+        ])
+
+    def test_date_range(self):
+        # same rows as the bounded queries
+        ranges = [('2023-06-02', None), (None, '2023-06-03T10:00:00.123456'), ('2023-06-02T12:00:00', '2023-06-03'),
+                  ('2023-06-04', None)]
+        for start, end in ranges:
+            params = {'user_id': 2, 'merchant_type_code': 5200, 'start': start, 'end': end}
+            query = getAllByUsersCall(False, start is not None, end is not None)
+            expected = sorted(self.conn.execute(query, params).fetchall(), key=lambda row: row[2])
+            self.assertEqual(self.store.userTransactions(2, start, end), expected)
+
+            # the rollup only takes dates
+            start, end = start and start[:10], end and end[:10]
+            params.update(start=start, end=end)
+            query = getNetMerchantCall(start is not None, end is not None)
+            self.assertEqual(self.store.merchantNet(5200, start, end), self.conn.execute(query, params).fetchall())
+
+    def test_rebuild_replaces_store(self):
+        self.conn.execute("INSERT INTO purchases VALUES (3, 'PurchaseActivity', 5310, 100, '2023-06-04T10:00:00')")
+        buildColumnarStore(self.conn, self.directory)
+
+        self.assertEqual(ColumnarStore(self.directory).userTransactions(3), [(3, 100, '2023-06-04T10:00:00', 5310)])
+        # the store opened before keeps reading its own version
+        self.assertEqual(self.store.userTransactions(3), [])
+
+    def test_rebuild_keeps_previous_version(self):
+        buildColumnarStore(self.conn, self.directory)
+        buildColumnarStore(self.conn, self.directory)
+
+        # A reader that read the pointer just before the last swap can still open the version it names
+        self.assertEqual(sorted(os.listdir(self.directory)), ['CURRENT', 'v2', 'v3'])
+        self.assertEqual(ColumnarStore(self.directory).path, os.path.join(self.directory, 'v3'))
+
+    def test_store_without_versions(self):
+        # A store built before versions, its files right in the directory
+        version = ColumnarStore(self.directory).path
+        legacy = self.directory + '.legacy'
+        shutil.copytree(version, legacy)
+        self.assertEqual(ColumnarStore(legacy).userTransactions(1), [(1, 2000, '2023-06-02T10:00:00', 5732)])
+
+        # the next build moves it to a version and removes the old files
+        buildColumnarStore(self.conn, legacy)
+        self.assertEqual(sorted(os.listdir(legacy)), ['CURRENT', 'v1'])
+        self.assertEqual(ColumnarStore(legacy).userTransactions(1), [(1, 2000, '2023-06-02T10:00:00', 5732)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from Task1.constants import Constants
+from Task1.dataGenerator import generateTransactions, writeCsv
+from Task1.dbManager import loadTransactions
+
+
+class TestDataGenerator(unittest.TestCase):
+    def test_exact_row_count(self):
+        for rows in (1, 999, 10000):
+            self.assertEqual(sum(len(chunk) for chunk in generateTransactions(rows, chunkRows=512)), rows)
+
+    def test_deterministic(self):
+        first = [row for chunk in generateTransactions(5000, seed=7) for row in chunk]
+        # the chunk size only changes how the rows are handed out
+        second = [row for chunk in generateTransactions(5000, seed=7, chunkRows=333) for row in chunk]
+        other = [row for chunk in generateTransactions(5000, seed=8) for row in chunk]
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+
+    def test_chunks_are_bounded(self):
+        self.assertTrue(all(len(chunk) <= 100 for chunk in generateTransactions(1000, chunkRows=100)))
+
+    def test_rows_look_like_the_csv(self):
+        rows = [row for chunk in generateTransactions(20000, returnRatio=0.05) for row in chunk]
+
+        self.assertEqual([row[4] for row in rows], sorted(row[4] for row in rows))
+        self.assertTrue(all(row[4].startswith('2023-') for row in rows))
+        self.assertTrue(all(type(row[0]) is int and type(row[2]) is int and row[3] > 0 for row in rows))
+
+        returns = sum(row[1] == 'ReturnActivity' for row in rows) / len(rows)
+        self.assertAlmostEqual(returns, 0.05, delta=0.01)
+        self.assertEqual({row[1] for row in rows}, {'PurchaseActivity', 'ReturnActivity'})
+
+    def test_csv_loads(self):
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        os.close(handle)
+        conn = sqlite3.connect(':memory:')
+        conn.execute(Constants.createPurchases.value)
+        conn.execute(Constants.createReturns.value)
+        try:
+            self.assertEqual(writeCsv(path, generateTransactions(3000, chunkRows=1000)), 3000)
+            self.assertEqual(loadTransactions(conn, path, chunkRows=1000), 3000)
+        finally:
+            conn.close()
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
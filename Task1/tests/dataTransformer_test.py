@@ -1,5 +1,7 @@
+import json
 import unittest
-from Task1.dataTransformer import allByUserTransform, netMerchantTransform
+from Task1.dataTransformer import allByUserTransform, allByUserBatchTransform, allByUserStreamTransform, \
+    netMerchantTransform, netMerchantExportTransform
 
 
 class TestDataTransformerFunctions(unittest.TestCase):
@@ -39,6 +41,68 @@ class TestDataTransformerFunctions(unittest.TestCase):
         result = allByUserTransform(res)
         self.assertEqual(result, expected_json)
 
+    def test_allByUserBatchTransform(self):
+        # Test case with rows for some of the requested users
+        res = [
+            (1, 1000, '2023-06-01 10:00:00', 123),
+            (2, 2000, '2023-06-02 10:00:00', 456),
+            (1, 3000, '2023-06-03 10:00:00', 789)
+        ]
+        expected_json = '{"1":[{"user_id":1,"datetime":"2023-06-01 10:00:00","merchant_type_code":123,' \
+                        '"amount_in_dollars":10.0},' \
+                        '{"user_id":1,"datetime":"2023-06-03 10:00:00","merchant_type_code":789,' \
+                        '"amount_in_dollars":30.0}],' \
+                        '"2":[{"user_id":2,"datetime":"2023-06-02 10:00:00","merchant_type_code":456,' \
+                        '"amount_in_dollars":20.0}],' \
+                        '"3":[]}'
+        result = allByUserBatchTransform(res, [1, 2, 3])
+        self.assertEqual(result, expected_json)
+
+    def test_allByUserStreamTransform(self):
+        # Test case with the records split over several batches, including an empty one
+        batches = [
+            [(1, 1000, '2023-06-01 10:00:00', 123), (1, 2000, '2023-06-02 10:00:00', 456)],
+            [],
+            [(1, 3000, '2023-06-03 10:00:00', 789)]
+        ]
+        expected_json = allByUserTransform(batches[0] + batches[2])
+        result = ''.join(allByUserStreamTransform(batches))
+        self.assertEqual(result, expected_json)
+
+        # Test case with no batches at all
+        result = ''.join(allByUserStreamTransform([]))
+        self.assertEqual(result, '[]')
+
+    def test_allByUserStreamTransform_error(self):
+        # A query failing after its first batch
+        def batches():
+            yield [(1, 1000, '2023-06-01 10:00:00', 123)]
+            raise RuntimeError("disk I/O error")
+
+        pieces = []
+        with self.assertRaises(RuntimeError):
+            for piece in allByUserStreamTransform(batches()):
+                pieces.append(piece)
+
+        # The array is never closed, so the cut off stream is not valid JSON
+        self.assertNotIn(']', pieces)
+        with self.assertRaises(ValueError):
+            json.loads(''.join(pieces))
+
+    def test_netMerchantExportTransform(self):
+        batches = [[(123, '2023-06-01', 5000), (123, '2023-06-02', -250)], [(456, '2023-06-01', 1)]]
+
+        ndjson = ''.join(netMerchantExportTransform(iter(batches)))
+        self.assertEqual([json.loads(line) for line in ndjson.splitlines()], [
+            {"merchant_type_code": 123, "period": "2023-06-01", "net_amount_in_dollars": 50.0},
+            {"merchant_type_code": 123, "period": "2023-06-02", "net_amount_in_dollars": -2.5},
+            {"merchant_type_code": 456, "period": "2023-06-01", "net_amount_in_dollars": 0.01},
+        ])
+
+        csv = ''.join(netMerchantExportTransform(iter(batches), 'csv'))
+        self.assertEqual(csv, 'merchant_type_code,period,net_amount_in_dollars\n'
+                              '123,2023-06-01,50.0\n123,2023-06-02,-2.5\n456,2023-06-01,0.01\n')
+
     def test_netMerchantTransform(self):
         # Test case with multiple net merchant records
         res = [
@@ -72,5 +136,35 @@ class TestDataTransformerFunctions(unittest.TestCase):
         self.assertEqual(result, expected_json)
 
 
+    def test_allByUserTransform_matches_pandas_encoding(self):
+        # Values whose pandas encoding differs from plain json/repr output
+        res = [
+            (1, 123456789, '2023-06-01T10:00:00.5', 123),
+            (2, -5, 'a/b \u00e9', 456),
+            (3, 7, '2023-06-03 10:00:00', 789)
+        ]
+        expected_json = '[{"user_id":1,"datetime":"2023-06-01T10:00:00.5","merchant_type_code":123,' \
+                        '"amount_in_dollars":1234567.8899999999},' \
+                        '{"user_id":2,"datetime":"a\\/b \\u00e9","merchant_type_code":456,' \
+                        '"amount_in_dollars":-0.05},' \
+                        '{"user_id":3,"datetime":"2023-06-03 10:00:00","merchant_type_code":789,' \
+                        '"amount_in_dollars":0.07}]'
+        result = allByUserTransform(res)
+        self.assertEqual(result, expected_json)
+
+    def test_allByUserTransform_pandas_fallback(self):
+        # A missing amount is not handled by the fast encoder and goes through pandas
+        res = [
+            (1, None, '2023-06-01 10:00:00', 123),
+            (1, 2000, '2023-06-02 10:00:00', 456)
+        ]
+        expected_json = '[{"user_id":1,"datetime":"2023-06-01 10:00:00","merchant_type_code":123,' \
+                        '"amount_in_dollars":null},' \
+                        '{"user_id":1,"datetime":"2023-06-02 10:00:00","merchant_type_code":456,' \
+                        '"amount_in_dollars":20.0}]'
+        result = allByUserTransform(res)
+        self.assertEqual(result, expected_json)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,18 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
 import unittest
 from unittest.mock import patch
 
-from Task1.dbManager import generateDfPurchaseReturns, executeQuery
+from Task1.constants import Constants, schemaMigrations, getAllByUsersCall, getAllByUsersBatchCall, \
+    getAllByUsersPageCall
+from Task1.dbManager import generateDfPurchaseReturns, executeQuery, iterateQuery, ConnectionPool, migrateSchema, \
+    verifySchema, updateDailyMerchantNet, loadTransactions, ingestTransactions, getStorageLayout, \
+    convertToUnifiedLayout, enableQueryProfiler, disableQueryProfiler
+from Task1.tests.fixtures import makeDatabase
 import pandas as pd
 
 
@@ -69,5 +80,335 @@ class TestDbManagerFunctions(unittest.TestCase):
         self.assertIsNone(result)
 
 
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        # Build a small database file to read from
+        handle, self.db_file = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        conn = sqlite3.connect(self.db_file)
+        conn.execute("CREATE TABLE t (x int)")
+        conn.executemany("INSERT INTO t VALUES (?)", [(1,), (2,)])
+        conn.commit()
+        conn.close()
+
+        self.pool = ConnectionPool(self.db_file)
+
+    def tearDown(self):
+        self.pool.closeAll()
+        os.remove(self.db_file)
+
+    def test_connection_reused_within_thread(self):
+        self.assertIs(self.pool.getConnection(), self.pool.getConnection())
+
+    def test_connection_per_thread(self):
+        connections = []
+        thread = threading.Thread(target=lambda: connections.append(self.pool.getConnection()))
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(connections[0], self.pool.getConnection())
+
+    def test_read_only(self):
+        with self.assertRaises(sqlite3.OperationalError):
+            self.pool.getConnection().execute("INSERT INTO t VALUES (3)")
+
+    def test_execute_query_pooled(self):
+        result = executeQuery("SELECT x FROM t ORDER BY x", self.db_file, self.pool)
+        self.assertEqual(result, [(1,), (2,)])
+
+    def test_iterate_query_error_raised(self):
+        # Fails on the last row, after the first batch was handed out (the cursor may read a row ahead)
+        self.pool.getConnection().create_function('fails_on_3', 1, lambda x: 1 // (3 - x))
+        query = "SELECT x, fails_on_3(x) FROM (SELECT x FROM t UNION ALL SELECT 3)"
+
+        batches = []
+        with self.assertRaises(sqlite3.OperationalError):
+            for batch in iterateQuery(query, self.pool, batchRows=1):
+                batches.append(batch)
+
+        self.assertEqual(batches[0], [(1, 0)])
+
+    def test_iterate_query_profiles_database_time_only(self):
+        handle, log = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        profiler = enableQueryProfiler(log, slowMs=20)
+        try:
+            for _ in iterateQuery("SELECT x FROM t", self.pool, batchRows=1):
+                # a slow consumer of the stream
+                time.sleep(0.03)
+        finally:
+            disableQueryProfiler()
+
+        stats = profiler.stats()["SELECT x FROM t"]
+        self.assertEqual((stats['calls'], stats['rows']), (1, 2))
+        self.assertLess(stats['total_ms'], 20)
+        with open(log) as file:
+            self.assertFalse(any('slow' in json.loads(line)['reasons'] for line in file))
+        os.remove(log)
+
+    def test_unhealthy_connection_replaced(self):
+        self.pool.healthCheckSeconds = 0
+        conn = self.pool.getConnection()
+        conn.close()
+
+        # The closed connection fails its health check and is swapped for a new one
+        replacement = self.pool.getConnection()
+        self.assertIsNot(conn, replacement)
+        self.assertEqual(replacement.execute("SELECT count(*) FROM t").fetchone(), (2,))
+
+
+class TestLoadTransactions(unittest.TestCase):
+    def setUp(self):
+        handle, self.csv_file = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w') as file:
+            file.write("user_id,transaction_type,merchant_type_code,amount_cents,datetime\n"
+                       "1,PurchaseActivity,5200,1000,2023-06-01T10:00:00\n"
+                       "1,ReturnActivity,5200,500,2023-06-01T12:00:00\n"
+                       "2,PurchaseActivity,5732,1500,2023-06-02T10:00:00\n"
+                       "3,OtherActivity,5732,100,2023-06-02T11:00:00\n"
+                       "3,PurchaseActivity,5310,2500,2023-06-03T10:00:00\n")
+
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.execute(Constants.createPurchases.value)
+        self.conn.execute(Constants.createReturns.value)
+
+    def tearDown(self):
+        self.conn.close()
+        os.remove(self.csv_file)
+
+    def test_load_in_chunks(self):
+        # A chunk size smaller than the file forces several batches
+        loaded = loadTransactions(self.conn, self.csv_file, chunkRows=2)
+
+        self.assertEqual(loaded, 4)
+        self.assertEqual(self.conn.execute("SELECT * FROM purchases ORDER BY datetime").fetchall(), [
+            (1, 'PurchaseActivity', 5200, 1000, '2023-06-01T10:00:00'),
+            (2, 'PurchaseActivity', 5732, 1500, '2023-06-02T10:00:00'),
+            (3, 'PurchaseActivity', 5310, 2500, '2023-06-03T10:00:00'),
+        ])
+        self.assertEqual(self.conn.execute("SELECT * FROM returns").fetchall(), [
+            (1, 'ReturnActivity', 5200, 500, '2023-06-01T12:00:00'),
+        ])
+
+
+class TestIngestTransactions(unittest.TestCase):
+    def setUp(self):
+        self.conn = makeDatabase([
+            (1, 'PurchaseActivity', 5200, 1000, '2023-06-01T10:00:00'),
+            (2, 'PurchaseActivity', 5200, 2000, '2023-06-02T10:00:00'),
+        ])
+        self.files = []
+
+    def tearDown(self):
+        self.conn.close()
+        for path in self.files:
+            os.remove(path)
+
+    def write_csv(self, *rows):
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w') as file:
+            file.write("user_id,transaction_type,merchant_type_code,amount_cents,datetime\n")
+            file.writelines(row + "\n" for row in rows)
+        self.files.append(path)
+        return path
+
+    def daily(self):
+        return self.conn.execute("SELECT * FROM daily_merchant_net ORDER BY date").fetchall()
+
+    def test_watermark_skips_old_rows(self):
+        generation = self.conn.execute(Constants.getGeneration.value).fetchone()[0]
+        delta = self.write_csv("2,PurchaseActivity,5200,2000,2023-06-02T10:00:00",
+                               "2,ReturnActivity,5200,500,2023-06-02T12:00:00",
+                               "3,PurchaseActivity,5200,700,2023-06-03T09:00:00")
+
+        result = ingestTransactions(self.conn, [delta], chunkRows=2)
+
+        self.assertEqual(result, {'read': 3, 'added': 2, 'watermark': '2023-06-03T09:00:00'})
+        self.assertEqual(self.conn.execute("SELECT count(*) FROM purchases").fetchone(), (3,))
+        self.assertEqual(self.conn.execute("SELECT * FROM returns").fetchall(),
+                         [(2, 'ReturnActivity', 5200, 500, '2023-06-02T12:00:00')])
+        # the rollup is updated in place, not rebuilt
+        self.assertEqual(self.daily(), [(5200, '2023-06-01', 1000, 0), (5200, '2023-06-02', 2000, 500),
+                                        (5200, '2023-06-03', 700, 0)])
+        self.assertEqual(self.conn.execute(Constants.getGeneration.value).fetchone()[0], generation + 1)
+        self.assertEqual(self.conn.execute(Constants.getWatermark.value).fetchone(), ('2023-06-03T09:00:00',))
+
+        # ingesting the same file again adds nothing
+        self.assertEqual(ingestTransactions(self.conn, [delta])['added'], 0)
+        self.assertEqual(self.conn.execute(Constants.getGeneration.value).fetchone()[0], generation + 1)
+
+    def test_same_file_twice(self):
+        delta = self.write_csv("3,PurchaseActivity,5200,700,2023-06-03T09:00:00",
+                               "4,PurchaseActivity,5200,100,2023-06-03T10:00:00")
+
+        result = ingestTransactions(self.conn, [delta, delta])
+
+        # the second copy is compared to the watermark the first one left, like a second call would
+        self.assertEqual(result['added'], 2)
+        self.assertEqual(self.conn.execute("SELECT count(*) FROM purchases").fetchone(), (4,))
+        self.assertEqual(self.daily()[-1], (5200, '2023-06-03', 800, 0))
+
+    def test_rows_at_watermark(self):
+        first = self.write_csv("3,PurchaseActivity,5200,700,2023-06-03T09:00:00")
+        ingestTransactions(self.conn, [first])
+
+        # More rows of the watermark's instant arrive with the next file, next to the one already loaded
+        delta = self.write_csv("3,PurchaseActivity,5200,700,2023-06-03T09:00:00",
+                               "4,PurchaseActivity,5200,100,2023-06-03T09:00:00",
+                               "4,PurchaseActivity,5200,100,2023-06-03T09:00:00",
+                               "1,PurchaseActivity,5200,50,2023-06-02T09:00:00")
+        result = ingestTransactions(self.conn, [delta], chunkRows=2)
+
+        self.assertEqual(result, {'read': 4, 'added': 1, 'watermark': '2023-06-03T09:00:00'})
+        self.assertEqual(self.conn.execute("SELECT user_id, amount_cents FROM purchases WHERE datetime = ? "
+                                           "ORDER BY user_id", ('2023-06-03T09:00:00',)).fetchall(),
+                         [(3, 700), (4, 100)])
+        self.assertEqual(self.daily()[-1], (5200, '2023-06-03', 800, 0))
+
+    def test_dedupe_accepts_late_rows(self):
+        delta = self.write_csv("1,PurchaseActivity,5200,1000,2023-06-01T10:00:00",
+                               "1,PurchaseActivity,5200,300,2023-06-01T11:00:00",
+                               "1,PurchaseActivity,5200,300,2023-06-01T11:00:00")
+
+        result = ingestTransactions(self.conn, [delta], dedupe=True)
+
+        self.assertEqual(result['added'], 1)
+        self.assertEqual(self.daily()[0], (5200, '2023-06-01', 1300, 0))
+
+    def test_failure_applies_nothing(self):
+        good = self.write_csv("3,PurchaseActivity,5200,700,2023-06-03T09:00:00")
+        bad = self.write_csv("4,PurchaseActivity,5200,not a number,2023-06-04T09:00:00")
+
+        with self.assertRaises(ValueError):
+            ingestTransactions(self.conn, [good, bad])
+
+        self.assertEqual(self.conn.execute("SELECT count(*) FROM purchases").fetchone(), (2,))
+        self.assertEqual(len(self.daily()), 2)
+
+
+class TestSchemaMigrations(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.execute(Constants.createPurchases.value)
+        self.conn.execute(Constants.createReturns.value)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_migrate_to_latest_version(self):
+        version = migrateSchema(self.conn)
+
+        self.assertEqual(version, len(schemaMigrations))
+        self.assertEqual(self.conn.execute("PRAGMA user_version").fetchone()[0], len(schemaMigrations))
+        verifySchema(self.conn)
+
+    def test_migrate_is_idempotent(self):
+        migrateSchema(self.conn)
+        self.assertEqual(migrateSchema(self.conn), len(schemaMigrations))
+
+    def test_verify_unmigrated_schema(self):
+        with self.assertRaises(Exception):
+            verifySchema(self.conn)
+
+    def test_daily_merchant_net_built(self):
+        self.conn.executemany("INSERT INTO purchases VALUES (?, ?, ?, ?, ?)", [
+            (1, 'PurchaseActivity', 5200, 1000, '2023-06-01T10:00:00'),
+            (2, 'PurchaseActivity', 5200, 2000, '2023-06-01T11:00:00'),
+        ])
+        self.conn.executemany("INSERT INTO returns VALUES (?, ?, ?, ?, ?)", [
+            (1, 'ReturnActivity', 5200, 300, '2023-06-01T12:00:00'),
+            (1, 'ReturnActivity', 5200, 200, '2023-06-01T13:00:00'),
+        ])
+        migrateSchema(self.conn)
+
+        # Each purchase is counted once no matter how many returns share its day
+        rows = self.conn.execute("SELECT * FROM daily_merchant_net").fetchall()
+        self.assertEqual(rows, [(5200, '2023-06-01', 3000, 500)])
+
+    def test_update_daily_merchant_net(self):
+        migrateSchema(self.conn)
+        updateDailyMerchantNet(self.conn, [
+            ('PurchaseActivity', 5200, 1000, '2023-06-01T10:00:00'),
+            ('ReturnActivity', 5200, 400, '2023-06-01T12:00:00'),
+        ])
+        updateDailyMerchantNet(self.conn, [
+            ('PurchaseActivity', 5200, 500, '2023-06-01T18:00:00'),
+            ('PurchaseActivity', 5732, 700, '2023-06-02T09:00:00'),
+        ])
+
+        rows = self.conn.execute("SELECT * FROM daily_merchant_net ORDER BY merchant_type_code").fetchall()
+        self.assertEqual(rows, [(5200, '2023-06-01', 1500, 400), (5732, '2023-06-02', 700, 0)])
+
+    def test_user_lookup_uses_index(self):
+        migrateSchema(self.conn)
+        plan = self.conn.execute("EXPLAIN QUERY PLAN SELECT amount_cents FROM purchases WHERE user_id = 1").fetchall()
+        self.assertIn('USING COVERING INDEX', plan[0][3])
+
+    def test_date_range_uses_index_range(self):
+        migrateSchema(self.conn)
+        params = {'user_id': 1, 'start': '2023-06-01', 'end': '2023-06-08'}
+        plan = self.conn.execute("EXPLAIN QUERY PLAN " + getAllByUsersCall(False, True, True), params).fetchall()
+        searches = [row[3] for row in plan if row[3].startswith('SEARCH')]
+
+        self.assertEqual(len(searches), 2)
+        for detail in searches:
+            self.assertIn('(user_id=? AND datetime>? AND datetime<?)', detail)
+
+
+class TestUnifiedLayout(unittest.TestCase):
+    def setUp(self):
+        self.conn = makeDatabase([
+            (1, 'PurchaseActivity', 5200, 1000, '2023-06-01T10:00:00'),
+            (1, 'PurchaseActivity', 5732, 700, '2023-06-03T09:00:00'),
+            (2, 'PurchaseActivity', 5200, 2000, '2023-06-02T10:00:00'),
+            (1, 'ReturnActivity', 5200, 500, '2023-06-02T12:00:00'),
+        ])
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_convert(self):
+        split = self.conn.execute(getAllByUsersCall(), {'user_id': 1}).fetchall()
+        self.assertEqual(getStorageLayout(self.conn), 'split')
+
+        convertToUnifiedLayout(self.conn)
+        convertToUnifiedLayout(self.conn)
+
+        self.assertEqual(getStorageLayout(self.conn), 'unified')
+        verifySchema(self.conn)
+        # already in datetime order
+        self.assertEqual(self.conn.execute(getAllByUsersCall(True), {'user_id': 1}).fetchall(),
+                         sorted(split, key=lambda row: row[2]))
+        self.assertEqual(sorted(self.conn.execute(getAllByUsersBatchCall(2, True), (1, 2)).fetchall()),
+                         sorted(split + [(2, 2000, '2023-06-02T10:00:00', 5200)]))
+        # the rollup is left as it was
+        self.assertEqual(self.conn.execute("SELECT count(*) FROM daily_merchant_net").fetchone(), (3,))
+
+    def test_page(self):
+        convertToUnifiedLayout(self.conn)
+        query = getAllByUsersPageCall(True)
+
+        first = self.conn.execute(query, {'user_id': 1, 'datetime': '', 'src': -1, 'rid': -1, 'limit': 2}).fetchall()
+        last = first[-1]
+        rest = self.conn.execute(query, {'user_id': 1, 'datetime': last[2], 'src': last[4], 'rid': last[5],
+                                         'limit': 2}).fetchall()
+
+        self.assertEqual([row[2] for row in first + rest],
+                         ['2023-06-01T10:00:00', '2023-06-02T12:00:00', '2023-06-03T09:00:00'])
+
+    def test_views_accept_inserts(self):
+        convertToUnifiedLayout(self.conn)
+        self.conn.execute(Constants.insertReturn.value, (2, 'ReturnActivity', 5200, 100, '2023-06-04T10:00:00'))
+
+        self.assertEqual(self.conn.execute("SELECT * FROM returns WHERE user_id = 2").fetchall(),
+                         [(2, 'ReturnActivity', 5200, 100, '2023-06-04T10:00:00')])
+        self.assertEqual(self.conn.execute("SELECT count(*) FROM purchases").fetchone(), (3,))
+
+    def test_user_lookup_uses_covering_index(self):
+        convertToUnifiedLayout(self.conn)
+        plan = self.conn.execute("EXPLAIN QUERY PLAN " + getAllByUsersCall(True), {'user_id': 1}).fetchall()
+        self.assertIn('USING COVERING INDEX idx_transactions_user_datetime', plan[0][3])
+
+
 if __name__ == '__main__':
     unittest.main()
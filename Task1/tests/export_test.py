@@ -0,0 +1,49 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from Task1.tests.fixtures import makeDatabase
+
+_appDirectory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        handle, self.database = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        makeDatabase([
+            (1, 'PurchaseActivity', 5200, 1000, '2023-06-01T10:00:00'),
+            (2, 'PurchaseActivity', 5732, 2000, '2023-06-02T10:00:00'),
+        ], self.database).close()
+
+    def tearDown(self):
+        os.remove(self.database)
+
+    def export(self, *args):
+        return subprocess.run([sys.executable, 'export.py', '--database', self.database, *args], cwd=_appDirectory,
+                              capture_output=True, text=True)
+
+    def test_export_to_stdout(self):
+        result = self.export('--granularity', 'day')
+
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(len(result.stdout.splitlines()), 2)
+
+    def test_failure_reported_on_stderr(self):
+        conn = sqlite3.connect(self.database)
+        conn.execute("DROP TABLE daily_merchant_net")
+        conn.close()
+
+        result = self.export('--granularity', 'day')
+
+        # Nothing but the export goes to standard output, the failure is reported and ends the process with an error
+        self.assertNotEqual(result.returncode, 0)
+        self.assertEqual(result.stdout, '')
+        self.assertIn('daily_merchant_net', result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+import sqlite3
+
+from Task1.constants import Constants
+from Task1.dbManager import migrateSchema
+
+
+def makeDatabase(rows, path=':memory:'):
+    """
+    Creates a database of the current schema holding the given transactions.
+
+    Args:
+        rows (list): Transactions as (user_id, transaction_type, merchant_type_code, amount_cents, datetime); those of
+            type ReturnActivity go to the returns table, all others to purchases.
+        path (str): The database file, in memory by default.
+
+    Returns:
+        sqlite3.Connection: An open connection to the database.
+    """
+    conn = sqlite3.connect(path)
+    conn.execute(Constants.createPurchases.value)
+    conn.execute(Constants.createReturns.value)
+    conn.executemany(Constants.insertPurchase.value, [row for row in rows if row[1] != 'ReturnActivity'])
+    conn.executemany(Constants.insertReturn.value, [row for row in rows if row[1] == 'ReturnActivity'])
+    migrateSchema(conn)
+    conn.commit()
+    return conn
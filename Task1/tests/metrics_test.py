@@ -0,0 +1,102 @@
+import multiprocessing
+import shutil
+import tempfile
+import time
+import unittest
+
+from Task1 import metrics
+
+
+def _serveRequests(directory, count):
+    # a worker of the prefork server
+    metrics.shareAcrossProcesses(directory)
+    for _ in range(count):
+        metrics.startRequest('/allByUser', 'GET')
+        metrics.addRows(5)
+        metrics.finishRequest(200, 100)
+    metrics.renderMetrics()
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        metrics.enabled = True
+
+    def tearDown(self):
+        metrics.finishRequest(200)
+        metrics.enabled = True
+        metrics.shareAcrossProcesses(None)
+
+    def test_stages_outside_a_request_are_ignored(self):
+        with metrics.stage('db'):
+            pass
+        metrics.addRows(3)
+
+        self.assertIsNone(metrics.finishRequest(200))
+        self.assertNotIn('kasheesh_query_rows_count', metrics.renderMetrics())
+
+    def test_server_timing(self):
+        metrics.startRequest('/netMerchant', 'POST')
+        with metrics.stage('db'):
+            time.sleep(0.002)
+        with metrics.stage('db'):
+            pass
+        metrics.timedStage('transform')(lambda: None)()
+        metrics.addRows(4)
+        metrics.setCacheStatus('miss')
+
+        header = metrics.finishRequest(200, 120)
+        parts = header.split(', ')
+
+        # repeated stages add up into one entry
+        self.assertEqual([part.split(';')[0] for part in parts], ['db', 'transform', 'cache', 'app'])
+        self.assertGreaterEqual(float(parts[0].split('dur=')[1]), 2)
+        self.assertEqual(parts[2], 'cache;desc="miss"')
+
+    def test_histograms(self):
+        for rows in (0, 5, 50):
+            metrics.startRequest('/allByUser', 'GET')
+            metrics.addRows(rows)
+            metrics.finishRequest(200, 1000)
+        text = metrics.renderMetrics()
+
+        self.assertIn('kasheesh_requests_total{endpoint="/allByUser",method="GET",status="200"} 3', text)
+        self.assertIn('kasheesh_query_rows_bucket{endpoint="/allByUser",le="10"} 2', text)
+        self.assertIn('kasheesh_query_rows_bucket{endpoint="/allByUser",le="+Inf"} 3', text)
+        self.assertIn('kasheesh_query_rows_sum{endpoint="/allByUser"} 55.000000', text)
+        self.assertIn('kasheesh_response_bytes_bucket{endpoint="/allByUser",le="1024"} 3', text)
+        self.assertIn('# TYPE kasheesh_stage_duration_seconds histogram', text)
+
+    def test_shared_across_processes(self):
+        directory = tempfile.mkdtemp()
+        try:
+            metrics.shareAcrossProcesses(directory)
+            context = multiprocessing.get_context('spawn')
+            for count in (2, 3):
+                process = context.Process(target=_serveRequests, args=(directory, count))
+                process.start()
+                process.join()
+                self.assertEqual(process.exitcode, 0)
+
+            metrics.startRequest('/allByUser', 'GET')
+            metrics.finishRequest(200, 100)
+            text = metrics.renderMetrics()
+        finally:
+            metrics.shareAcrossProcesses(None)
+            shutil.rmtree(directory)
+
+        # The requests of every process, including the ones that exited, add up
+        self.assertIn('kasheesh_requests_total{endpoint="/allByUser",method="GET",status="200"} 6', text)
+        self.assertIn('kasheesh_query_rows_count{endpoint="/allByUser"} 5', text)
+        self.assertIn('kasheesh_response_bytes_bucket{endpoint="/allByUser",le="+Inf"} 6', text)
+
+    def test_disabled(self):
+        metrics.enabled = False
+        metrics.startRequest('/allByUser', 'GET')
+
+        self.assertIsNone(metrics.finishRequest(200))
+        self.assertNotIn('kasheesh_requests_total{', metrics.renderMetrics())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from Task1.queryProfiler import QueryProfiler
+from Task1.tests.fixtures import makeDatabase
+
+
+class TestQueryProfiler(unittest.TestCase):
+    def setUp(self):
+        self.conn = makeDatabase([
+            (user, 'PurchaseActivity', 5200, 1000 + user, '2023-06-01T10:00:00') for user in range(100)
+        ])
+
+        handle, self.log = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        self.profiler = QueryProfiler(self.log, slowMs=1000, progressSteps=10)
+
+    def tearDown(self):
+        self.conn.close()
+        os.remove(self.log)
+
+    def run_query(self, query, params=()):
+        with self.profiler.profile(self.conn, query, params) as record:
+            rows = self.conn.execute(query, params).fetchall()
+            record['rows'] = len(rows)
+        return rows
+
+    def entries(self):
+        with open(self.log) as file:
+            return [json.loads(line) for line in file]
+
+    def test_index_lookup_is_not_logged(self):
+        self.run_query("SELECT amount_cents FROM purchases WHERE user_id = ?", (5,))
+
+        self.assertEqual(self.entries(), [])
+        stats = self.profiler.stats()["SELECT amount_cents FROM purchases WHERE user_id = ?"]
+        self.assertEqual((stats['calls'], stats['rows']), (1, 1))
+
+    def test_full_scan_is_logged_with_plan(self):
+        self.run_query("SELECT * FROM purchases WHERE amount_cents > ?", (1050,))
+
+        entry, = self.entries()
+        self.assertEqual(entry['reasons'], ['full_scan'])
+        self.assertEqual(entry['rows'], 49)
+        # the statement as SQLite ran it, with the bound value
+        self.assertEqual(entry['sql'], "SELECT * FROM purchases WHERE amount_cents > 1050")
+        # with the indexes and statistics in place this is a skip-scan over idx_purchases_merchant_date
+        self.assertTrue(any('purchases' in detail for detail in entry['plan']))
+        self.assertGreater(entry['vm_steps'], 0)
+
+    def test_slow_query_is_logged(self):
+        self.profiler.slowMs = 0
+        self.run_query("SELECT amount_cents FROM purchases WHERE user_id = ?", (5,))
+
+        self.assertEqual(self.entries()[0]['reasons'], ['slow'])
+
+    def test_errors_are_logged_and_raised(self):
+        with self.assertRaises(sqlite3.OperationalError):
+            self.run_query("SELECT * FROM missing")
+
+        entry, = self.entries()
+        self.assertEqual(entry['reasons'], ['error'])
+        self.assertIn('missing', entry['error'])
+
+    def test_hooks_removed_after_statement(self):
+        self.run_query("SELECT count(*) FROM purchases")
+        # no progress handler left behind: a statement outside of the profiler does not count steps
+        self.conn.execute("SELECT * FROM purchases").fetchall()
+        self.assertEqual(self.profiler.stats()["SELECT count(*) FROM purchases"]['calls'], 1)
+
+    def test_statement_in_steps(self):
+        query = "SELECT amount_cents FROM purchases WHERE user_id < ?"
+        statement = self.profiler.start(self.conn, query, (50,))
+        with statement.step():
+            curs = self.conn.execute(query, (50,))
+
+        # Between steps nothing is timed or hooked: work done meanwhile is not counted
+        steps = statement._state.steps
+        time.sleep(0.05)
+        self.conn.execute("SELECT * FROM purchases").fetchall()
+        self.assertEqual(statement._state.steps, steps)
+
+        rows = 0
+        while True:
+            with statement.step():
+                batch = curs.fetchmany(10)
+            if not batch:
+                break
+            rows += len(batch)
+        statement.rows = rows
+        statement.finish()
+        statement.finish()
+
+        stats = self.profiler.stats()[query]
+        self.assertEqual((stats['calls'], stats['rows']), (1, 50))
+        self.assertLess(stats['total_ms'], 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,6 @@
+import json
 import unittest
+from unittest.mock import MagicMock, patch
 from flask import Flask, jsonify
 from Task1.routes import allByUser_bp, netMerchant_bp
 
@@ -54,6 +56,86 @@ class RoutesTestCase(unittest.TestCase):
         expected_response = jsonify({"error": "Invalid JSON payload: Extra fields found: extra_field"})
         self.assertEqual(response.get_json(), expected_response.get_json())  # Expected response body
 
+    def test_allByUserPost_with_pagination(self):
+        # Prepare a payload asking for a single page
+        payload = {
+            'user_id': 12345,
+            'limit': 10
+        }
+
+        # Send a POST request to the /allByUser endpoint
+        response = self.client.post('/allByUser', json=payload)
+
+        # Verify the response
+        self.assertEqual(response.status_code, 200)  # Expected status code
+        self.assertIn('next_cursor', json.loads(response.get_data(as_text=True)))
+
+    def test_allByUserPost_with_invalid_limit(self):
+        # Prepare a payload with a page size out of range
+        payload = {
+            'user_id': 12345,
+            'limit': 0
+        }
+
+        # Send a POST request to the /allByUser endpoint
+        response = self.client.post('/allByUser', json=payload)
+
+        # Verify the response
+        self.assertEqual(response.status_code, 400)  # Expected status code
+
+    def test_allByUserPost_with_stream(self):
+        # Prepare a payload asking for a streamed response
+        payload = {
+            'user_id': 12345,
+            'stream': True
+        }
+
+        # Send a POST request to the /allByUser endpoint
+        response = self.client.post('/allByUser', json=payload)
+
+        # Verify the response
+        self.assertEqual(response.status_code, 200)  # Expected status code
+        self.assertIsInstance(json.loads(response.get_data(as_text=True)), list)
+
+    def test_allByUserBatchPost_with_valid_payload(self):
+        # Prepare a valid payload
+        payload = {
+            'user_ids': [12345, 38493]
+        }
+
+        # Send a POST request to the /allByUser/batch endpoint
+        response = self.client.post('/allByUser/batch', json=payload)
+
+        # Verify the response, every requested user gets a key
+        self.assertEqual(response.status_code, 200)  # Expected status code
+        self.assertEqual(set(json.loads(response.get_data(as_text=True))), {'12345', '38493'})
+
+    def test_allByUserBatchPost_with_missing_user_ids(self):
+        # Prepare a payload with a missing 'user_ids' key
+        payload = {}
+
+        # Send a POST request to the /allByUser/batch endpoint
+        response = self.client.post('/allByUser/batch', json=payload)
+
+        # Verify the response
+        self.assertEqual(response.status_code, 400)  # Expected status code
+        expected_response = jsonify({"error": '"Invalid JSON payload: \'user_ids\' key is missing."'})
+        self.assertEqual(response.get_json(), expected_response.get_json())  # Expected response body
+
+    def test_allByUserBatchPost_with_invalid_user_ids(self):
+        # Prepare a payload whose IDs are not all integers
+        payload = {
+            'user_ids': [12345, '38493']
+        }
+
+        # Send a POST request to the /allByUser/batch endpoint
+        response = self.client.post('/allByUser/batch', json=payload)
+
+        # Verify the response
+        self.assertEqual(response.status_code, 400)  # Expected status code
+        expected_response = jsonify({"error": "Invalid JSON payload: 'user_ids' must only contain integers."})
+        self.assertEqual(response.get_json(), expected_response.get_json())  # Expected response body
+
     def test_netMerchant_with_valid_payload(self):
         # Prepare a valid payload
         payload = {
@@ -93,6 +175,171 @@ class RoutesTestCase(unittest.TestCase):
         expected_response = jsonify({"error": "Invalid JSON payload: Extra fields found: extra_field"})
         self.assertEqual(response.get_json(), expected_response.get_json())  # Expected response body
 
+    def test_netMerchantGet_with_valid_query(self):
+        # Send a GET request with the payload in the query string
+        response = self.client.get('/netMerchant?merchant_type_code=12345')
+
+        # Verify the response matches the POST equivalent
+        self.assertEqual(response.status_code, 200)  # Expected status code
+        post_response = self.client.post('/netMerchant', json={'merchant_type_code': 12345})
+        self.assertEqual(response.get_data(), post_response.get_data())
+
+    def test_allByUserGet_with_invalid_query(self):
+        # Send a GET request with a user ID that is not an integer
+        response = self.client.get('/allByUser?user_id=abc')
+
+        # Verify the response
+        self.assertEqual(response.status_code, 400)  # Expected status code
+        expected_response = jsonify({"error": "Invalid query parameter: 'user_id' must be an integer."})
+        self.assertEqual(response.get_json(), expected_response.get_json())  # Expected response body
+
+    def test_date_range(self):
+        response = self.client.get('/allByUser?user_id=12345&start=2023-06-01&end=2023-06-08T12:00:00')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post('/netMerchant', json={'merchant_type_code': 5200, 'start': '2023-06-01'})
+        self.assertEqual(response.status_code, 200)
+
+        # a bound equal to a stored datetime with a fraction, written with all six digits: the start keeps the row,
+        # the end leaves it out
+        stamp = '2023-03-25T12:35:49.0712'
+        response = self.client.get('/allByUser?user_id=333&start=2023-03-25T12:35:49.071200&end=2023-03-25T12:35:50')
+        self.assertEqual([row['datetime'] for row in json.loads(response.get_data())], [stamp])
+        response = self.client.get('/allByUser?user_id=333&start=2023-03-25T12:35:49&end=2023-03-25T12:35:49.071200')
+        self.assertEqual(json.loads(response.get_data()), [])
+
+    def test_invalid_date_range(self):
+        response = self.client.post('/allByUser', json={'user_id': 12345, 'start': '2023-06-08', 'end': '2023-06-01'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json(), {"error": "Invalid JSON payload: 'start' must be before 'end'."})
+
+        # the daily rollup only takes dates
+        response = self.client.get('/netMerchant?merchant_type_code=5200&end=2023-06-01T10:00:00')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json(), {"error": "Invalid JSON payload: 'end' must be a date (YYYY-MM-DD)."})
+
+    def test_netMerchantExport_matches_netMerchant(self):
+        response = self.client.get('/netMerchant/export')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+        # one record per merchant type and day, the same as one /netMerchant call per merchant type
+        merchant = records[0]['merchant_type_code']
+        expected = json.loads(self.client.post('/netMerchant', json={'merchant_type_code': merchant}).get_data())
+        self.assertEqual([(record['period'], record['net_amount_in_dollars']) for record in records
+                          if record['merchant_type_code'] == merchant],
+                         [(record['date'], record['net_amount_in_dollars']) for record in expected])
+
+    def test_netMerchantExport_csv_by_month(self):
+        response = self.client.get('/netMerchant/export?granularity=month&format=csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/csv')
+
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(lines[0], 'merchant_type_code,period,net_amount_in_dollars')
+        self.assertTrue(all(line.split(',')[1].endswith('-01') for line in lines[1:]))
+
+    def test_netMerchantExport_bounds_on_periods(self):
+        # A bound inside a month would export part of it labelled as the whole month
+        response = self.client.get('/netMerchant/export?granularity=month&start=2023-01-15')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json(), {"error": "Invalid JSON payload: 'start' must be the first day of a "
+                                                        "month for monthly periods."})
+
+        response = self.client.get('/netMerchant/export?granularity=week&end=2023-06-07')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/netMerchant/export?granularity=hour&start=2023-06-01T10:30:00')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get('/netMerchant/export?granularity=month&start=2023-04-01&end=2023-06-01')
+        self.assertEqual(response.status_code, 200)
+        periods = {json.loads(line)['period'] for line in response.get_data(as_text=True).splitlines()}
+        self.assertEqual(periods, {'2023-04-01', '2023-05-01'})
+        response = self.client.get('/netMerchant/export?granularity=week&start=2023-06-05&end=2023-06-12')
+        self.assertEqual(response.status_code, 200)
+
+    def test_netMerchantExport_with_invalid_granularity(self):
+        response = self.client.get('/netMerchant/export?granularity=year')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json(),
+                         {"error": "Invalid JSON payload: 'granularity' must be one of hour, day, week or month."})
+
+    def test_netMerchant_not_modified(self):
+        # The first response carries the ETag of the current data
+        response = self.client.get('/netMerchant?merchant_type_code=5732')
+        etag = response.headers.get('ETag')
+        self.assertIsNotNone(etag)
+
+        # Polling again with that ETag, through either method, gets an empty 304
+        response = self.client.get('/netMerchant?merchant_type_code=5732', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)  # Expected status code
+        self.assertEqual(response.get_data(), b'')
+
+        response = self.client.post('/netMerchant', json={'merchant_type_code': 5732},
+                                    headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)  # Expected status code
+
+        # A different request does not match the ETag
+        response = self.client.get('/netMerchant?merchant_type_code=5200', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)  # Expected status code
+
+    def test_failed_query_not_tagged(self):
+        # A failed lookup is an error, not an empty result tagged with the current generation
+        with patch('controller.executeQuery', return_value=None):
+            response = self.client.get('/netMerchant?merchant_type_code=5732&start=1999-01-01')
+
+        self.assertEqual(response.status_code, 500)  # Expected status code
+        self.assertIsNone(response.headers.get('ETag'))
+
+    def test_etag_follows_served_store(self):
+        url = '/netMerchant?merchant_type_code=5732&start=2023-06-01'
+        store = MagicMock(generation=1)
+        store.merchantNet.return_value = [('2023-06-01', 5000, 5732)]
+
+        with patch('controller.storageBackend', 'columnar'), patch('controller.getColumnarStore', return_value=store), \
+                patch('controller.resultCache.generation', side_effect=lambda: 1):
+            etag = self.client.get(url).headers.get('ETag')
+
+            # The store is rebuilt from newer data
+            store.generation = 2
+            store.merchantNet.return_value = [('2023-06-01', 7000, 5732)]
+            with patch('controller.resultCache.generation', side_effect=lambda: 2):
+                response = self.client.get(url, headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 200)  # Expected status code
+        self.assertNotEqual(response.headers.get('ETag'), etag)
+        self.assertEqual(json.loads(response.get_data())[0]['net_amount_in_dollars'], 70.0)
+
+    def test_stale_store_not_served(self):
+        # An ingest without rebuilding the columnar store, the database is ahead of it
+        store = MagicMock(generation=1)
+        store.merchantNet.return_value = [('2023-06-01', 5000, 5732)]
+
+        with patch('controller.storageBackend', 'columnar'), patch('controller.getColumnarStore', return_value=store), \
+                patch('controller.resultCache.generation', side_effect=lambda: 2):
+            response = self.client.get('/netMerchant?merchant_type_code=5732&start=1999-01-01')
+
+        self.assertEqual(response.status_code, 200)  # Expected status code
+        store.merchantNet.assert_not_called()
+
+    def test_server_timing_and_metrics(self):
+        response = self.client.post('/netMerchant', json={'merchant_type_code': 5732})
+
+        # The stages of the request are reported to the client
+        stages = [part.split(';')[0] for part in response.headers.get('Server-Timing').split(', ')]
+        self.assertIn('parse', stages)
+        self.assertIn('cache', stages)
+        self.assertEqual(stages[-1], 'app')
+
+        # and aggregated on /metrics
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)  # Expected status code
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        body = response.get_data(as_text=True)
+        self.assertIn('kasheesh_requests_total{endpoint="/netMerchant",method="POST",status="200"}', body)
+        self.assertIn('kasheesh_stage_duration_seconds_bucket{endpoint="/netMerchant",stage="parse",le="+Inf"}', body)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from flask import Flask
+
+from Task1.columnarStore import ColumnarStore
+from Task1.constants import Constants
+from Task1.server import ProductionServer, serverOptions
+from Task1.tests.fixtures import makeDatabase
+
+
+class TestProductionServer(unittest.TestCase):
+    def test_options(self):
+        options = serverOptions('0.0.0.0:8000', workers=3, threads=2)
+        server = ProductionServer(Flask(__name__), options)
+
+        self.assertEqual(server.cfg.bind, ['0.0.0.0:8000'])
+        self.assertEqual(server.cfg.workers, 3)
+        self.assertEqual(server.cfg.threads, 2)
+        self.assertEqual(server.cfg.worker_class_str, 'gthread')
+        self.assertTrue(server.cfg.preload_app)
+
+    def test_one_worker_per_core_by_default(self):
+        self.assertGreaterEqual(serverOptions(workers=0)['workers'], 1)
+
+    def test_serves_loaded_app(self):
+        app = Flask(__name__)
+        self.assertIs(ProductionServer(app, serverOptions()).load(), app)
+
+    def test_prepare_builds_columnar_store(self):
+        directory = tempfile.mkdtemp()
+        database = os.path.join(directory, 'test.db')
+        conn = makeDatabase([(1, 'PurchaseActivity', 5732, 2000, '2023-06-02T10:00:00')], database)
+
+        constants = MagicMock()
+        constants.dbName.value = database
+        constants.columnarDir.value = os.path.join(directory, 'columnar')
+        constants.getGeneration.value = Constants.getGeneration.value
+        server = ProductionServer(Flask(__name__), serverOptions(), backend='columnar')
+        try:
+            with patch('Task1.server.Constants', constants), patch('Task1.server.dbManager'):
+                server.prepareData()
+                store = ColumnarStore(constants.columnarDir.value)
+                self.assertEqual(store.userTransactions(1), [(1, 2000, '2023-06-02T10:00:00', 5732)])
+
+                # A store of the current generation is kept, one behind the database is rebuilt
+                server.prepareData()
+                self.assertEqual(ColumnarStore(constants.columnarDir.value).path, store.path)
+
+                conn.execute("INSERT INTO purchases VALUES (3, 'PurchaseActivity', 5310, 100, '2023-06-04T10:00:00')")
+                conn.execute(Constants.bumpGeneration.value)
+                conn.commit()
+                server.prepareData()
+                self.assertEqual(ColumnarStore(constants.columnarDir.value).userTransactions(3),
+                                 [(3, 100, '2023-06-04T10:00:00', 5310)])
+        finally:
+            conn.close()
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import multiprocessing
+import struct
+import threading
+import unittest
+from unittest.mock import patch
+
+from Task1.sharedSnapshot import SnapshotPublisher, SnapshotReader
+from Task1.tests.fixtures import makeDatabase
+
+_name = 'kasheesh_snapshot_test'
+
+
+def _readUser(name, userId, queue):
+    queue.put(SnapshotReader(name).tables().userTransactions(userId))
+
+
+class TestSharedSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.conn = makeDatabase([
+            (2, 'PurchaseActivity', 5200, 1000, '2023-06-01T10:00:00'),
+            (1, 'PurchaseActivity', 5732, 2000, '2023-06-02T10:00:00'),
+            (2, 'ReturnActivity', 5200, 500, '2023-06-02T12:00:00'),
+        ])
+
+        self.publisher = SnapshotPublisher(_name)
+
+    def tearDown(self):
+        self.publisher.close()
+        self.conn.close()
+
+    def test_nothing_published(self):
+        with self.assertRaises(FileNotFoundError):
+            SnapshotReader(_name).tables()
+
+    def test_lookups(self):
+        self.publisher.publish(self.conn)
+        tables = SnapshotReader(_name).tables()
+
+        self.assertEqual(tables.userTransactions(2), [
+            (2, 1000, '2023-06-01T10:00:00', 5200),
+            (2, 500, '2023-06-02T12:00:00', 5200),
+        ])
+        self.assertEqual(tables.merchantNet(5200), [('2023-06-01', 1000, 5200), ('2023-06-02', -500, 5200)])
+        self.assertEqual(tables.userTransactions(3), [])
+
+    def test_read_only(self):
+        self.publisher.publish(self.conn)
+        tables = SnapshotReader(_name).tables()
+
+        with self.assertRaises(ValueError):
+            tables.arrays['transactions_amount_cents'][0] = 0
+
+    def test_publish_swaps_snapshot(self):
+        self.publisher.publish(self.conn)
+        reader = SnapshotReader(_name)
+        before = reader.tables()
+        self.assertIs(reader.tables(), before)
+
+        self.conn.execute("INSERT INTO purchases VALUES (3, 'PurchaseActivity', 5310, 100, '2023-06-04T10:00:00')")
+        self.publisher.publish(self.conn)
+
+        # The reader moves to the new snapshot, the tables it handed out before keep working
+        self.assertEqual(reader.tables().userTransactions(3), [(3, 100, '2023-06-04T10:00:00', 5310)])
+        self.assertEqual(before.userTransactions(3), [])
+
+    def test_swap_in_progress_times_out(self):
+        self.publisher.publish(self.conn)
+        # A publisher stopped between the two counter updates of a swap
+        struct.pack_into('Q', self.publisher._control.buf, 0, self.publisher.sequence + 1)
+
+        with patch('Task1.sharedSnapshot._controlRetries', 5), self.assertRaises(TimeoutError):
+            SnapshotReader(_name).tables()
+
+    def test_threads_share_one_attachment(self):
+        self.publisher.publish(self.conn)
+        reader = SnapshotReader(_name)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(reader.tables())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(tables is results[0] for tables in results))
+
+    def test_other_process_attaches(self):
+        self.publisher.publish(self.conn)
+
+        context = multiprocessing.get_context('spawn')
+        queue = context.Queue()
+        process = context.Process(target=_readUser, args=(_name, 1, queue))
+        process.start()
+        result = queue.get(timeout=30)
+        process.join()
+
+        self.assertEqual(result, [(1, 2000, '2023-06-02T10:00:00', 5732)])
+        # the reader exiting does not unlink the publisher's segments
+        self.assertEqual(SnapshotReader(_name).tables().userTransactions(1), result)
+
+
+if __name__ == '__main__':
+    unittest.main()
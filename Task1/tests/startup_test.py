@@ -0,0 +1,37 @@
+import os
+import unittest
+
+from Task1.benchmarks.startupBenchmark import measureStartup
+from Task1.constants import Constants
+
+# A first request of each endpoint, served by the fresh interpreter after importing main
+_urls = ['/allByUser?user_id=38493', '/netMerchant?merchant_type_code=5732']
+
+
+@unittest.skipUnless(os.path.exists('/proc/self/status'), "the memory budget is on the current resident memory, read from /proc")
+class TestStartupBudget(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # the same measurement as benchmarks/startupBenchmark.py
+        cls.runs = [measureStartup(_urls) for _ in range(3)]
+
+    def test_first_requests_served(self):
+        for run in self.runs:
+            self.assertEqual(run['statuses'], [200, 200])
+
+    def test_heavy_modules_stay_lazy(self):
+        for run in self.runs:
+            self.assertEqual(run['modules'], [])
+
+    def test_import_time_budget(self):
+        # the fastest run, the others mostly measure noise from the rest of the machine
+        fastest = min(run['import_seconds'] for run in self.runs)
+        self.assertLess(fastest, Constants.startupImportBudgetSeconds.value)
+
+    def test_memory_budget(self):
+        smallest = min(run['rss_bytes'] for run in self.runs) / 2 ** 20
+        self.assertLess(smallest, Constants.startupRssBudgetMB.value)
+
+
+if __name__ == '__main__':
+    unittest.main()
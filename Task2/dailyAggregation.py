@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+
+def dailyTotalsFromCsv(csvPath: str, includeReturns: bool, chunkRows: int = 100000) -> pd.DataFrame:
+    """
+    Streams the transactions CSV in chunks and sums the daily amounts per merchant type, so memory is bounded by the
+    number of (day, merchant_type_code) cells instead of the number of rows. The result is the same frame the
+    in-memory cleanData builds before splitting it into training and testing sets.
+
+    Args:
+        csvPath (str): Path of the combined transactions CSV.
+        includeReturns (bool): Subtract returns from the purchases (mainV3) instead of leaving them out (mainV2).
+        chunkRows (int): Rows read per chunk.
+
+    Returns:
+        pd.DataFrame: 'merchant_type_code' and 'amount_dollars' columns indexed by 'datetime' (the day), ordered by
+        day and merchant type code.
+    """
+    totals = None
+    columns = ['transaction_type', 'merchant_type_code', 'amount_cents', 'datetime']
+    for chunk in pd.read_csv(csvPath, usecols=columns, chunksize=chunkRows):
+        isPurchase = (chunk['transaction_type'] == 'PurchaseActivity').to_numpy()
+        isReturn = (chunk['transaction_type'] == 'ReturnActivity').to_numpy()
+        keep = isPurchase | isReturn if includeReturns else isPurchase
+
+        # Signed cents in one pass: purchases count positive, returns negative. Summing whole cents keeps the
+        # totals exact however the rows are split into chunks.
+        cents = chunk['amount_cents'].to_numpy()
+        signed = np.where(isReturn, -cents, cents)[keep]
+        days = pd.to_datetime(chunk['datetime'][keep]).dt.normalize()
+
+        partial = pd.Series(signed, index=[days.to_numpy(), chunk['merchant_type_code'].to_numpy()[keep]])
+        partial = partial.groupby(level=[0, 1]).sum()
+        totals = partial if totals is None else totals.add(partial, fill_value=0)
+
+    if totals is None:
+        return pd.DataFrame({'merchant_type_code': [], 'amount_dollars': []},
+                            index=pd.Index([], name='datetime'))
+
+    totals = totals.sort_index()
+    daily = pd.DataFrame({'merchant_type_code': totals.index.get_level_values(1).astype('int64'),
+                          'amount_dollars': totals.to_numpy() / 100},
+                         index=pd.Index(totals.index.get_level_values(0).date, name='datetime'))
+    return daily
@@ -0,0 +1,243 @@
+"""
+Batch forecasting for every merchant_type_code instead of the single hard-coded 5732 of mainV2/mainV3.
+
+The daily sums cleanData works from (dailyAggregation.dailyTotalsFromCsv) are split into one series per merchant
+code. Every series gets its own ARIMA model, fitted in a pool of worker processes: the last test-days are held out
+to compute the MAE, then the next horizon days are forecast. Merchants are sent to the workers in chunks, to keep
+the scheduling overhead low compared to the fits. Each fit runs under a timeout and its own error handling, so one
+bad series never takes the others down. Every merchant ends up in a single output table with its forecasts, its MAE
+and how its fit went.
+
+    python forecastAll.py combined_transactions.csv --output forecasts.csv [--returns] [--workers 4]
+    python forecastAll.py combined_transactions.csv --scaling      (fits per second with 1, 2, 4, ... cores)
+"""
+import argparse
+import os
+import signal
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+import pandas as pd
+from sklearn.metrics import mean_absolute_error
+from statsmodels.tsa.arima.model import ARIMA
+
+from dailyAggregation import dailyTotalsFromCsv
+
+
+class FitTimeout(Exception):
+    """
+    Raised inside a worker when a fit runs past its timeout.
+    """
+
+
+def _onAlarm(signum, frame):
+    raise FitTimeout()
+
+
+def merchantSeries(daily: pd.DataFrame) -> dict:
+    """
+    Splits the daily sums into one series per merchant code.
+
+    Args:
+        daily (pd.DataFrame): 'merchant_type_code' and 'amount_dollars' indexed by day, as dailyTotalsFromCsv returns.
+
+    Returns:
+        dict: merchant_type_code -> pd.Series of the daily amounts in dollars, ordered by day.
+    """
+    return {int(code): group['amount_dollars'] for code, group in daily.groupby('merchant_type_code', sort=True)}
+
+
+def fitMerchant(code: int, series: pd.Series, testDays: int, horizon: int, order: tuple, minTrainDays: int,
+                timeoutSeconds: float) -> dict:
+    """
+    Fits and evaluates the ARIMA model of one merchant code. Never raises: failures are reported in the result.
+
+    Args:
+        code (int): The merchant code.
+        series (pd.Series): Its daily amounts in dollars, ordered by day.
+        testDays (int): Last days held out to compute the MAE.
+        horizon (int): Days forecast after the last day of the series.
+        order (tuple): The (p, d, q) order of the model.
+        minTrainDays (int): Merchants with fewer training days are skipped.
+        timeoutSeconds (float): Longest time the fits may take, 0 for no limit.
+
+    Returns:
+        dict: 'merchant_type_code', 'status' ('ok', 'skipped', 'timeout' or 'error'), 'days', 'mae', 'forecast'
+        (list of (date, amount_dollars)), 'fit_seconds' and 'error'.
+    """
+    result = {'merchant_type_code': code, 'status': 'ok', 'days': len(series), 'mae': None, 'forecast': [],
+              'fit_seconds': 0.0, 'error': None}
+    if len(series) - testDays < minTrainDays:
+        result.update(status='skipped', error=f"only {len(series)} days of data")
+        return result
+
+    # the alarm only exists on Unix, elsewhere fits run without a timeout
+    useAlarm = timeoutSeconds > 0 and hasattr(signal, 'setitimer')
+    if useAlarm:
+        signal.signal(signal.SIGALRM, _onAlarm)
+        signal.setitimer(signal.ITIMER_REAL, timeoutSeconds)
+
+    start = time.perf_counter()
+    try:
+        try:
+            values = series.reset_index(drop=True)
+            train, test = values[:-testDays], values[-testDays:]
+
+            warnings.filterwarnings("ignore")
+            # held out days for the MAE
+            predictions = ARIMA(train, order=order).fit().forecast(steps=testDays)
+            result['mae'] = mean_absolute_error(test, predictions)
+
+            # then the forecast from the whole series
+            forecast = ARIMA(values, order=order).fit().forecast(steps=horizon)
+            lastDay = series.index[-1]
+            result['forecast'] = [(lastDay + timedelta(days=step + 1), float(amount))
+                                  for step, amount in enumerate(forecast)]
+        finally:
+            # cancelled inside the outer try: an alarm going off right before is still handled below
+            if useAlarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    except Exception as e:
+        # the alarm can go off inside library code that re-raises it as something else
+        if isinstance(e, FitTimeout) or useAlarm and time.perf_counter() - start >= timeoutSeconds:
+            result.update(status='timeout', error=f"fit took longer than {timeoutSeconds}s")
+        else:
+            result.update(status='error', error=str(e))
+    finally:
+        warnings.resetwarnings()
+    result['fit_seconds'] = time.perf_counter() - start
+
+    return result
+
+
+def _failedResult(code: int, days: int, error: str) -> dict:
+    # result of a merchant whose fit never reported back
+    return {'merchant_type_code': code, 'status': 'error', 'days': days, 'mae': None, 'forecast': [],
+            'fit_seconds': 0.0, 'error': error}
+
+
+def _fitChunk(tasks: list, options: dict) -> list:
+    # runs in a worker process, one chunk of (code, series) tasks at a time
+    return [fitMerchant(code, series, **options) for code, series in tasks]
+
+
+def forecastAll(series: dict, workers: int, chunkSize: int = 4, **options) -> list:
+    """
+    Fits the models of all merchant codes across a pool of worker processes.
+
+    A worker process dying (e.g. killed for its memory) breaks the whole pool and every task still in it. Those
+    merchants are retried one by one, each in a pool of its own, so only the one that kills its worker again is
+    reported as an error. Any other exception a task raises is reported as an error of the merchants of its chunk,
+    the results of the other chunks are kept.
+
+    Args:
+        series (dict): merchant_type_code -> daily series, as merchantSeries returns.
+        workers (int): Number of worker processes.
+        chunkSize (int): Merchants sent to a worker per task.
+        **options: testDays, horizon, order, minTrainDays and timeoutSeconds of fitMerchant.
+
+    Returns:
+        list: The fitMerchant results, ordered by merchant code.
+    """
+    tasks = list(series.items())
+    results = []
+    broken = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_fitChunk, tasks[i:i + chunkSize], options): tasks[i:i + chunkSize]
+                   for i in range(0, len(tasks), chunkSize)}
+        for future in as_completed(futures):
+            try:
+                results.extend(future.result())
+            except BrokenProcessPool:
+                broken.extend(futures[future])
+            except Exception as e:
+                # anything escaping fitMerchant's own handling only fails the merchants of that chunk
+                results.extend(_failedResult(code, len(values), str(e) or type(e).__name__)
+                               for code, values in futures[future])
+
+    for code, values in broken:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            try:
+                results.extend(executor.submit(_fitChunk, [(code, values)], options).result())
+            except BrokenProcessPool:
+                results.append(_failedResult(code, len(values), "worker process died"))
+            except Exception as e:
+                results.append(_failedResult(code, len(values), str(e) or type(e).__name__))
+
+    return sorted(results, key=lambda result: result['merchant_type_code'])
+
+
+def resultsTable(results: list) -> pd.DataFrame:
+    """
+    Flattens the results into one table: a row per merchant code and forecast day, or a single row without a
+    forecast for merchants that were skipped or failed.
+
+    Args:
+        results (list): The fitMerchant results.
+
+    Returns:
+        pd.DataFrame: merchant_type_code, date, forecast_dollars, mae, status, days, fit_seconds and error columns.
+    """
+    rows = []
+    for result in results:
+        common = {'mae': result['mae'], 'status': result['status'], 'days': result['days'],
+                  'fit_seconds': round(result['fit_seconds'], 4), 'error': result['error']}
+        for day, amount in result['forecast'] or [(None, None)]:
+            rows.append({'merchant_type_code': result['merchant_type_code'], 'date': day, 'forecast_dollars': amount,
+                         **common})
+
+    return pd.DataFrame(rows, columns=['merchant_type_code', 'date', 'forecast_dollars', 'mae', 'status', 'days',
+                                       'fit_seconds', 'error'])
+
+
+def _timedRun(series: dict, workers: int, chunkSize: int, options: dict) -> tuple:
+    start = time.perf_counter()
+    results = forecastAll(series, workers, chunkSize, **options)
+    seconds = time.perf_counter() - start
+    fits = sum(result['status'] == 'ok' for result in results)
+    return results, fits / seconds if seconds else 0.0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('csv', nargs='?', default="combined_transactions.csv")
+    parser.add_argument('--output', default="forecasts.csv")
+    parser.add_argument('--returns', action='store_true',
+                        help="forecast net daily earnings (returns subtracted, like mainV3) instead of purchases")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=4, help="merchants per task sent to a worker")
+    parser.add_argument('--test-days', type=int, default=13)
+    parser.add_argument('--horizon', type=int, default=10)
+    parser.add_argument('--order', type=int, nargs=3, default=[0, 0, 2], metavar=('P', 'D', 'Q'))
+    parser.add_argument('--min-train-days', type=int, default=10)
+    parser.add_argument('--timeout', type=float, default=60, help="seconds per merchant, 0 for no limit")
+    parser.add_argument('--scaling', action='store_true', help="report fits per second for 1, 2, 4, ... workers")
+    args = parser.parse_args()
+
+    series = merchantSeries(dailyTotalsFromCsv(args.csv, includeReturns=args.returns))
+    options = {'testDays': args.test_days, 'horizon': args.horizon, 'order': tuple(args.order),
+               'minTrainDays': args.min_train_days, 'timeoutSeconds': args.timeout}
+
+    if args.scaling:
+        counts = sorted({1 << i for i in range(os.cpu_count().bit_length()) if 1 << i <= os.cpu_count()} |
+                        {os.cpu_count()})
+        baseline = None
+        print(f"{'workers':>8}{'fits/s':>10}{'speedup':>10}")
+        for workers in counts:
+            results, rate = _timedRun(series, workers, args.chunk_size, options)
+            baseline = baseline or rate
+            print(f"{workers:>8}{rate:>10.2f}{rate / baseline if baseline else 0:>9.2f}x")
+    else:
+        workers = args.workers
+        results, rate = _timedRun(series, workers, args.chunk_size, options)
+
+    table = resultsTable(results)
+    table.to_csv(args.output, index=False)
+
+    statuses = pd.Series([result['status'] for result in results]).value_counts().to_dict()
+    print(f"{len(results)} merchant codes: {statuses}, {rate:.2f} fits/s with {workers} workers")
+    print(f"Median MAE: {table.drop_duplicates('merchant_type_code')['mae'].median():.2f}, written to {args.output}")
@@ -5,31 +5,39 @@ from sklearn.metrics import mean_absolute_error
 from statsmodels.tsa.arima.model import ARIMA
 import warnings
 
+from dailyAggregation import dailyTotalsFromCsv
 
-def cleanData(data: pd.DataFrame) -> [pd.DataFrame]:
+
+def cleanData(data, chunkRows: int = 100000) -> [pd.DataFrame]:
     """
     Cleans the input data by converting 'datetime' column to date format,
     changing cents into dollars, grouping by 'datetime' and 'merchant_type_code',
     and splitting the data into training and testing sets.
 
     Args:
-        data (pd.DataFrame): Input DataFrame containing transaction data.
+        data (pd.DataFrame | str): Input DataFrame containing transaction data, or the path of the CSV to stream in
+            chunks (see dailyAggregation.dailyTotalsFromCsv) so the whole file never has to fit in memory.
+        chunkRows (int): Rows read per chunk when streaming the CSV.
 
     Returns:
         Tuple[pd.DataFrame, pd.DataFrame]: A tuple containing the testing set and training set.
     """
-    # Convert 'datetime' column to date if not already
-    if not isinstance(data['datetime'].dtype, pd.core.dtypes.dtypes.DatetimeTZDtype):
-        data['datetime'] = pd.to_datetime(data['datetime']).dt.date
-
-    # Change cents into dollars for purchases
-    purchases = data.copy()
-    purchases.loc[:, 'amount_dollars'] = purchases['amount_cents'] / 100
-    purchases = purchases[purchases['transaction_type'] == 'PurchaseActivity']
-
-    # Group by 'datetime' and 'merchant_type_code' and sum the 'amount_dollars'
-    daily_purchases = purchases.groupby(['datetime', 'merchant_type_code'], as_index=False)['amount_dollars'].sum()
-    daily_purchases = daily_purchases.reset_index(drop=True).set_index('datetime')
+    if isinstance(data, str):
+        # Same daily sums per merchant, aggregated chunk by chunk
+        daily_purchases = dailyTotalsFromCsv(data, includeReturns=False, chunkRows=chunkRows)
+    else:
+        # Convert 'datetime' column to date if not already
+        if not isinstance(data['datetime'].dtype, pd.core.dtypes.dtypes.DatetimeTZDtype):
+            data['datetime'] = pd.to_datetime(data['datetime']).dt.date
+
+        # Change cents into dollars for purchases
+        purchases = data.copy()
+        purchases.loc[:, 'amount_dollars'] = purchases['amount_cents'] / 100
+        purchases = purchases[purchases['transaction_type'] == 'PurchaseActivity']
+
+        # Group by 'datetime' and 'merchant_type_code' and sum the 'amount_dollars'
+        daily_purchases = purchases.groupby(['datetime', 'merchant_type_code'], as_index=False)['amount_dollars'].sum()
+        daily_purchases = daily_purchases.reset_index(drop=True).set_index('datetime')
 
     # Get the training and testing sets
     test = daily_purchases[daily_purchases['merchant_type_code'] == 5732]
@@ -40,10 +48,8 @@ def cleanData(data: pd.DataFrame) -> [pd.DataFrame]:
 
 
 if __name__ == '__main__':
-    # Read the dataset
-    df = pd.read_csv("combined_transactions.csv")
-
-    test_set, train_set = cleanData(df)
+    # Stream the dataset, only the daily sums per merchant are kept in memory
+    test_set, train_set = cleanData("combined_transactions.csv")
     print(test_set.shape, train_set.shape)
 
     # merge them to fit them in the model (wishing I could upload two datasets instead of a concatenated one)
@@ -5,40 +5,49 @@ from sklearn.metrics import mean_absolute_error
 from statsmodels.tsa.arima.model import ARIMA
 import warnings
 
+from dailyAggregation import dailyTotalsFromCsv
 
-def cleanData(data: pd.DataFrame) -> [pd.DataFrame]:
+
+def cleanData(data, chunkRows: int = 100000) -> [pd.DataFrame]:
     """
     Cleans the input data by converting 'datetime' column to date format,
     subtracting returned items from the total count, converting amounts from cents to dollars,
     grouping by 'datetime' and 'merchant_type_code', and splitting the data into training and testing sets.
 
     Args:
-        data (pd.DataFrame): Input DataFrame containing transaction data.
+        data (pd.DataFrame | str): Input DataFrame containing transaction data, or the path of the CSV to stream in
+            chunks (see dailyAggregation.dailyTotalsFromCsv) so the whole file never has to fit in memory.
+        chunkRows (int): Rows read per chunk when streaming the CSV.
 
     Returns:
         Tuple[pd.DataFrame, pd.DataFrame]: A tuple containing the testing set and training set.
     """
-    # Convert 'datetime' column to date if not already
-    if not isinstance(df['datetime'].dtype, pd.core.dtypes.dtypes.DatetimeTZDtype):
-        df['datetime'] = pd.to_datetime(df['datetime']).dt.date
+    if isinstance(data, str):
+        # Same daily net sums per merchant, with signed cents aggregated chunk by chunk
+        daily_purchases = dailyTotalsFromCsv(data, includeReturns=True, chunkRows=chunkRows)
+    else:
+        # Convert 'datetime' column to date if not already
+        if not isinstance(data['datetime'].dtype, pd.core.dtypes.dtypes.DatetimeTZDtype):
+            data['datetime'] = pd.to_datetime(data['datetime']).dt.date
 
-    # Separate the purchases and returns into separate DataFrames
-    purchases = df[df['transaction_type'] == 'PurchaseActivity']
-    returns = df[df['transaction_type'] == 'ReturnActivity']
+        # Separate the purchases and returns into separate DataFrames
+        purchases = data[data['transaction_type'] == 'PurchaseActivity']
+        returns = data[data['transaction_type'] == 'ReturnActivity']
 
-    # Change cents into dollars for purchases
-    purchases = purchases.copy()
-    purchases.loc[:, 'amount_dollars'] = purchases['amount_cents'] / 100
+        # Change cents into dollars for purchases
+        purchases = purchases.copy()
+        purchases.loc[:, 'amount_dollars'] = purchases['amount_cents'] / 100
 
-    # Change cents into dollars and make returns negative
-    returns = returns.copy()
-    returns.loc[:, 'amount_dollars'] = -returns['amount_cents'] / 100
+        # Change cents into dollars and make returns negative
+        returns = returns.copy()
+        returns.loc[:, 'amount_dollars'] = -returns['amount_cents'] / 100
 
-    concat_purchases_returns = pd.concat([purchases, returns])
+        concat_purchases_returns = pd.concat([purchases, returns])
 
-    # Group by 'datetime' and 'merchant_type_code' and sum the 'amount_dollars'
-    daily_purchases = concat_purchases_returns.groupby(['datetime', 'merchant_type_code'], as_index=False)['amount_dollars'].sum()
-    daily_purchases = daily_purchases.reset_index(drop=True).set_index('datetime')
+        # Group by 'datetime' and 'merchant_type_code' and sum the 'amount_dollars'
+        daily_purchases = concat_purchases_returns.groupby(['datetime', 'merchant_type_code'],
+                                                           as_index=False)['amount_dollars'].sum()
+        daily_purchases = daily_purchases.reset_index(drop=True).set_index('datetime')
 
     # Get the training and testing sets
     test = daily_purchases[daily_purchases['merchant_type_code'] == 5732]
@@ -47,10 +56,8 @@ def cleanData(data: pd.DataFrame) -> [pd.DataFrame]:
 
 
 if __name__ == '__main__':
-    # Read the dataset
-    df = pd.read_csv("combined_transactions.csv")
-
-    test_set, train_set = cleanData(df)
+    # Stream the dataset, only the daily sums per merchant are kept in memory
+    test_set, train_set = cleanData("combined_transactions.csv")
 
     # merge them to fit them in the model (wishing I could upload two datasets instead of a concatenated one)
     model_set = pd.concat([train_set, test_set], axis=0)
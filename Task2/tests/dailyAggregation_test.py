@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from Task2 import mainV2, mainV3
+from Task2.dailyAggregation import dailyTotalsFromCsv
+
+# Several rows per day and merchant, so chunks of 2 and 3 rows end in the middle of a day
+_rows = [
+    (1, 'PurchaseActivity', 5732, 1050, '2023-06-01T08:00:00'),
+    (2, 'PurchaseActivity', 5732, 2000, '2023-06-01T09:30:00'),
+    (3, 'ReturnActivity', 5732, 500, '2023-06-01T23:59:59'),
+    (1, 'PurchaseActivity', 5200, 333, '2023-06-01T12:00:00'),
+    (4, 'TransferActivity', 5200, 9999, '2023-06-01T13:00:00'),
+    (2, 'PurchaseActivity', 5200, 1, '2023-06-02T00:00:00'),
+    (5, 'PurchaseActivity', 5732, 700, '2023-06-02T10:00:00'),
+    (5, 'ReturnActivity', 5200, 200, '2023-06-02T11:00:00'),
+    (6, 'PurchaseActivity', 5732, 1234, '2023-06-02T22:00:00'),
+    (6, 'ReturnActivity', 5310, 100, '2023-06-03T07:00:00'),
+    (7, 'PurchaseActivity', 5732, 99, '2023-06-03T08:00:00'),
+]
+
+
+class TestDailyAggregation(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.csv')
+        os.close(handle)
+        self.frame = pd.DataFrame(_rows, columns=['user_id', 'transaction_type', 'merchant_type_code', 'amount_cents',
+                                                  'datetime'])
+        self.frame.to_csv(self.path, index=False)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def assertSameSplit(self, cleanData, chunkRows):
+        # cleanData converts the datetimes of the frame it is given
+        expected = cleanData(self.frame.copy())
+        streamed = cleanData(self.path, chunkRows=chunkRows)
+
+        for expectedPart, streamedPart in zip(expected, streamed):
+            pd.testing.assert_frame_equal(streamedPart, expectedPart)
+
+    def test_purchases_match_in_memory_path(self):
+        for chunkRows in (1, 2, 3, len(_rows)):
+            with self.subTest(chunkRows=chunkRows):
+                self.assertSameSplit(mainV2.cleanData, chunkRows)
+
+    def test_net_amounts_match_in_memory_path(self):
+        for chunkRows in (1, 2, 3, len(_rows)):
+            with self.subTest(chunkRows=chunkRows):
+                self.assertSameSplit(mainV3.cleanData, chunkRows)
+
+    def test_totals(self):
+        daily = dailyTotalsFromCsv(self.path, includeReturns=True, chunkRows=2)
+
+        self.assertEqual(daily[daily['merchant_type_code'] == 5732]['amount_dollars'].tolist(), [25.5, 19.34, 0.99])
+        self.assertEqual(daily[daily['merchant_type_code'] == 5310]['amount_dollars'].tolist(), [-1.0])
+
+    def test_empty_file(self):
+        with open(self.path, 'w') as file:
+            file.write("user_id,transaction_type,merchant_type_code,amount_cents,datetime\n")
+
+        self.assertTrue(dailyTotalsFromCsv(self.path, includeReturns=False).empty)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import signal
+import unittest
+from datetime import date, timedelta
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from Task2.forecastAll import FitTimeout, _fitChunk, fitMerchant, forecastAll, resultsTable
+
+_options = {'testDays': 5, 'horizon': 3, 'order': (0, 0, 2), 'minTrainDays': 10, 'timeoutSeconds': 60}
+
+
+def _series(days: int, seed: int = 0) -> pd.Series:
+    amounts = 100 + np.random.default_rng(seed).normal(0, 10, days)
+    return pd.Series(amounts, index=[date(2023, 6, 1) + timedelta(days=day) for day in range(days)])
+
+
+def _failingChunk(tasks, options):
+    # an alarm going off outside fitMerchant's error handling, in the worker running merchant 9999
+    if any(code == 9999 for code, _ in tasks):
+        raise FitTimeout()
+    return _fitChunk(tasks, options)
+
+
+class TestForecastAll(unittest.TestCase):
+    def test_statuses(self):
+        series = {5200: _series(40), 5310: _series(8), 5732: pd.Series(['not a number'] * 40)}
+
+        results = forecastAll(series, workers=2, chunkSize=1, **_options)
+
+        self.assertEqual([result['merchant_type_code'] for result in results], [5200, 5310, 5732])
+        self.assertEqual([result['status'] for result in results], ['ok', 'skipped', 'error'])
+        self.assertEqual(len(results[0]['forecast']), 3)
+        self.assertEqual(results[0]['forecast'][0][0], date(2023, 7, 11))
+
+        # one row per forecast day, a single row for the others
+        self.assertEqual(resultsTable(results)['merchant_type_code'].tolist(), [5200, 5200, 5200, 5310, 5732])
+
+    def test_failed_chunk_keeps_other_results(self):
+        series = {5200: _series(40, 1), 5732: _series(40, 2), 9999: _series(40, 3)}
+
+        with patch('Task2.forecastAll._fitChunk', _failingChunk):
+            results = forecastAll(series, workers=2, chunkSize=1, **_options)
+
+        self.assertEqual([result['status'] for result in results], ['ok', 'ok', 'error'])
+        self.assertEqual(results[2]['error'], 'FitTimeout')
+        self.assertEqual(results[2]['days'], 40)
+
+    def test_timeout(self):
+        previous = signal.getsignal(signal.SIGALRM)
+        try:
+            # timeouts short enough for the alarm to go off anywhere, including right as the fit ends
+            for timeoutSeconds in np.linspace(0.0001, 0.02, 20):
+                result = fitMerchant(1, _series(40), **dict(_options, timeoutSeconds=timeoutSeconds))
+
+                self.assertIn(result['status'], ('ok', 'timeout'))
+                self.assertEqual(signal.getitimer(signal.ITIMER_REAL), (0.0, 0.0))
+
+            result = fitMerchant(1, _series(40), **dict(_options, timeoutSeconds=0.0001))
+            self.assertEqual(result['status'], 'timeout')
+            self.assertEqual(result['forecast'], [])
+        finally:
+            signal.signal(signal.SIGALRM, previous)
+
+
+if __name__ == '__main__':
+    unittest.main()